@@ -0,0 +1,89 @@
+from datetime import datetime
+import time
+
+
+class AnswerCheckpoint:
+    """
+    Rolling buffer of the questions a scraper has answered but not yet put
+    in a version, saved to db.answer_checkpoints every so many questions or
+    seconds. A crash then only loses the answers since the last save, and
+    the next run picks the saved ones back up instead of answering them
+    again, which the site wouldn't allow anyway.
+
+    Checkpoints look like
+        {_id: '<scraper>/<task>', scraper, task, questions, saved}
+    where task names what was being answered, e.g. 'answer_all'.
+
+    Attributes:
+        db (pymongo.database.Database): okc database
+        name (str): alias of the scraper answering
+        task (str): what is being answered
+        every (int): save after this many new answers
+        seconds (float): save once the oldest unsaved answer is this old
+        saved (list): question data dicts already in the checkpoint
+        buffer (list): question data dicts answered since the last save
+    """
+
+    def __init__(self, db, name, task, every=25, seconds=60):
+        """
+        Constructor for the AnswerCheckpoint class. Loads whatever an earlier
+        run left in the checkpoint.
+
+        Parameters:
+            db (pymongo.database.Database): okc database
+            name (str): alias of the scraper answering
+            task (str): what is being answered
+            every (int): save after this many new answers
+            seconds (float): save once the oldest unsaved answer is this old
+        """
+        self.db = db
+        self.name = name
+        self.task = task
+        self.every = every
+        self.seconds = seconds
+        doc = self.db.answer_checkpoints.find_one({'_id': self._id}, {'questions': 1})
+        self.saved = doc['questions'] if doc else []
+        self.buffer = []
+        self._since = None
+
+    @property
+    def _id(self):
+        return f'{self.name}/{self.task}'
+
+    @property
+    def questions(self):
+        """Every answer in the checkpoint, saved or not, oldest first."""
+        return self.saved + self.buffer
+
+    def __len__(self):
+        return len(self.saved) + len(self.buffer)
+
+    def add(self, question_data):
+        """Buffers an answered question, saving the buffer if it's due."""
+        if not self.buffer:
+            self._since = time.monotonic()
+        self.buffer.append(question_data)
+        if len(self.buffer) >= self.every or time.monotonic() - self._since >= self.seconds:
+            self.save()
+
+    def save(self):
+        """Appends the buffered answers to the checkpoint document."""
+        if not self.buffer:
+            return
+        self.db.answer_checkpoints.update_one({'_id': self._id}, {
+            '$push': {'questions': {'$each': self.buffer}},
+            '$set': {'scraper': self.name, 'task': self.task, 'saved': datetime.utcnow()}
+        }, upsert=True)
+        self.saved.extend(self.buffer)
+        self.buffer = []
+
+    def clear(self):
+        """Drops the checkpoint, once its answers are safely in a version."""
+        self.db.answer_checkpoints.delete_one({'_id': self._id})
+        self.saved = []
+        self.buffer = []
+
+
+def pending_tasks(db, name):
+    """Returns the tasks the scraper has checkpointed answers for."""
+    return [doc['task'] for doc in db.answer_checkpoints.find({'scraper': name}, {'task': 1})]
@@ -0,0 +1,223 @@
+from pymongo import MongoClient, ASCENDING, DeleteMany, ReplaceOne
+from parse_profiles import parse_question_list
+from html_store import HtmlStore
+from mongo_writer import BulkWriter
+import numpy as np
+import argparse, hashlib, time
+
+
+def _entry_id(username, q_text):
+    return f'{username}/{hashlib.sha1(q_text.encode()).hexdigest()[:16]}'
+
+
+def _members(bitmap, ids):
+    """Returns the labels in ids whose bits are set in bitmap."""
+    out = []
+    while bitmap:
+        low = bitmap & -bitmap
+        out.append(ids[low.bit_length() - 1])
+        bitmap ^= low
+    return out
+
+
+class AnswerIndex:
+    """
+    Inverted index from question to the users who answered it, with their
+    answer and whether it was under AGREE or DISAGREE.
+
+    Entries live in db.answer_index as
+        {_id: '<username>/<question hash>', user, q, answer, agree}
+    indexed on (q, answer) and user. Queries load what they touch into an
+    in-memory cache of bitmaps, Python ints with one bit per user or per
+    question, so repeated queries are set operations instead of round trips.
+    Updates made through this object keep the cache current; call refresh to
+    see ones made elsewhere.
+
+    Attributes:
+        db (pymongo.database.Database): okc database
+        writer (BulkWriter): if set, index updates are queued on it
+    """
+
+    def __init__(self, db, writer=None):
+        """
+        Constructor for the AnswerIndex class
+
+        Parameters:
+            db (pymongo.database.Database): okc database
+            writer (BulkWriter): optional write-behind buffer for updates
+        """
+        self.db = db
+        self.writer = writer
+        self.db.answer_index.create_index([('q', ASCENDING), ('answer', ASCENDING)])
+        self.db.answer_index.create_index([('user', ASCENDING)])
+        self.refresh()
+
+    def refresh(self):
+        """Drops the cache, so the next queries read the current index."""
+        self._user_ids, self._users = dict(), []
+        self._question_ids, self._questions = dict(), []
+        #q_text -> {'all': bitmap, 'agree': bitmap, 'answers': {answer: bitmap}}
+        self._by_question = dict()
+        #username -> bitmap of question ids
+        self._by_user = dict()
+
+    def _user_bit(self, username):
+        if username not in self._user_ids:
+            self._user_ids[username] = len(self._users)
+            self._users.append(username)
+        return 1 << self._user_ids[username]
+
+    def _question_bit(self, q_text):
+        if q_text not in self._question_ids:
+            self._question_ids[q_text] = len(self._questions)
+            self._questions.append(q_text)
+        return 1 << self._question_ids[q_text]
+
+    def _flush(self):
+        if self.writer is not None:
+            self.writer.flush()
+
+    def _question(self, q_text):
+        cached = self._by_question.get(q_text)
+        if cached is None:
+            self._flush()
+            cached = {'all': 0, 'agree': 0, 'answers': dict()}
+            for e in self.db.answer_index.find({'q': q_text}, {'user': 1, 'answer': 1, 'agree': 1}):
+                self._cache_entry(cached, e)
+            self._by_question[q_text] = cached
+        return cached
+
+    def _cache_entry(self, cached, entry):
+        bit = self._user_bit(entry['user'])
+        cached['all'] |= bit
+        if entry.get('agree'):
+            cached['agree'] |= bit
+        answers = cached['answers']
+        answers[entry.get('answer')] = answers.get(entry.get('answer'), 0) | bit
+
+    def _user(self, username):
+        cached = self._by_user.get(username)
+        if cached is None:
+            self._flush()
+            cached = 0
+            for e in self.db.answer_index.find({'user': username}, {'q': 1}):
+                cached |= self._question_bit(e['q'])
+            self._by_user[username] = cached
+        return cached
+
+    def update_user(self, username, questions):
+        """
+        Replaces username's entries with the ones for questions, as parsed by
+        parse_profiles (dicts with q_text, their_answer and agree).
+        """
+        entries = {_entry_id(username, q['q_text']): {
+            'user': username,
+            'q': q['q_text'],
+            'answer': q['their_answer'],
+            'agree': q['agree']
+        } for q in questions if q['q_text']}
+        #order independent, so an unordered bulk write can't delete the new entries
+        ops = [DeleteMany({'user': username, '_id': {'$nin': list(entries)}})]
+        ops.extend(ReplaceOne({'_id': _id}, entry, upsert=True) for _id, entry in entries.items())
+        if self.writer is not None:
+            for op in ops:
+                self.writer.add('answer_index', op)
+        else:
+            self.db.answer_index.bulk_write(ops, ordered=False)
+
+        #keep whatever is cached in step
+        bit = self._user_bit(username)
+        for cached in self._by_question.values():
+            cached['all'] &= ~bit
+            cached['agree'] &= ~bit
+            for answer in cached['answers']:
+                cached['answers'][answer] &= ~bit
+        for entry in entries.values():
+            if entry['q'] in self._by_question:
+                self._cache_entry(self._by_question[entry['q']], entry)
+        if username in self._by_user:
+            self._by_user[username] = 0
+            for entry in entries.values():
+                self._by_user[username] |= self._question_bit(entry['q'])
+
+    def update_user_html(self, username, questions_html):
+        """Same as update_user, from scrape_user's {AGREE: [html], DISAGREE: [html]}."""
+        self.update_user(username, [q for filterstr in ['AGREE', 'DISAGREE']
+            for q in parse_question_list(questions_html.get(filterstr) or [],
+                filterstr == 'AGREE')])
+
+    def users_answering(self, q_text, answer=None, agree=None):
+        """
+        Returns the users who answered a question, optionally only those who
+        gave a particular answer and/or whose answer was under AGREE (True)
+        or DISAGREE (False).
+        """
+        cached = self._question(q_text)
+        bitmap = cached['all'] if answer is None else cached['answers'].get(answer, 0)
+        if agree is not None:
+            bitmap &= cached['agree'] if agree else ~cached['agree']
+        return _members(bitmap, self._users)
+
+    def shared_questions(self, user_a, user_b):
+        """Returns the questions both users answered."""
+        return _members(self._user(user_a) & self._user(user_b), self._questions)
+
+    def top_overlap(self, user=None, questions=None, k=10):
+        """
+        Returns the k users who answered the most of the same questions as
+        user, or as a list of question texts such as a scraper version's.
+
+        Returns:
+            list of (username, number of shared questions), most first
+        """
+        if questions is None:
+            questions = _members(self._user(user), self._questions)
+        counts = np.zeros(0, dtype=np.int32)
+        for q_text in questions:
+            bitmap = self._question(q_text)['all']
+            if not bitmap:
+                continue
+            bits = np.unpackbits(np.frombuffer(bitmap.to_bytes((bitmap.bit_length()+7) // 8,
+                'little'), dtype=np.uint8), bitorder='little')
+            if len(bits) > len(counts):
+                counts = np.pad(counts, (0, len(bits) - len(counts)))
+            counts[:len(bits)] += bits
+        if user is not None and user in self._user_ids and self._user_ids[user] < len(counts):
+            counts[self._user_ids[user]] = 0
+        kk = min(k, np.count_nonzero(counts))
+        if kk == 0:
+            return []
+        best = np.argpartition(-counts, kk-1)[:kk]
+        best = best[np.argsort(-counts[best], kind='stable')]
+        return [(self._users[i], int(counts[i])) for i in best]
+
+
+def build(db, batch_size=500):
+    """
+    Indexes every stored user's questions from scratch, a batch of users at
+    a time. Returns the number of users indexed.
+    """
+    store = None
+    count = 0
+    with BulkWriter(db, max_batch=batch_size*50) as writer:
+        index = AnswerIndex(db, writer)
+        for doc in db.users.find({}, {'questions': 1, 'parsed.questions': 1, 'storage': 1},
+                batch_size=batch_size, no_cursor_timeout=True):
+            if 'parsed' in doc:
+                index.update_user(doc['_id'], doc['parsed']['questions'])
+            else:
+                if 'storage' in doc:
+                    store = store or HtmlStore(db, dict_id=0)
+                    doc = store.unpack_user(doc)
+                index.update_user_html(doc['_id'], doc.get('questions') or dict())
+            count += 1
+    return count
+
+
+if __name__=='__main__':
+    parser = argparse.ArgumentParser(description='Build the question -> users answer index')
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    n = build(MongoClient('localhost', 27017).okc)
+    print(f'indexed {n} users in {time.perf_counter() - start:.1f}s')
@@ -0,0 +1,88 @@
+from answer_index import AnswerIndex, _entry_id
+from pymongo import MongoClient
+import numpy as np
+import argparse, time
+
+
+def synthetic(users, questions=2000, per_user=50, seed=0):
+    """Parsed question lists for users, popular questions answered more often."""
+    rng = np.random.default_rng(seed)
+    popularity = 1.0 / np.arange(1, questions+1)
+    popularity /= popularity.sum()
+    answers = ['Yes', 'No', 'Maybe', 'Never']
+    return {f'user{u}': [{
+        'q_text': f'Synthetic question {q}?',
+        'their_answer': answers[(q + u) % 4],
+        'agree': bool((q * u) % 3)
+    } for q in rng.choice(questions, per_user, replace=False, p=popularity)]
+        for u in range(users)}
+
+
+def scan_users_answering(corpus, q_text, answer):
+    """The old way: look through every user's question list."""
+    return [u for u, qs in corpus.items()
+        if any(q['q_text'] == q_text and q['their_answer'] == answer for q in qs)]
+
+
+def scan_shared(corpus, a, b):
+    mine = {q['q_text'] for q in corpus[a]}
+    return [q['q_text'] for q in corpus[b] if q['q_text'] in mine]
+
+
+def scan_top_overlap(corpus, user, k):
+    mine = {q['q_text'] for q in corpus[user]}
+    counts = [(sum(q['q_text'] in mine for q in qs), u) for u, qs in corpus.items() if u != user]
+    return sorted(counts, reverse=True)[:k]
+
+
+def timed(f, *args, repeat=20):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        f(*args)
+    return 1000 * (time.perf_counter() - start) / repeat
+
+
+if __name__=='__main__':
+    parser = argparse.ArgumentParser(description='Answer index query latency on synthetic users')
+    parser.add_argument('--users', type=int, default=5000)
+    parser.add_argument('--questions', type=int, default=2000)
+    parser.add_argument('--per-user', type=int, default=50)
+    parser.add_argument('--uri', default=None,
+        help='mongod to benchmark against, e.g. mongodb://localhost:27017. uses mongomock if omitted')
+    args = parser.parse_args()
+
+    if args.uri:
+        client = MongoClient(args.uri)
+    else:
+        import mongomock
+        client = mongomock.MongoClient()
+    client.drop_database('okc_bench')
+    db = client.okc_bench
+    corpus = synthetic(args.users, args.questions, args.per_user)
+    db.answer_index.insert_many([{'_id': _entry_id(u, q['q_text']), 'user': u, 'q': q['q_text'],
+        'answer': q['their_answer'], 'agree': q['agree']} for u, qs in corpus.items() for q in qs])
+
+    q, a, b = 'Synthetic question 3?', 'user1', 'user2'
+    answer = corpus[a][0]['their_answer']
+    index = AnswerIndex(db)
+    cold = {
+        'users_answering': timed(index.users_answering, q, 'Yes', repeat=1),
+        'shared_questions': timed(index.shared_questions, a, b, repeat=1),
+        'top_overlap': timed(index.top_overlap, a, None, 10, repeat=1)
+    }
+    warm = {
+        'users_answering': timed(index.users_answering, q, 'Yes'),
+        'shared_questions': timed(index.shared_questions, a, b),
+        'top_overlap': timed(index.top_overlap, a, None, 10)
+    }
+    scan = {
+        'users_answering': timed(scan_users_answering, corpus, q, 'Yes', repeat=3),
+        'shared_questions': timed(scan_shared, corpus, a, b),
+        'top_overlap': timed(scan_top_overlap, corpus, a, 10, repeat=3)
+    }
+    client.drop_database('okc_bench')
+
+    print(f'{args.users} users, {args.per_user} answers each')
+    print(f'{"query":18s} {"scan ms":>9s} {"cold ms":>9s} {"warm ms":>9s}')
+    for name in warm:
+        print(f'{name:18s} {scan[name]:9.2f} {cold[name]:9.2f} {warm[name]:9.3f}')
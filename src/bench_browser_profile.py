@@ -0,0 +1,57 @@
+from fixture_site import FixtureSite
+from bench_scraper import make_scraper
+from browser_profile import ResourcePolicy
+from extract import read_profile_signals
+import argparse, os, time
+
+POLICIES = {
+    'full': None,
+    'blocked': ResourcePolicy(eager=False),
+    'blocked+eager': ResourcePolicy(eager=True)
+}
+
+
+def load_profiles(site, scraper, n, offset=0):
+    """
+    Opens n profiles and reads their image urls, the way rescrape_user does.
+
+    Returns:
+        (seconds per profile, bytes served per profile, image urls read per profile)
+    """
+    site.reset_stats()
+    urls = 0
+    start = time.perf_counter()
+    for i in range(n):
+        scraper.get_page(f'/profile/fixture_user_{offset + i}')
+        urls += sum(u is not None for u in read_profile_signals(scraper.driver)['image_urls'])
+    elapsed = time.perf_counter() - start
+    served = sum(stat['bytes'] for stat in site.stats.values())
+    return elapsed / n, served / n, urls / n
+
+
+if __name__=='__main__':
+    parser = argparse.ArgumentParser(description='Profile page loads with and without a ResourcePolicy')
+    parser.add_argument('--driverpath', default=f'{os.getcwd()}/src/chromedriver')
+    parser.add_argument('--profiles', type=int, default=50)
+    parser.add_argument('--images', type=int, default=8)
+    parser.add_argument('--image-size', type=int, default=100000)
+    parser.add_argument('--asset-latency', type=float, default=0.05,
+        help='seconds the fixture site takes to serve each image or font')
+    args = parser.parse_args()
+
+    with FixtureSite(images=args.images, image_size=args.image_size,
+            asset_latency=args.asset_latency) as site:
+        results = dict()
+        for k, (name, policy) in enumerate(POLICIES.items()):
+            scraper = make_scraper(site, args.driverpath, resource_policy=policy)
+            try:
+                #fresh users for every policy, so nothing comes from the browser cache
+                results[name] = load_profiles(site, scraper, args.profiles, k*args.profiles)
+            finally:
+                scraper.driver.quit()
+
+    full_seconds, full_bytes, _ = results['full']
+    print(f'{"policy":14s} {"ms/page":>8s} {"KB/page":>8s} {"urls/page":>10s} {"speedup":>8s} {"bytes":>7s}')
+    for name, (seconds, served, urls) in results.items():
+        print(f'{name:14s} {1000*seconds:8.1f} {served/1000:8.1f} {urls:10.1f} '
+            f'{full_seconds/seconds:7.2f}x {served/full_bytes:6.0%}')
@@ -0,0 +1,67 @@
+from question_catalog import QuestionCatalog
+from version_store import VersionStore, merge_question_data
+from bench_versions import make_questions
+from bson import BSON
+from pymongo import MongoClient
+import mongomock
+import argparse, random, time
+
+
+def version_bytes(db):
+    return sum(len(BSON.encode(d)) for d in db.scraper_versions.find())
+
+
+def timed(f, *args, repeat=5):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        f(*args)
+    return (time.perf_counter() - start) / repeat
+
+
+if __name__=='__main__':
+    parser = argparse.ArgumentParser(description='Question data as dicts against catalog ids')
+    parser.add_argument('--questions', type=int, default=5000)
+    parser.add_argument('--versions', type=int, default=50)
+    parser.add_argument('--per-version', type=int, default=100)
+    parser.add_argument('--uri', default=None,
+        help='mongod to benchmark against, e.g. mongodb://localhost:27017. uses mongomock '
+        'if omitted, whose unique index checks make interning look far slower than it is')
+    args = parser.parse_args()
+    client = MongoClient(args.uri) if args.uri else mongomock.MongoClient()
+
+    rng = random.Random(0)
+    first = make_questions(0, args.questions)
+    updates = [[dict(q, our_answer=rng.randrange(4)) for q in rng.sample(first, args.per_version)]
+        for _ in range(args.versions)]
+
+    results = dict()
+    for mode in ['text', 'compact']:
+        client.drop_database('okc_bench')
+        db = client.okc_bench
+        catalog = QuestionCatalog(db) if mode == 'compact' else None
+        store = VersionStore(db, 'bench', catalog=catalog)
+        start = time.perf_counter()
+        store.set_first_version(first)
+        for qd in updates:
+            store.add_version(qd)
+        write = time.perf_counter() - start
+        fresh = VersionStore(db, 'bench', catalog=QuestionCatalog(db) if catalog else None)
+        rebuild = timed(fresh.rebuild, fresh.current_version, repeat=1)
+        results[mode] = (version_bytes(db), write, rebuild)
+
+    client.drop_database('okc_bench')
+    catalog = QuestionCatalog(client.okc_bench)
+    store = VersionStore(client.okc_bench, 'bench', catalog=catalog)
+    #a two version chain, newest first, as rebuild merges it
+    chain = [{'format': 'compact', 'delta': catalog.encode(updates[0])},
+        {'format': 'compact', 'delta': catalog.encode(first)}]
+    merge_text = timed(merge_question_data, first, updates[0])
+    merge_ids = timed(store._merge_answers, chain)
+
+    client.drop_database('okc_bench')
+
+    print(f'{"mode":8s} {"version KB":>10s} {"write s":>8s} {"rebuild s":>9s}')
+    for mode, (size, write, rebuild) in results.items():
+        print(f'{mode:8s} {size/1e3:10.1f} {write:8.2f} {rebuild:9.3f}')
+    print(f'merge {args.questions} questions: by text {1000*merge_text:.2f}ms, '
+        f'compact {1000*merge_ids:.2f}ms')
@@ -0,0 +1,113 @@
+from fixture_site import FixtureSite
+from fetch import FetchBackend, parse_profile_page, parse_question_page
+import argparse, os, tempfile, time
+
+CLOCK_TICKS = os.sysconf('SC_CLK_TCK')
+
+
+def tree_cpu_seconds(pid):
+    """
+    CPU seconds used so far by a process and all its descendants, read from
+    /proc, e.g. chromedriver and the Chrome processes it started.
+    """
+    children, cpu = dict(), dict()
+    for entry in os.listdir('/proc'):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f'/proc/{entry}/stat') as f:
+                #the command name can hold spaces, so split after its closing paren
+                fields = f.read().rsplit(')', 1)[1].split()
+        except OSError:
+            continue
+        children.setdefault(int(fields[1]), []).append(int(entry))
+        cpu[int(entry)] = (int(fields[11]) + int(fields[12])) / CLOCK_TICKS
+    total, todo = 0.0, [pid]
+    while todo:
+        p = todo.pop()
+        total += cpu.get(p, 0.0)
+        todo.extend(children.get(p, []))
+    return total
+
+
+class Unlimited:
+    """Rate limiter that never waits, since the fixture site is local."""
+
+    def acquire(self):
+        pass
+
+
+def scrape_users(scraper, users, offset):
+    """Scrapes users through scrape_user. Returns (wall, our cpu, browser cpu) seconds."""
+    img_dir = tempfile.mkdtemp()
+    browser_pid = scraper.driver.service.process.pid
+    browser_before = tree_cpu_seconds(browser_pid)
+    cpu_before = time.process_time()
+    start = time.perf_counter()
+    for i in range(users):
+        scraper.scrape_user(img_dir, f'fixture_user_{offset + i}')
+    for pipeline in scraper.image_pipelines.values():
+        pipeline.join()
+    return (time.perf_counter() - start, time.process_time() - cpu_before,
+        tree_cpu_seconds(browser_pid) - browser_before)
+
+
+def fetch_only(site, users, concurrency):
+    """Fetches and parses every user's pages with no browser at all."""
+    #the fixture site is local, so there's nothing to rate limit
+    fetcher = FetchBackend(site.url, [], concurrency=concurrency, rpm=None)
+    try:
+        cpu_before = time.process_time()
+        start = time.perf_counter()
+        futures = [(fetcher.page('questions', f'/profile/fixture_user_{i}/questions',
+            parse_question_page), fetcher.page('profile', f'/profile/fixture_user_{i}',
+            parse_profile_page)) for i in range(users)]
+        missing = sum(q.result() is None or p.result() is None for q, p in futures)
+        return time.perf_counter() - start, time.process_time() - cpu_before, 0.0, missing
+    finally:
+        fetcher.close()
+
+
+def report(name, users, wall, cpu, browser_cpu):
+    print(f'{name:26s} {users/wall:9.2f} {1000*cpu/users:10.1f} {1000*browser_cpu/users:12.1f} '
+        f'{1000*(cpu+browser_cpu)/users:10.1f}')
+
+
+if __name__=='__main__':
+    parser = argparse.ArgumentParser(description='scrape_user through the browser vs the fetch backend')
+    parser.add_argument('--driverpath', default=f'{os.getcwd()}/src/chromedriver')
+    parser.add_argument('--users', type=int, default=20)
+    parser.add_argument('--questions', type=int, default=100)
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--render-latency', type=float, default=0.05)
+    parser.add_argument('--no-browser', action='store_true',
+        help='only time the fetch backend on its own, e.g. where Chrome is not installed')
+    args = parser.parse_args()
+
+    #server_questions puts the question lists in the html, so the fetch path
+    #can read both pages; without it question pages fall back to the browser
+    site_kwargs = dict(agree=args.questions*6//10, disagree=args.questions*4//10,
+        render_latency=args.render_latency, server_questions=True)
+    print(f'{"path":26s} {"users/s":>9s} {"py cpu ms":>10s} {"chrome cpu ms":>12s} {"cpu ms/user":>10s}')
+    with FixtureSite(**site_kwargs) as site:
+        wall, cpu, browser_cpu, missing = fetch_only(site, args.users, args.concurrency)
+        report('fetch only', args.users, wall, cpu, browser_cpu)
+        if missing:
+            print(f'  {missing} users needed the browser')
+    if args.no_browser:
+        raise SystemExit(0)
+
+    from bench_scraper import make_scraper
+    runs = [('browser', False, True), ('fetch, questions in html', True, True),
+        ('fetch, questions rendered', True, False)]
+    for k, (name, fetch, server_questions) in enumerate(runs):
+        site_kwargs['server_questions'] = server_questions
+        with FixtureSite(**site_kwargs) as site:
+            scraper = make_scraper(site, args.driverpath, fetch=fetch,
+                fetch_concurrency=args.concurrency, rate_limiter=Unlimited())
+            try:
+                scraper.login()
+                #fresh users for every run, so nothing comes from a cache
+                report(name, args.users, *scrape_users(scraper, args.users, k*args.users))
+            finally:
+                scraper.close()
@@ -0,0 +1,104 @@
+from html_store import HtmlStore, train_dictionary
+from bench_parse import FIXTURE_DIR
+from bson import BSON
+import argparse, glob, os, random, time
+
+
+def load_corpus(n, questions_per_user=100, distinct_questions=2000, seed=0):
+    """
+    Builds n scraped user documents from the fixture html. Profiles are the
+    fixture profiles with the username and essays varied per user. Questions
+    are drawn from a pool of distinct_questions fragments, so they repeat
+    across users the way popular questions do.
+    """
+    rng = random.Random(seed)
+    read = lambda name: open(os.path.join(FIXTURE_DIR, name)).read()
+    profiles = [open(p).read() for p in sorted(glob.glob(f'{FIXTURE_DIR}/profile_*.html'))]
+    templates = [read('question_agree.html'), read('question_disagree.html')]
+    pool = [templates[i % 2].replace('?</h3>', f' (#{i})?</h3>')
+        .replace('</div>\n', f' {rng.randrange(10**6)}</div>\n', 1)
+        for i in range(distinct_questions)]
+    docs = []
+    for i in range(n):
+        html = profiles[i % len(profiles)].replace('fixture_', f'user{i}_')\
+            .replace('</body>', f'<p>{rng.randrange(10**9)} ' * 5 + '</body>')
+        picked = rng.sample(pool, min(questions_per_user, len(pool)))
+        half = len(picked) // 2
+        docs.append({
+            '_id': f'user{i}',
+            'html': html,
+            'img_count': 3,
+            'questions': {'AGREE': picked[:half], 'DISAGREE': picked[half:]},
+            'metadata': {'time': ('20200101_000000',), 'scraper': 'bench',
+                'scraper_version': None}
+        })
+    return docs
+
+
+def stored_bytes(db):
+    """BSON bytes of every document in the collections html storage touches."""
+    names = ['users', 'html_fragments', 'html_blobs.files', 'html_blobs.chunks']
+    return sum(len(BSON.encode(doc)) for name in names for doc in db[name].find())
+
+
+def bench(db, docs, store):
+    """Returns (stored bytes, write docs/s, read docs/s) storing docs raw or through store."""
+    start = time.perf_counter()
+    if store is None:
+        db.users.insert_many(docs)
+    else:
+        db.users.insert_many([store.pack_user(d) for d in docs])
+    write = len(docs) / (time.perf_counter() - start)
+
+    ids = [d['_id'] for d in docs]
+    if store is not None:
+        #a fresh reader, so nothing is served from the writer's cache
+        store = HtmlStore(db, dict_id=store.dict_id)
+    start = time.perf_counter()
+    for _id in ids:
+        doc = db.users.find_one({'_id': _id})
+        if store is not None:
+            doc = store.unpack_user(doc)
+    read = len(docs) / (time.perf_counter() - start)
+    return stored_bytes(db), write, read
+
+
+if __name__=='__main__':
+    parser = argparse.ArgumentParser(description='Size and throughput of raw against compressed html')
+    parser.add_argument('--docs', type=int, default=2000)
+    parser.add_argument('--questions', type=int, default=100)
+    parser.add_argument('--distinct-questions', type=int, default=2000)
+    parser.add_argument('--level', type=int, default=10)
+    parser.add_argument('--uri', default=None,
+        help='mongod to benchmark against, e.g. mongodb://localhost:27017. uses mongomock if omitted')
+    args = parser.parse_args()
+
+    if args.uri:
+        from pymongo import MongoClient
+        client = MongoClient(args.uri)
+    else:
+        import mongomock
+        from mongomock.gridfs import enable_gridfs_integration
+        enable_gridfs_integration()
+        client = mongomock.MongoClient()
+    docs = load_corpus(args.docs, args.questions, args.distinct_questions)
+
+    results = []
+    for mode in ['raw', 'zstd', 'zstd+dict']:
+        client.drop_database('okc_bench')
+        db = client.okc_bench
+        store = None
+        if mode != 'raw':
+            dict_id = 0
+            if mode == 'zstd+dict':
+                samples = [d['html'] for d in docs[:200]] +\
+                    [q for d in docs[:200] for q in d['questions']['AGREE'][:10]]
+                dict_id = train_dictionary(db, samples)
+            store = HtmlStore(db, level=args.level, dict_id=dict_id)
+        results.append((mode,) + bench(db, docs, store))
+    client.drop_database('okc_bench')
+
+    raw_size = results[0][1]
+    print(f'{"mode":10s} {"MB":>8s} {"ratio":>6s} {"write/s":>9s} {"read/s":>9s}')
+    for mode, size, write, read in results:
+        print(f'{mode:10s} {size/1e6:8.2f} {raw_size/size:6.1f} {write:9.0f} {read:9.0f}')
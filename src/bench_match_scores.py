@@ -0,0 +1,83 @@
+from match_scores import AnswerMatrix, AnswerVector, IMPORTANCE_WEIGHTS, THEIR_IMPORTANCE,\
+    score_against, iter_pair_scores
+import numpy as np
+import argparse, time
+
+
+def synthetic(users, questions=2000, per_user=50, choices=4, seed=0):
+    """
+    A random AnswerMatrix and scraper AnswerVector. Popular questions are
+    answered more often, as on the site.
+    """
+    rng = np.random.default_rng(seed)
+    popularity = 1.0 / np.arange(1, questions+1)
+    popularity /= popularity.sum()
+    indices = np.concatenate([np.sort(rng.choice(questions, per_user, replace=False, p=popularity))
+        for _ in range(min(users, 1000))]).astype(np.int32)
+    #reuse the first thousand rows' question sets, shifted, rather than sampling every row
+    reps = -(-users // 1000)
+    indices = np.tile(indices, reps)[:users*per_user]
+    answer = rng.integers(0, choices, users*per_user).astype(np.int8)
+    matrix = AnswerMatrix([f'user{i}' for i in range(users)],
+        np.arange(0, users*per_user+1, per_user, dtype=np.int64), indices, answer,
+        (np.uint8(1) << answer.astype(np.uint8)).astype(np.uint8),
+        np.full(len(answer), IMPORTANCE_WEIGHTS[THEIR_IMPORTANCE], dtype=np.float32), questions)
+    target_answer = rng.integers(0, choices, questions).astype(np.int8)
+    mask = (np.uint8(1) << target_answer.astype(np.uint8)) |\
+        rng.integers(0, 1 << choices, questions).astype(np.uint8)
+    target = AnswerVector(target_answer, mask,
+        IMPORTANCE_WEIGHTS[rng.integers(0, 3, questions)])
+    return matrix, target
+
+
+def loop_scores(matrix, target):
+    """The notebook way: a Python loop over users and their answers."""
+    out = []
+    for u in range(len(matrix)):
+        na = da = nb = db = n = 0
+        for j in range(matrix.indptr[u], matrix.indptr[u+1]):
+            q, a = matrix.indices[j], matrix.answer[j]
+            if target.answer[q] < 0:
+                continue
+            wa, wb = target.weight[q], matrix.weight[j]
+            da += wa
+            na += wa * (target.mask[q] >> a & 1)
+            db += wb
+            nb += wb * (matrix.mask[j] >> target.answer[q] & 1)
+            n += 1
+        out.append(max(0.0, np.sqrt(na/da * nb/db) - 1/n) if n else None)
+    return out
+
+
+if __name__=='__main__':
+    parser = argparse.ArgumentParser(description='Match scoring on synthetic users')
+    parser.add_argument('--users', type=int, nargs='+', default=[10000, 100000, 1000000])
+    parser.add_argument('--questions', type=int, default=2000)
+    parser.add_argument('--per-user', type=int, default=50)
+    parser.add_argument('--loop-users', type=int, default=2000,
+        help='users the Python loop is timed on, extrapolated to each size')
+    parser.add_argument('--pair-users', type=int, nargs='+', default=[10000],
+        help='sizes to score all pairs at')
+    args = parser.parse_args()
+
+    small, target = synthetic(args.loop_users, args.questions, args.per_user)
+    start = time.perf_counter()
+    loop_scores(small, target)
+    loop_per_user = (time.perf_counter() - start) / args.loop_users
+
+    print(f'{"users":>9s} {"vector s":>9s} {"users/s":>10s} {"loop s (est)":>13s} {"speedup":>8s}')
+    for n in args.users:
+        matrix, target = synthetic(n, args.questions, args.per_user)
+        start = time.perf_counter()
+        score_against(matrix, target)
+        elapsed = time.perf_counter() - start
+        print(f'{n:9d} {elapsed:9.2f} {n/elapsed:10.0f} {loop_per_user*n:13.1f} '
+            f'{loop_per_user*n/elapsed:8.0f}x')
+
+    for n in args.pair_users:
+        matrix, _ = synthetic(n, args.questions, args.per_user)
+        start = time.perf_counter()
+        for _ in iter_pair_scores(matrix):
+            pass
+        elapsed = time.perf_counter() - start
+        print(f'all pairs of {n} users: {elapsed:.1f}s ({n*n/elapsed/1e6:.1f}M pairs/s)')
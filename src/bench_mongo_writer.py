@@ -0,0 +1,66 @@
+from mongo_writer import BulkWriter
+from pymongo import MongoClient
+from pymongo.errors import DuplicateKeyError
+import argparse, time
+
+
+def make_user(i):
+    return {
+        '_id': f'user{i}',
+        'html': '<div class="profile">' + 'x'*2000 + '</div>',
+        'img_count': 3,
+        'questions': {'AGREE': ['<h3>q</h3>']*20, 'DISAGREE': ['<h3>q</h3>']*10},
+        'metadata': {'time': '20200101_000000', 'scraper': 'bench', 'scraper_version': None}
+    }
+
+
+def one_at_a_time(db, n):
+    """The same writes as buffered, one round trip each."""
+    for i in range(n):
+        db.users.replace_one({'_id': f'user{i}'}, make_user(i), upsert=True)
+        try:
+            db.usernames.insert_one({'_id': f'user{i}'})
+        except DuplicateKeyError:
+            pass
+
+
+def buffered(db, n, batch):
+    with BulkWriter(db, max_batch=batch) as writer:
+        for i in range(n):
+            writer.add_user(make_user(i))
+            writer.add_usernames([f'user{i}'])
+    return writer.counts
+
+
+def timed(f, *args):
+    start = time.perf_counter()
+    result = f(*args)
+    return time.perf_counter() - start, result
+
+
+if __name__=='__main__':
+    parser = argparse.ArgumentParser(description='BulkWriter against one write per document')
+    parser.add_argument('--docs', type=int, default=5000)
+    parser.add_argument('--batch', type=int, default=500)
+    parser.add_argument('--uri', default=None,
+        help='mongod to benchmark against, e.g. mongodb://localhost:27017. uses mongomock if omitted')
+    args = parser.parse_args()
+
+    if args.uri:
+        client = MongoClient(args.uri)
+    else:
+        import mongomock
+        client = mongomock.MongoClient()
+    db = client.okc_bench
+    client.drop_database('okc_bench')
+    single, _ = timed(one_at_a_time, db, args.docs)
+    client.drop_database('okc_bench')
+    bulk, counts = timed(buffered, db, args.docs, args.batch)
+    #again, so every write is a duplicate
+    _, again = timed(buffered, db, args.docs, args.batch)
+    client.drop_database('okc_bench')
+
+    print(f'one at a time: {args.docs/single:10.1f} docs/s')
+    print(f'bulk writer:   {args.docs/bulk:10.1f} docs/s ({single/bulk:.1f}x)')
+    print(f'first pass counts: {counts}')
+    print(f'second pass counts: {again}')
@@ -0,0 +1,46 @@
+from concurrent.futures import ProcessPoolExecutor
+from parse_profiles import parse_user_document
+import argparse, glob, os, time
+
+FIXTURE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures')
+
+
+def load_fixture_documents(n, questions_per_user=100):
+    """
+    Builds n scraped user documents from the saved fixture html, cycling
+    through the fixture profiles.
+    """
+    read = lambda name: open(os.path.join(FIXTURE_DIR, name)).read()
+    profiles = [open(p).read() for p in sorted(glob.glob(f'{FIXTURE_DIR}/profile_*.html'))]
+    agree, disagree = read('question_agree.html'), read('question_disagree.html')
+    half = questions_per_user // 2
+    return [{
+        '_id': f'user{i}',
+        'html': profiles[i % len(profiles)],
+        'questions': {'AGREE': [agree]*half, 'DISAGREE': [disagree]*half}
+    } for i in range(n)]
+
+
+def bench(docs, workers):
+    """Returns documents per second parsing docs with the given number of workers."""
+    start = time.perf_counter()
+    if workers == 1:
+        list(map(parse_user_document, docs))
+    else:
+        with ProcessPoolExecutor(workers) as pool:
+            list(pool.map(parse_user_document, docs,
+                chunksize=max(1, len(docs) // (workers*4))))
+    return len(docs) / (time.perf_counter() - start)
+
+
+if __name__=='__main__':
+    parser = argparse.ArgumentParser(description='Parser throughput on fixture html')
+    parser.add_argument('--docs', type=int, default=2000)
+    parser.add_argument('--questions', type=int, default=100)
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4, 8])
+    args = parser.parse_args()
+
+    docs = load_fixture_documents(args.docs, args.questions)
+    print('workers  docs/s')
+    for w in args.workers:
+        print(f'{w:7d}  {bench(docs, w):8.1f}')
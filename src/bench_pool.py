@@ -0,0 +1,156 @@
+from fixture_site import FixtureSite
+from pool import ScraperPool, WorkQueue, SharedRateLimiter, open_db, _worker_entry, CLAIMED, DONE
+import argparse, multiprocessing as mp, os, signal, tempfile, time
+
+
+def descendants(pid):
+    """Pids of every process started by pid, read from /proc."""
+    children = dict()
+    for entry in os.listdir('/proc'):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f'/proc/{entry}/stat') as f:
+                #the command name can hold spaces, so split after its closing paren
+                ppid = int(f.read().rsplit(')', 1)[1].split()[1])
+        except OSError:
+            continue
+        children.setdefault(ppid, []).append(int(entry))
+    found, todo = [], list(children.get(pid, []))
+    while todo:
+        p = todo.pop()
+        found.append(p)
+        todo.extend(children.get(p, []))
+    return found
+
+
+def kill_tree(pid):
+    """
+    SIGKILLs a process and everything it started, like a worker whose machine
+    went away: no finally blocks run, nothing is flushed, Chrome goes too.
+    """
+    for p in [pid] + descendants(pid):
+        try:
+            os.kill(p, signal.SIGKILL)
+        except ProcessLookupError:
+            pass
+
+
+def wait_for(condition, timeout, poll=0.05):
+    """Polls condition until it returns something truthy, which is returned."""
+    deadline = time.perf_counter() + timeout
+    while time.perf_counter() < deadline:
+        value = condition()
+        if value:
+            return value
+        time.sleep(poll)
+    raise TimeoutError(f'nothing after {timeout} s')
+
+
+def kill_mid_lease(queue, img_dir, scraper_kwargs, queue_kwargs, mongo_uri, rpm, timeout):
+    """
+    Starts one worker and kills it as soon as it has claimed a username.
+
+    Returns:
+        the username it held, which is left claimed until its lease runs out
+    """
+    stop = mp.Event()
+    proc = mp.Process(target=_worker_entry, name='scraper-killed', args=('killed', img_dir,
+        SharedRateLimiter(rpm), stop, scraper_kwargs, queue_kwargs),
+        kwargs={'mongo_uri': mongo_uri})
+    proc.start()
+    doc = wait_for(lambda: queue.db.usernames.find_one({'status': CLAIMED}), timeout)
+    kill_tree(proc.pid)
+    proc.join()
+    return doc['_id']
+
+
+def check(db, usernames, killed, max_attempts):
+    """
+    Checks every username was stored in db.users and marked done,
+    and that the killed worker's username was claimed exactly twice.
+
+    Returns:
+        list of problems found, empty if none
+    """
+    problems = []
+    not_done = db.usernames.count_documents({'status': {'$ne': DONE}})
+    if not_done:
+        problems.append(f'{not_done} usernames not done')
+    stored = set(doc['_id'] for doc in db.users.find({}, {'_id': 1}))
+    missing = set(usernames) - stored
+    if missing:
+        problems.append(f'{len(missing)} usernames done but not stored, e.g. {min(missing)}')
+    doc = db.usernames.find_one({'_id': killed})
+    if doc.get('attempts') != 2:
+        problems.append(f'{killed} was claimed {doc.get("attempts")} times, not twice')
+    over = db.usernames.count_documents({'attempts': {'$gt': max_attempts}})
+    if over:
+        problems.append(f'{over} usernames claimed more than {max_attempts} times')
+    return problems
+
+
+if __name__=='__main__':
+    parser = argparse.ArgumentParser(description='ScraperPool against the fixture site, '
+        'with a worker killed while it holds a lease')
+    parser.add_argument('--driverpath', default=f'{os.getcwd()}/src/chromedriver')
+    parser.add_argument('--uri', default='mongodb://localhost:27017',
+        help='mongod to use, without a database; a scratch one is created and dropped. '
+            'workers are separate processes, so mongomock cannot stand in')
+    parser.add_argument('--users', type=int, default=40)
+    parser.add_argument('--workers', type=int, default=3)
+    parser.add_argument('--questions', type=int, default=100)
+    parser.add_argument('--lease', type=float, default=15,
+        help='seconds a claim lasts, so how long the killed worker holds its username')
+    parser.add_argument('--render-latency', type=float, default=0.05)
+    parser.add_argument('--rpm', type=float, default=6000,
+        help='page loads per minute across the pool; the fixture site is local')
+    parser.add_argument('--keep', action='store_true', help="don't drop the scratch database")
+    args = parser.parse_args()
+
+    mongo_uri = f'{args.uri.rstrip("/")}/bench_pool_{os.getpid()}'
+    db = open_db(mongo_uri)
+    img_dir = tempfile.mkdtemp()
+    creds = tempfile.NamedTemporaryFile('w', suffix='.csv', delete=False)
+    aliases = [f'bench{i}' for i in range(args.workers)]
+    creds.write('name,email,pw\n' + ''.join(f'{a},{a}@example.com,hunter2\n'
+        for a in aliases + ['killed']))
+    creds.close()
+    queue_kwargs = {'lease': args.lease}
+    usernames = [f'fixture_user_{i}' for i in range(args.users)]
+    db.usernames.insert_many([{'_id': u} for u in usernames])
+    try:
+        with FixtureSite(agree=args.questions*6//10, disagree=args.questions*4//10,
+                render_latency=args.render_latency) as site:
+            scraper_kwargs = {'base_url': site.url, 'driverpath': args.driverpath,
+                'credentials_path': creds.name, 'session_dir': tempfile.mkdtemp()}
+            queue = WorkQueue(db, **queue_kwargs)
+
+            start = time.perf_counter()
+            killed = kill_mid_lease(queue, img_dir, scraper_kwargs, queue_kwargs, mongo_uri,
+                args.rpm, timeout=120)
+            print(f'killed a worker holding {killed} after {time.perf_counter() - start:.1f} s')
+
+            pool = ScraperPool(aliases, img_dir, rpm=args.rpm, scraper_kwargs=scraper_kwargs,
+                queue_kwargs=queue_kwargs, mongo_uri=mongo_uri)
+            start = time.perf_counter()
+            counts = pool.run(poll=0.5)
+            wall = time.perf_counter() - start
+            reclaimed = db.usernames.find_one({'_id': killed})
+
+        #the killed worker's username only comes back once its lease runs out
+        print(f'{args.workers} workers, {args.users} users in {wall:.1f} s '
+            f'({args.users/wall:.2f} users/s, including the {args.lease:g} s lease), '
+            f'restarts {pool.stats}')
+        print(f'queue: {counts}')
+        print(f'{killed}: {reclaimed.get("status")} after {reclaimed.get("attempts")} claims, '
+            f'by {reclaimed.get("worker")}')
+        problems = check(db, usernames, killed, queue.max_attempts)
+        for problem in problems:
+            print(f'  {problem}')
+        print('ok' if not problems else 'FAILED')
+    finally:
+        os.remove(creds.name)
+        if not args.keep:
+            db.client.drop_database(db.name)
+    raise SystemExit(1 if problems else 0)
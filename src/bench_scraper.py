@@ -0,0 +1,175 @@
+from fixture_site import FixtureSite
+from contextlib import contextmanager
+import argparse, json, os, sys, tempfile, time
+
+
+class CommandCounter:
+    """
+    Counts the WebDriver commands a driver sends. Every command, including
+    the ones WebElements send, goes through driver.execute, so wrapping that
+    one method catches them all.
+    """
+
+    def __init__(self, driver):
+        self.counts = dict()
+        execute = driver.execute
+
+        def counting_execute(command, params=None):
+            self.counts[command] = self.counts.get(command, 0) + 1
+            return execute(command, params)
+        driver.execute = counting_execute
+
+    def total(self):
+        return sum(self.counts.values())
+
+    def reset(self):
+        self.counts = dict()
+
+
+@contextmanager
+def metered_sleep():
+    """
+    Replaces time.sleep for the duration, adding up how long everything in
+    the process slept. Yields a one-element list holding the total.
+    """
+    slept = [0.0]
+    real_sleep = time.sleep
+
+    def sleep(seconds):
+        start = time.perf_counter()
+        real_sleep(seconds)
+        slept[0] += time.perf_counter() - start
+    time.sleep = sleep
+    try:
+        yield slept
+    finally:
+        time.sleep = real_sleep
+
+
+def make_scraper(site, driverpath, headless=True, **kwargs):
+    """Builds a Scraper against the fixture site with a throwaway database and account."""
+    from okc_scraper_controller import Scraper
+    import mongomock
+    creds = tempfile.NamedTemporaryFile('w', suffix='.csv', delete=False)
+    creds.write('name,email,pw\nbench,bench@example.com,hunter2\n')
+    creds.close()
+    try:
+        return Scraper('bench', headless=headless, driverpath=driverpath, base_url=site.url,
+            db=mongomock.MongoClient().okc, credentials_path=creds.name,
+            session_dir=tempfile.mkdtemp(), **kwargs)
+    finally:
+        os.remove(creds.name)
+
+
+def scenarios(img_dir):
+    """name -> function taking the scraper, for every benchmarked method."""
+    def scrape_user(s):
+        s.scrape_user(img_dir, 'fixture_user_1')
+        for pipeline in s.image_pipelines.values():
+            pipeline.join()
+    def rescrape_user(s):
+        #the first call stores the user, the rest only check the signals
+        s.rescrape_user(img_dir, 'fixture_user_2')
+        for pipeline in s.image_pipelines.values():
+            pipeline.join()
+    return {
+        'collect_usernames': lambda s: s.collect_usernames(),
+        'scrape_user': scrape_user,
+        'rescrape_user': rescrape_user,
+        'get_scraper_question_data': lambda s: s.get_scraper_question_data(),
+        'answer_all_questions': lambda s: s.answer_all_questions(),
+    }
+
+
+def run(site, scraper, names, repeat=1):
+    """
+    Runs each named scenario repeat times against the fixture site.
+
+    Returns:
+        name -> dict of wall, webdriver_calls, sleep, wait and work seconds
+        (means over the repeats), plus the most frequent commands
+    """
+    counter = CommandCounter(scraper.driver)
+    img_dir = tempfile.mkdtemp()
+    todo = scenarios(img_dir)
+    results = dict()
+    for name in names:
+        totals = {'wall': 0.0, 'webdriver_calls': 0, 'sleep': 0.0, 'wait': 0.0}
+        commands = dict()
+        for _ in range(repeat):
+            counter.reset()
+            wait_before = scraper.wait.total_seconds()
+            with metered_sleep() as slept:
+                start = time.perf_counter()
+                todo[name](scraper)
+                wall = time.perf_counter() - start
+            totals['wall'] += wall
+            totals['webdriver_calls'] += counter.total()
+            totals['sleep'] += slept[0]
+            totals['wait'] += scraper.wait.total_seconds() - wait_before
+            for command, n in counter.counts.items():
+                commands[command] = commands.get(command, 0) + n
+        result = {k: v / repeat for k, v in totals.items()}
+        result['work'] = result['wall'] - result['sleep']
+        result['top_commands'] = dict(sorted(commands.items(),
+            key=lambda kv: -kv[1])[:5])
+        results[name] = result
+    return results
+
+
+def compare(results, baseline, threshold):
+    """
+    Returns the scenarios whose wall time or webdriver calls grew by more
+    than threshold (a fraction) over the baseline results.
+    """
+    regressions = []
+    for name, result in results.items():
+        base = baseline.get(name)
+        if base is None:
+            continue
+        for key in ['wall', 'webdriver_calls']:
+            if base[key] and (result[key] - base[key]) / base[key] > threshold:
+                regressions.append(f'{name} {key}: {base[key]:.2f} -> {result[key]:.2f}')
+    return regressions
+
+
+if __name__=='__main__':
+    parser = argparse.ArgumentParser(description='End-to-end Scraper benchmarks on the fixture site')
+    parser.add_argument('--driverpath', default=f'{os.getcwd()}/src/chromedriver')
+    parser.add_argument('--scenarios', nargs='+', default=list(scenarios(None)))
+    parser.add_argument('--repeat', type=int, default=1)
+    parser.add_argument('--questions', type=int, default=100,
+        help='AGREE+DISAGREE questions per profile, and questions on the self view')
+    parser.add_argument('--cards', type=int, default=200)
+    parser.add_argument('--cards-per-page', type=int, default=20)
+    parser.add_argument('--images', type=int, default=4)
+    parser.add_argument('--render-latency', type=float, default=0.05)
+    parser.add_argument('--json', help='write results here')
+    parser.add_argument('--compare', help='results json from an earlier run to check against')
+    parser.add_argument('--threshold', type=float, default=0.2)
+    args = parser.parse_args()
+
+    with FixtureSite(self_questions=args.questions, agree=args.questions*6//10,
+            disagree=args.questions*4//10, total_cards=args.cards,
+            cards_per_page=args.cards_per_page, images=args.images,
+            render_latency=args.render_latency) as site:
+        scraper = make_scraper(site, args.driverpath)
+        try:
+            scraper.login()
+            results = run(site, scraper, args.scenarios, args.repeat)
+        finally:
+            scraper.close()
+
+    print(f'{"scenario":28s} {"wall s":>8s} {"calls":>7s} {"sleep s":>8s} {"wait s":>8s} {"work s":>8s}')
+    for name, r in results.items():
+        print(f'{name:28s} {r["wall"]:8.2f} {r["webdriver_calls"]:7.0f} {r["sleep"]:8.2f} '
+            f'{r["wait"]:8.2f} {r["work"]:8.2f}')
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(results, json.load(f), args.threshold)
+        for line in regressions:
+            print(f'REGRESSION {line}')
+        sys.exit(1 if regressions else 0)
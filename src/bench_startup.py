@@ -0,0 +1,104 @@
+import argparse, json, os, subprocess, sys, tempfile, time
+
+#the modules that made importing the scraper slow before they were deferred
+HEAVY = ['selenium.webdriver', 'pymongo', 'pandas', 'numpy', 'bs4', 'requests', 'pyarrow',
+    'zstandard', 'lxml', 'scipy']
+
+#what each subcommand of scrape.py imports and builds before its first page
+#load or query. the browser and database handles are lazy, so building a
+#Scraper here starts neither; FIRST_USE times what they defer.
+SETUP = {
+    'collect': """
+from okc_scraper_controller import Scraper
+from metrics import Metrics
+imported = time.perf_counter()
+Scraper('bench', metrics=Metrics(), credentials_path=CREDS)
+""",
+    'answer': """
+from okc_scraper_controller import Scraper
+from metrics import Metrics
+imported = time.perf_counter()
+Scraper('bench', metrics=Metrics(), credentials_path=CREDS)
+""",
+    'scrape': """
+from pool import ScraperPool, WorkQueue
+from credentials import read_aliases
+imported = time.perf_counter()
+read_aliases(CREDS)
+""",
+    'export': """
+from export import Exporter
+from pymongo import MongoClient
+imported = time.perf_counter()
+Exporter(MongoClient('localhost', 27017, connect=False).okc, OUT)
+""",
+    #everything the old scrape.py and okc_scraper_controller imported up front
+    'eager (before)': """
+import pandas, numpy, bs4, requests, pymongo, selenium.webdriver
+imported = time.perf_counter()
+""",
+}
+
+#what the first access to a browser or database handle imports and builds,
+#short of launching Chrome or reaching a server (Scraper._start_driver and
+#Scraper._open_db). the imports still cost the same, they just come later.
+OPEN_HANDLES = """
+from selenium.webdriver import Chrome
+from selenium.webdriver.chrome.options import Options
+from mongo_writer import BulkWriter
+from version_store import VersionStore
+from pymongo import MongoClient
+Options()
+MongoClient('localhost', 27017, connect=False).okc
+"""
+FIRST_USE = {'collect': OPEN_HANDLES, 'answer': OPEN_HANDLES}
+
+SNIPPET = """
+import time
+start = time.perf_counter()
+import sys, json
+CREDS, OUT = sys.argv[1], sys.argv[2]
+import scrape
+{setup}
+ready = time.perf_counter()
+{first_use}
+used = time.perf_counter()
+print(json.dumps({{'import': imported - start, 'cold_start': ready - start,
+    'first_use': used - ready, 'heavy': [m for m in {heavy} if m in sys.modules]}}))
+"""
+
+
+def measure(name, creds, out, src_dir):
+    """Runs one subcommand's setup in a fresh interpreter, returns its timings."""
+    code = SNIPPET.format(setup=SETUP[name], first_use=FIRST_USE.get(name, ''), heavy=HEAVY)
+    start = time.perf_counter()
+    done = subprocess.run([sys.executable, '-c', code, creds, out], cwd=src_dir,
+        capture_output=True, text=True, check=True)
+    result = json.loads(done.stdout.strip().splitlines()[-1])
+    result['process'] = time.perf_counter() - start
+    return result
+
+
+if __name__=='__main__':
+    parser = argparse.ArgumentParser(description='Import time and cold start of each scrape.py subcommand')
+    parser.add_argument('--repeat', type=int, default=5, help='runs per subcommand, best is kept')
+    args = parser.parse_args()
+
+    src_dir = os.path.dirname(os.path.abspath(__file__))
+    creds = tempfile.NamedTemporaryFile('w', suffix='.csv', delete=False)
+    creds.write('name,email,pw\nbench,bench@example.com,hunter2\n')
+    creds.close()
+    out = tempfile.mkdtemp()
+    try:
+        #cold is ready to construct, first use adds the imports the lazy handles
+        #defer, total is what a run pays before its first page load or query
+        print(f'{"subcommand":15s} {"import ms":>10s} {"cold ms":>9s} {"first use ms":>13s} '
+            f'{"total ms":>9s} {"process ms":>11s}  heavy modules loaded')
+        for name in SETUP:
+            runs = [measure(name, creds.name, out, src_dir) for _ in range(args.repeat)]
+            best = min(runs, key=lambda r: r['cold_start'] + r['first_use'])
+            print(f'{name:15s} {1000*best["import"]:10.0f} {1000*best["cold_start"]:9.0f} '
+                f'{1000*best["first_use"]:13.0f} {1000*(best["cold_start"] + best["first_use"]):9.0f} '
+                f'{1000*min(r["process"] for r in runs):11.0f}  {", ".join(best["heavy"]) or "-"}')
+    finally:
+        os.remove(creds.name)
@@ -0,0 +1,62 @@
+from version_store import VersionStore, merge_question_data
+from datetime import datetime
+import mongomock
+import argparse, time
+
+
+def make_questions(start, n, choices=4):
+    return [{
+        'q_text': f'Synthetic question number {i}?',
+        'choices': [f'choice {c}' for c in range(choices)],
+        'our_answer': i % choices,
+        'acceptable': [c == i % choices for c in range(choices)],
+        'importance': 1
+    } for i in range(start, start+n)]
+
+
+def legacy_update(db, name, new_qd):
+    """The old add_questions_update_version: rewrite the whole versions map."""
+    record = db.scrapers.find_one({'_id': name})
+    versions = record['versions']
+    dt_now = datetime.now().strftime('%Y%m%d_%H%M%S_%f')
+    versions[dt_now] = merge_question_data(versions[record['current_version']], new_qd)
+    db.scrapers.update_one({'_id': name}, {'$set':
+        {'versions': versions, 'current_version': dt_now}})
+
+
+def bench(updates, per_update, report_every):
+    """
+    Adds updates versions of per_update new questions each with both storage
+    layouts, printing the mean cost of the last report_every updates.
+    """
+    legacy_db = mongomock.MongoClient().okc
+    legacy_db.scrapers.insert_one({'_id': 'bench', 'current_version': 'v0',
+        'versions': {'v0': make_questions(0, per_update)}})
+    store = VersionStore(mongomock.MongoClient().okc, 'bench')
+    store.set_first_version(make_questions(0, per_update))
+
+    print('versions  legacy ms/update  delta ms/update')
+    legacy_t = delta_t = 0.0
+    for i in range(1, updates+1):
+        qd = make_questions(i*per_update, per_update)
+
+        start = time.perf_counter()
+        legacy_update(legacy_db, 'bench', qd)
+        legacy_t += time.perf_counter() - start
+
+        start = time.perf_counter()
+        store.add_version(qd)
+        delta_t += time.perf_counter() - start
+
+        if i % report_every == 0:
+            print(f'{i:8d}  {1000*legacy_t/report_every:16.2f}  {1000*delta_t/report_every:15.2f}')
+            legacy_t = delta_t = 0.0
+
+
+if __name__=='__main__':
+    parser = argparse.ArgumentParser(description='Version update cost as history grows')
+    parser.add_argument('--updates', type=int, default=200)
+    parser.add_argument('--per-update', type=int, default=10)
+    parser.add_argument('--report-every', type=int, default=25)
+    args = parser.parse_args()
+    bench(args.updates, args.per_update, args.report_every)
@@ -0,0 +1,117 @@
+from selenium.common.exceptions import WebDriverException
+import re
+
+#url patterns for Network.setBlockedURLs, * matches anything
+IMAGE_PATTERNS = [f'*.{ext}{q}' for ext in ['jpg', 'jpeg', 'png', 'gif', 'webp', 'avif', 'svg', 'ico']
+    for q in ['', '?*']]
+MEDIA_PATTERNS = [f'*.{ext}{q}' for ext in ['mp4', 'webm', 'm3u8', 'ts', 'mp3', 'ogg']
+    for q in ['', '?*']]
+FONT_PATTERNS = [f'*.{ext}{q}' for ext in ['woff', 'woff2', 'ttf', 'otf', 'eot']
+    for q in ['', '?*']]
+#ad, analytics and social hosts the pages pull in that scraping never needs
+THIRD_PARTY_HOSTS = ['doubleclick.net', 'googlesyndication.com', 'googletagmanager.com',
+    'google-analytics.com', 'googleadservices.com', 'facebook.net', 'connect.facebook.com',
+    'hotjar.com', 'branch.io', 'amplitude.com', 'segment.io', 'sentry.io', 'adnxs.com',
+    'amazon-adsystem.com', 'criteo.com', 'taboola.com']
+
+#browser features a scraping session has no use for
+CHROME_ARGS = ['--disable-extensions', '--disable-background-networking',
+    '--disable-component-update', '--disable-default-apps', '--disable-sync',
+    '--disable-client-side-phishing-detection', '--disable-notifications', '--mute-audio',
+    '--no-first-run', '--no-default-browser-check', '--autoplay-policy=user-gesture-required',
+    '--disable-features=Translate,MediaRouter,OptimizationHints,InterestFeedContentSuggestions']
+
+
+class ResourcePolicy:
+    """
+    What a scraper's browser is allowed to load. Images, media, fonts and
+    third-party hosts are blocked through the DevTools protocol, so pages
+    render their html and scripts without fetching anything the scraper
+    doesn't read. Blocking doesn't touch the html, so img src and data-src
+    attributes stay readable for get_src and read_profile_signals; images
+    themselves are downloaded separately by the ImagePipeline.
+
+    Pages that need something blocked, e.g. a lazy loader that only fills
+    in src once its images load, can be given an allow-list: patterns
+    matching the page's path, mapped to the blocked url patterns to let
+    through on it.
+
+    Attributes:
+        blocked (list): url patterns blocked on every page not allowing them
+        allow (list): (compiled path regex, set of patterns) pairs
+        eager (bool): return from page loads once the DOM is ready instead of
+            waiting for every subresource
+        chrome_args (list): extra Chrome command line switches
+    """
+
+    def __init__(self, images=True, media=True, fonts=True, third_party=True,
+            extra_blocked=(), allow=None, eager=True, chrome_args=CHROME_ARGS):
+        """
+        Constructor for the ResourcePolicy class
+
+        Parameters:
+            images (bool): block images
+            media (bool): block audio and video
+            fonts (bool): block web fonts
+            third_party (bool): block the hosts in THIRD_PARTY_HOSTS
+            extra_blocked (list): more url patterns to block
+            allow (dict): path regex -> url patterns not to block on matching
+                pages, e.g. {r'^/profile/[^/]+$': ['*.jpg']}
+            eager (bool): use the eager page load strategy
+            chrome_args (list): extra Chrome command line switches
+        """
+        self.blocked = []
+        if images:
+            self.blocked.extend(IMAGE_PATTERNS)
+        if media:
+            self.blocked.extend(MEDIA_PATTERNS)
+        if fonts:
+            self.blocked.extend(FONT_PATTERNS)
+        if third_party:
+            self.blocked.extend(f'*://*{host}/*' for host in THIRD_PARTY_HOSTS)
+        self.blocked.extend(extra_blocked)
+        self.allow = [(re.compile(path), set(patterns)) for path, patterns in (allow or dict()).items()]
+        self.eager = eager
+        self.chrome_args = list(chrome_args)
+
+    def configure(self, opt):
+        """Adds the policy's switches and page load strategy to Chrome Options."""
+        for arg in self.chrome_args:
+            opt.add_argument(arg)
+        if self.eager:
+            opt.set_capability('pageLoadStrategy', 'eager')
+
+    def patterns_for(self, path):
+        """Returns the url patterns to block while on path."""
+        allowed = set()
+        for regex, patterns in self.allow:
+            if regex.search(path):
+                allowed |= patterns
+        return [p for p in self.blocked if p not in allowed]
+
+    def attach(self, driver):
+        """
+        Starts blocking on a new driver. Returns a BlockedUrls tracking what
+        the driver currently blocks, or None if the driver doesn't speak the
+        DevTools protocol, in which case pages load everything.
+        """
+        try:
+            driver.execute_cdp_cmd('Network.enable', dict())
+        except (WebDriverException, AttributeError):
+            return None
+        blocking = BlockedUrls(driver)
+        blocking.set(self.blocked)
+        return blocking
+
+
+class BlockedUrls:
+    """The url patterns a driver is blocking, only re-sent when they change."""
+
+    def __init__(self, driver):
+        self.driver = driver
+        self.patterns = None
+
+    def set(self, patterns):
+        if patterns != self.patterns:
+            self.driver.execute_cdp_cmd('Network.setBlockedURLs', {'urls': patterns})
+            self.patterns = patterns
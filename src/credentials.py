@@ -0,0 +1,28 @@
+import csv
+
+DEFAULT_CREDENTIALS_PATH = 'src/okc_account_credentials'
+
+
+def read_credentials(path=DEFAULT_CREDENTIALS_PATH):
+    """
+    Reads the scraper accounts file, a csv with a header row whose first
+    column is the alias, followed by email and pw.
+
+    Returns:
+        dict of alias -> {'email': ..., 'pw': ...}, in file order
+    """
+    with open(path, newline='') as f:
+        reader = csv.reader(f)
+        header = next(reader)
+        return {row[0]: dict(zip(header[1:], row[1:])) for row in reader if row}
+
+
+def read_account(alias, path=DEFAULT_CREDENTIALS_PATH):
+    """Returns (email, pw) for alias. Raises KeyError if it isn't in the file."""
+    account = read_credentials(path)[alias]
+    return account['email'], account['pw']
+
+
+def read_aliases(path=DEFAULT_CREDENTIALS_PATH):
+    """Returns the scraper account aliases in the credentials file."""
+    return list(read_credentials(path))
@@ -0,0 +1,367 @@
+"""
+Streams the scraped data in Mongo out to Parquet for analysis.
+
+Each run writes one file per table under <out>/<table>/run=<run id>/, so
+pandas.read_parquet('<out>/<table>') or pyarrow.dataset read every run as one
+table with a run column. Documents are read through batched cursors and
+written a row group at a time, so memory is bounded by the batch size, not
+the collection.
+
+The images table streams the ImagePipeline manifests line by line, so it
+is bounded the same way.
+
+Incremental runs only export documents added or changed since the last run,
+going by the time each document was queued for writing: written for users,
+time for scraper versions and changed for usernames, whose status changes
+are exported again, so a username's row in the latest run is current.
+Manifest entries go by the time the image was saved. Writes land a little
+after they're queued, so each run only exports what was queued up to a
+cutoff settle seconds before it started, and the next run picks up after
+that cutoff, kept per source in <out>/_export_state.json. A write queued
+before the cutoff but landing after the export read past it would otherwise
+be missed. Documents and manifest entries from before these times were
+recorded are only exported by a full run.
+"""
+from pymongo import MongoClient
+from parse_profiles import parse_user_document
+from html_store import HtmlStore
+from question_catalog import QuestionCatalog
+from datetime import datetime
+import pyarrow as pa
+import pyarrow.parquet as pq
+import argparse, json, os, time
+
+TABLES = ['profiles', 'answers', 'images', 'versions', 'usernames']
+
+#source -> (field its entries are stamped with when queued, whether it's utc).
+#sources are collections, and 'images' for the manifests
+MARKS = {'users': ('written', True), 'scraper_versions': ('time', False),
+    'usernames': ('changed', True), 'images': ('time', True)}
+
+SCHEMAS = {
+    'profiles': pa.schema([
+        ('username', pa.string()),
+        ('scrape_time', pa.string()),
+        ('scraper', pa.string()),
+        ('scraper_version', pa.string()),
+        ('img_count', pa.int32()),
+        ('n_agree', pa.int32()),
+        ('n_disagree', pa.int32()),
+        ('essays', pa.list_(pa.struct([('title', pa.string()), ('text', pa.string())]))),
+        ('details', pa.list_(pa.string())),
+        ('html', pa.string())
+    ]),
+    'answers': pa.schema([
+        ('username', pa.string()),
+        ('filter', pa.string()),
+        ('q_text', pa.string()),
+        ('their_answer', pa.string()),
+        ('our_answer', pa.string()),
+        ('explanation', pa.string())
+    ]),
+    'images': pa.schema([
+        ('username', pa.string()),
+        ('hash', pa.string()),
+        ('url', pa.string()),
+        ('time', pa.timestamp('us'))
+    ]),
+    'versions': pa.schema([
+        ('scraper', pa.string()),
+        ('version', pa.string()),
+        ('parent', pa.string()),
+        ('q_text', pa.string()),
+        ('choices', pa.list_(pa.string())),
+        ('our_answer', pa.int32()),
+        ('acceptable', pa.list_(pa.bool_())),
+        ('importance', pa.int32())
+    ]),
+    'usernames': pa.schema([
+        ('username', pa.string()),
+        ('added', pa.timestamp('us')),
+        ('status', pa.string()),
+        ('attempts', pa.int32()),
+        ('finished', pa.timestamp('us')),
+        ('changed', pa.timestamp('us'))
+    ])
+}
+
+
+class TableWriter:
+    """
+    Buffers rows for one table and writes them to its Parquet file a row
+    group at a time. The file is only created once there is a row to write.
+
+    Attributes:
+        rows (int): rows written so far
+    """
+
+    def __init__(self, path, schema, batch_size):
+        self.path = path
+        self.schema = schema
+        self.batch_size = batch_size
+        self.rows = 0
+        self._buffer = []
+        self._writer = None
+
+    def add(self, row):
+        self._buffer.append(row)
+        if len(self._buffer) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        if not self._buffer:
+            return
+        if self._writer is None:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            self._writer = pq.ParquetWriter(self.path, self.schema, compression='zstd')
+        self._writer.write_table(pa.Table.from_pylist(self._buffer, self.schema))
+        self.rows += len(self._buffer)
+        self._buffer = []
+
+    def close(self):
+        self.flush()
+        if self._writer is not None:
+            self._writer.close()
+
+
+class Exporter:
+    """
+    Exports db collections to partitioned Parquet tables, see the module
+    docstring for the layout.
+
+    Attributes:
+        db (pymongo.database.Database): okc database
+        out_dir (str): root directory of the tables
+        run_id (str): partition this run writes to
+        settle (float): seconds a queued write is given to land before it's exported
+        state (dict): source -> {until: cutoff} from the previous runs
+        stats (dict): table -> (rows, seconds) for this run
+    """
+
+    def __init__(self, db, out_dir, batch_size=5000, include_html=False, image_dirs=(),
+            settle=600):
+        """
+        Constructor for the Exporter class
+
+        Parameters:
+            db (pymongo.database.Database): okc database
+            out_dir (str): root directory of the tables
+            batch_size (int): documents per cursor batch and rows per row group
+            include_html (bool): also export each profile's raw html
+            image_dirs (list): ImagePipeline save directories whose manifests
+                make up the images table
+            settle (float): seconds a queued write is given to land, which
+                must cover the BulkWriters' max_delay and any retries
+        """
+        self.db = db
+        self.out_dir = out_dir
+        self.batch_size = batch_size
+        self.include_html = include_html
+        self.image_dirs = list(image_dirs)
+        self.settle = settle
+        self.run_id = datetime.now().strftime('%Y%m%d_%H%M%S')
+        self.state_path = os.path.join(out_dir, '_export_state.json')
+        self.state = dict()
+        if os.path.exists(self.state_path):
+            with open(self.state_path) as f:
+                self.state = json.load(f)
+        self.stats = dict()
+        self._html = None
+        self._catalog = None
+        self._cutoffs = dict()
+
+    def _writer(self, table):
+        return TableWriter(os.path.join(self.out_dir, table, f'run={self.run_id}',
+            'part-0.parquet'), SCHEMAS[table], self.batch_size)
+
+    def _bounds(self, source, incremental):
+        """Returns (previous run's cutoff or None for everything, this run's cutoff)."""
+        until = self.state.get(source, dict()).get('until')
+        if not incremental or until is None:
+            return None, self._cutoffs[source]
+        return datetime.fromisoformat(until), self._cutoffs[source]
+
+    def _since(self, collection, incremental):
+        """
+        Returns the query for the collection's documents queued up to this
+        run's cutoff and, if incremental, after the previous run's.
+        """
+        field = MARKS[collection][0]
+        since, cutoff = self._bounds(collection, incremental)
+        if since is not None:
+            return {field: {'$gt': since, '$lte': cutoff}}
+        #$not also matches documents from before the field was recorded
+        return {field: {'$not': {'$gt': cutoff}}}
+
+    def _cursor(self, collection, query, projection=None):
+        return self.db[collection].find(query, projection, batch_size=self.batch_size,
+            no_cursor_timeout=True)
+
+    def export_users(self, incremental):
+        """Writes the profiles and answers tables from db.users."""
+        profiles, answers = self._writer('profiles'), self._writer('answers')
+        cursor = self._cursor('users', self._since('users', incremental))
+        try:
+            for doc in cursor:
+                if 'storage' in doc:
+                    if self._html is None:
+                        self._html = HtmlStore(self.db, dict_id=0)
+                    doc = self._html.unpack_user(doc)
+                parsed = doc.get('parsed')
+                if parsed is None:
+                    parsed = parse_user_document(doc)[1]
+                metadata = doc.get('metadata') or dict()
+                questions = doc.get('questions') or dict()
+                profiles.add({
+                    'username': doc['_id'],
+                    'scrape_time': metadata.get('time'),
+                    'scraper': metadata.get('scraper'),
+                    'scraper_version': metadata.get('scraper_version'),
+                    'img_count': doc.get('img_count'),
+                    'n_agree': len(questions.get('AGREE') or []),
+                    'n_disagree': len(questions.get('DISAGREE') or []),
+                    'essays': parsed['essays'],
+                    'details': parsed['details'],
+                    'html': doc.get('html') if self.include_html else None
+                })
+                for q in parsed['questions']:
+                    answers.add({
+                        'username': doc['_id'],
+                        'filter': 'AGREE' if q['agree'] else 'DISAGREE',
+                        'q_text': q['q_text'],
+                        'their_answer': q['their_answer'],
+                        'our_answer': q['our_answer'],
+                        'explanation': q['explanation']
+                    })
+        finally:
+            cursor.close()
+            profiles.close()
+            answers.close()
+        return {'profiles': profiles.rows, 'answers': answers.rows}
+
+    def export_images(self, incremental):
+        """Writes the images table from the manifests in image_dirs."""
+        images = self._writer('images')
+        since, cutoff = self._bounds('images', incremental)
+        try:
+            for save_dir in self.image_dirs:
+                from images import iter_manifests
+                for entry in iter_manifests(save_dir):
+                    if entry['time'] is None:
+                        #saved before times were recorded, so only full runs have it
+                        if since is not None:
+                            continue
+                        saved = None
+                    else:
+                        saved = datetime.fromisoformat(entry['time'])
+                        if saved > cutoff or since is not None and saved <= since:
+                            continue
+                    images.add({'username': entry['username'], 'hash': entry['hash'],
+                        'url': entry['url'], 'time': saved})
+        finally:
+            images.close()
+        return {'images': images.rows}
+
+    def export_versions(self, incremental):
+        """Writes the versions table, one row per question in each version's delta."""
+        versions = self._writer('versions')
+        cursor = self._cursor('scraper_versions', self._since('scraper_versions', incremental))
+        try:
+            for doc in cursor:
+                delta = doc['delta']
+                if doc.get('format') == 'compact':
+                    if self._catalog is None:
+                        self._catalog = QuestionCatalog(self.db)
+                    delta = self._catalog.decode(delta)
+                for q in delta:
+                    versions.add({
+                        'scraper': doc['scraper'],
+                        'version': doc['version'],
+                        'parent': doc['parent'],
+                        'q_text': q['q_text'],
+                        'choices': q['choices'],
+                        'our_answer': q['our_answer'],
+                        'acceptable': q['acceptable'],
+                        'importance': q['importance']
+                    })
+        finally:
+            cursor.close()
+            versions.close()
+        return {'versions': versions.rows}
+
+    def export_usernames(self, incremental):
+        """Writes the usernames table with each username's work queue status."""
+        usernames = self._writer('usernames')
+        cursor = self._cursor('usernames', self._since('usernames', incremental))
+        try:
+            for doc in cursor:
+                usernames.add({
+                    'username': doc['_id'],
+                    'added': doc.get('added'),
+                    'status': doc.get('status'),
+                    'attempts': doc.get('attempts'),
+                    'finished': doc.get('finished'),
+                    'changed': doc.get('changed')
+                })
+        finally:
+            cursor.close()
+            usernames.close()
+        return {'usernames': usernames.rows}
+
+    def run(self, tables=TABLES, incremental=True):
+        """
+        Exports the requested tables and saves the new cutoffs once every one
+        of them has been written.
+
+        Returns:
+            dict of table -> (rows, seconds)
+        """
+        #one instant on both clocks, so every source is cut at the same time
+        started = time.time() - self.settle
+        self._cutoffs = {source: datetime.utcfromtimestamp(started) if utc else
+            datetime.fromtimestamp(started) for source, (_, utc) in MARKS.items()}
+        steps = [
+            (self.export_users, {'profiles', 'answers'}, 'users'),
+            (self.export_images, {'images'}, 'images'),
+            (self.export_versions, {'versions'}, 'scraper_versions'),
+            (self.export_usernames, {'usernames'}, 'usernames')
+        ]
+        done = []
+        for export, names, source in steps:
+            if not names & set(tables):
+                continue
+            start = time.perf_counter()
+            rows = export(incremental)
+            elapsed = time.perf_counter() - start
+            for table, n in rows.items():
+                self.stats[table] = (n, elapsed)
+            done.append(source)
+
+        for source in done:
+            self.state[source] = {'until': self._cutoffs[source].isoformat()}
+        os.makedirs(self.out_dir, exist_ok=True)
+        tmp = self.state_path + '.tmp'
+        with open(tmp, 'w') as f:
+            json.dump(self.state, f)
+        os.replace(tmp, self.state_path)
+        return self.stats
+
+
+if __name__=='__main__':
+    parser = argparse.ArgumentParser(description='Export scraped data to Parquet')
+    parser.add_argument('out_dir')
+    parser.add_argument('--tables', nargs='+', default=TABLES, choices=TABLES)
+    parser.add_argument('--full', action='store_true',
+        help='export everything, not just what changed since the last run')
+    parser.add_argument('--batch-size', type=int, default=5000)
+    parser.add_argument('--html', action='store_true', help='include raw profile html')
+    parser.add_argument('--images', nargs='*', default=[],
+        help='image save directories whose manifests to export')
+    parser.add_argument('--settle', type=float, default=600,
+        help='seconds queued writes get to land before they are exported, 0 once scrapers are done')
+    args = parser.parse_args()
+
+    exporter = Exporter(MongoClient('localhost', 27017).okc, args.out_dir, args.batch_size,
+        args.html, args.images, args.settle)
+    for table, (rows, seconds) in exporter.run(args.tables, not args.full).items():
+        print(f'{table:10s} {rows:9d} rows {seconds:7.1f}s {rows/max(seconds, 1e-9):9.0f} rows/s')
@@ -0,0 +1,257 @@
+"""
+Batch extraction of question data from the page.
+
+Reading a question through WebElements costs one chromedriver round trip per
+find/text/attribute call, which adds up to thousands of calls on a profile
+with hundreds of questions. The functions here run a single script in the
+page instead and return plain Python data with the same shape the
+WebElement based code produced.
+"""
+import hashlib
+
+#collects every .profile-question from index arguments[0] on. for each one it
+#reads the question text, the self-view answer choices with their flags, and
+#the raw innerHTML, so the same call serves both the self view and other
+#users' question lists.
+QUESTIONS_JS = """
+var start = arguments[0] || 0;
+var wantHtml = arguments[1];
+var hasSuffix = function(el, suffix) {
+    var cls = el.getAttribute('class') || '';
+    return cls.split(/\\s+/).some(function(c) { return c.endsWith(suffix); });
+};
+var stubs = document.getElementsByClassName('profile-question');
+var out = [];
+for (var i = start; i < stubs.length; i++) {
+    var stub = stubs[i];
+    var h3 = stub.getElementsByTagName('h3')[0];
+    var answers = stub.getElementsByClassName('profile-question-self-answers-answer');
+    var choices = [], ours = [], acceptable = [];
+    for (var j = 0; j < answers.length; j++) {
+        choices.push(answers[j].innerText.trim());
+        ours.push(hasSuffix(answers[j], '--isYourAnswer'));
+        acceptable.push(!hasSuffix(answers[j], '--isUnacceptable'));
+    }
+    out.push({
+        q_text: h3 ? h3.innerText.trim() : null,
+        choices: choices,
+        ours: ours,
+        acceptable: acceptable,
+        html: wantHtml ? stub.innerHTML : null
+    });
+}
+return out;
+"""
+
+
+def _stub_to_question_data(raw):
+    """
+    Converts one raw stub from QUESTIONS_JS to the question data dict
+    produced by Scraper.get_data_from_answer_stub.
+    """
+    ours = raw['ours']
+    return {                                                  \
+        'q_text': raw['q_text'],                              \
+        'choices': raw['choices'],                            \
+        'our_answer': ours.index(True) if True in ours else None, \
+        'acceptable': raw['acceptable'],                      \
+        'importance': 1                                       \
+    }
+
+
+def extract_raw_questions(driver, start=0, html=False):
+    """
+    Reads every question stub on the page in one script call.
+
+    Parameters:
+        driver (WebDriver): driver showing a questions list
+        start (int): index of the first .profile-question to read, so callers
+            that already read the earlier ones can skip them
+        html (bool): whether to include each stub's innerHTML
+
+    Returns:
+        list of dicts with keys q_text, choices, ours, acceptable and html
+    """
+    return driver.execute_script(QUESTIONS_JS, start, html)
+
+
+def extract_self_questions(driver, start=0):
+    """
+    Reads the scraper's own answered questions from the self-view question
+    list in one script call.
+
+    Parameters:
+        driver (WebDriver): driver showing the scraper's questions
+        start (int): index of the first .profile-question to read
+
+    Returns:
+        list of question data dicts, same shape as get_data_from_answer_stub
+    """
+    return [_stub_to_question_data(raw) for raw in extract_raw_questions(driver, start)]
+
+
+def extract_question_html(driver, start=0):
+    """
+    Reads the innerHTML of every question stub on another user's question
+    list in one script call.
+
+    Parameters:
+        driver (WebDriver): driver showing a user's questions
+        start (int): index of the first .profile-question to read
+
+    Returns:
+        list of innerHTML strings, same as scrape_user_questions_by_filter
+    """
+    return [raw['html'] for raw in extract_raw_questions(driver, start, html=True)]
+
+
+def count_questions(driver):
+    """Returns how many .profile-question elements are on the page, in one call."""
+    return driver.execute_script(
+        "return document.getElementsByClassName('profile-question').length;")
+
+
+#reads data-username from match cards at index arguments[0] onward, plus the
+#card count and whether either end state is showing. scrolls the last card
+#into view afterwards if arguments[2] is set, so the next page starts loading.
+MATCH_CARDS_JS = """
+var start = arguments[0], wantNames = arguments[1], scroll = arguments[2];
+var cards = document.getElementsByClassName('usercard-thumb');
+var names = [];
+if (wantNames) {
+    for (var i = start; i < cards.length; i++) {
+        names.push(cards[i].getAttribute('data-username'));
+    }
+}
+if (scroll && cards.length) cards[cards.length-1].scrollIntoView();
+return {
+    usernames: names,
+    count: cards.length,
+    blank: document.getElementsByClassName('blank-state-wrapper').length > 0,
+    error: document.getElementsByClassName('match-results-error').length > 0
+};
+"""
+
+
+def read_match_cards(driver, start=0, names=True, scroll=False):
+    """
+    Reads the match page's cards from index start onward in one script call.
+
+    Parameters:
+        driver (WebDriver): driver showing the match page
+        start (int): index of the first card to read usernames from
+        names (bool): whether to read usernames at all, or just the state
+        scroll (bool): scroll the last card into view afterwards
+
+    Returns:
+        dict with usernames (list), count (total cards), blank and error
+        (whether blank-state-wrapper / match-results-error are showing)
+    """
+    return driver.execute_script(MATCH_CARDS_JS, start, names, scroll)
+
+
+#reads the text of every essay, including ones still hidden behind the
+#expander, and the src (or lazy data-src) of the thumbnail and essay images.
+PROFILE_SIGNALS_JS = """
+var essays = Array.prototype.map.call(document.getElementsByClassName('profile-essay'),
+    function(e) { return e.textContent.trim(); });
+var images = [];
+['profile-thumb', 'profile-essays'].forEach(function(cls) {
+    var box = document.getElementsByClassName(cls)[0];
+    if (!box) return;
+    Array.prototype.forEach.call(box.getElementsByTagName('img'), function(img) {
+        images.push(img.getAttribute('src') || img.getAttribute('data-src'));
+    });
+});
+return {essays: essays, images: images};
+"""
+
+
+def read_profile_signals(driver):
+    """
+    Reads the cheap-to-get parts of an open profile in one script call,
+    without expanding the essays.
+
+    Parameters:
+        driver (WebDriver): driver showing a user's profile
+
+    Returns:
+        dict with essay_hash (sha256 of the essays' text) and image_urls
+    """
+    raw = driver.execute_script(PROFILE_SIGNALS_JS)
+    return {
+        'essay_hash': hashlib.sha256('\x1f'.join(raw['essays']).encode()).hexdigest(),
+        'image_urls': raw['images']
+    }
+
+
+#answers the open question overlay in one call: picks our answer as
+#floor(arguments[0] * choices), accepts only that answer from matches, clicks
+#importance button arguments[1] and submits if both selections registered.
+#returns null while the overlay's buttons haven't rendered.
+ANSWER_OVERLAY_JS = """
+var u = arguments[0], importance = arguments[1];
+var overlay = document.getElementsByClassName('questionspage')[0];
+if (!overlay) return null;
+var within = function(cls, tag) {
+    var box = overlay.getElementsByClassName(cls)[0];
+    return box ? box.getElementsByTagName(tag) : [];
+};
+var ours = within('pickonebutton-buttons', 'button');
+var theirs = within('pickmanybuttons', 'button');
+var imps = within('importance-pickonebutton', 'button');
+var submit = document.getElementsByClassName('questionspage-buttons-button--answer')[0];
+var h1 = overlay.getElementsByTagName('h1')[0];
+if (!ours.length || theirs.length < ours.length || imps.length <= importance || !submit || !h1)
+    return null;
+var selected = function(b) { return (b.getAttribute('class') || '').endsWith('--selected'); };
+var choices = Array.prototype.map.call(ours, function(b) { return b.innerText.trim(); });
+var answer = Math.floor(u * choices.length);
+ours[answer].click();
+theirs[answer].click();
+imps[importance].click();
+var submitted = selected(ours[answer]) && selected(imps[importance]);
+if (submitted) submit.click();
+return {q_text: h1.innerText.trim(), choices: choices, answer: answer, submitted: submitted};
+"""
+
+#whether the overlay shows our answer arguments[0] and importance arguments[1] selected
+OVERLAY_SELECTED_JS = """
+var overlay = document.getElementsByClassName('questionspage')[0];
+if (!overlay) return false;
+var selected = function(b) { return !!b && (b.getAttribute('class') || '').endsWith('--selected'); };
+var imps = overlay.getElementsByClassName('importance-pickonebutton')[0];
+return selected(overlay.getElementsByClassName('pickonebutton-button')[arguments[0]]) &&
+    !!imps && selected(imps.getElementsByTagName('button')[arguments[1]]);
+"""
+
+
+def answer_overlay(driver, u, importance):
+    """
+    Reads and answers the open question overlay in one script call.
+
+    Parameters:
+        driver (WebDriver): driver showing the question overlay
+        u (float): uniform random number in [0, 1) choosing our answer
+        importance (int): index of the importance button to click
+
+    Returns:
+        dict with q_text, choices, answer (index clicked) and submitted
+        (whether the selections registered and the form was submitted),
+        or None if the overlay isn't ready yet
+    """
+    return driver.execute_script(ANSWER_OVERLAY_JS, u, importance)
+
+
+def overlay_selected(driver, answer, importance):
+    """Returns whether the overlay shows the answer and importance selected, in one call."""
+    return driver.execute_script(OVERLAY_SELECTED_JS, answer, importance)
+
+
+def overlay_question(driver):
+    """Returns the text of the open overlay's question, or None if it's closed, in one call."""
+    return driver.execute_script("""
+        var overlay = document.getElementsByClassName('questionspage')[0];
+        var h1 = overlay && overlay.getElementsByTagName('h1')[0];
+        return h1 ? h1.innerText.trim() : null;
+    """)
@@ -0,0 +1,299 @@
+"""
+Plain HTTP fetching for the pages a scraper only needs to read.
+
+A FetchBackend is given the cookies of a logged-in driver and fetches pages
+with a pooled aiohttp client on an event loop in a background thread, so
+the (synchronous) Scraper can submit a page and keep using the browser
+while it downloads. Concurrency is bounded and every request waits on a
+rate limit, either its own or the pool-wide one the scraper's page loads
+already use.
+
+Pages are only useful over HTTP if their data is in the html the server
+sends. The parse functions here return None for pages that don't have it,
+e.g. question lists the site renders client-side or a redirect to the login
+form, and raise NeedsBrowser for a page that has it but needs something
+only the browser can do, like answering questions first. Either way the
+scraper loads the page in the browser instead.
+"""
+from concurrent.futures import Future
+from lxml import html as lxml_html
+from yarl import URL
+import aiohttp, asyncio, hashlib, threading, time, traceback
+
+
+#requests per minute a backend allows itself when it isn't given a shared rate limiter
+DEFAULT_RPM = 60
+
+
+class NeedsBrowser(Exception):
+    """Raised by a parse function when this one page has to go through the browser."""
+
+
+class AsyncRateLimiter:
+    """Spaces requests at most one per 60/rpm seconds, within one event loop."""
+
+    def __init__(self, rpm):
+        self.interval = 60.0 / rpm
+        self._next = 0.0
+        self._lock = None
+
+    async def acquire(self):
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        loop = asyncio.get_running_loop()
+        async with self._lock:
+            now = loop.time()
+            start = max(now, self._next)
+            self._next = start + self.interval
+        if start > now:
+            await asyncio.sleep(start - now)
+
+
+class FetchBackend:
+    """
+    Fetches pages of the site over HTTP with a logged-in driver's cookies.
+
+    Attributes:
+        base_url (str): site the pages are fetched from
+        concurrency (int): requests in flight at once at most
+        browser_only (set): page kinds found to need the browser, which
+            aren't fetched again this session
+        stats (dict): kind -> {fetched, fallback, fetch_errors, parse_errors,
+            bytes, seconds}, where fallbacks include the errors
+    """
+
+    def __init__(self, base_url, cookies, user_agent=None, concurrency=8, rpm=DEFAULT_RPM,
+            rate_limiter=None, timeout=30, metrics=None):
+        """
+        Constructor for the FetchBackend class. Starts the event loop thread
+        and opens the client.
+
+        Parameters:
+            base_url (str): site to fetch from, without a trailing slash
+            cookies (list): cookie dicts as returned by driver.get_cookies()
+            user_agent (str): User-Agent header, e.g. the browser's own
+            concurrency (int): requests in flight at once at most
+            rpm (float): requests per minute allowed if rate_limiter isn't
+                given, or None for no limit, e.g. against a local fixture site
+            rate_limiter: object with a blocking acquire() shared with the
+                browser's page loads, e.g. a pool's SharedRateLimiter
+            timeout (float): seconds before a request is given up on
+            metrics (Metrics): counts fetches and fallbacks if given
+        """
+        self.base_url = base_url
+        self.concurrency = concurrency
+        self.rate_limiter = rate_limiter
+        self.browser_only = set()
+        self.stats = dict()
+        self.metrics = metrics
+        self._async_limiter = AsyncRateLimiter(rpm) if rpm and rate_limiter is None else None
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever, name='fetch', daemon=True)
+        self._thread.start()
+        self._session = self._call(self._open(cookies, user_agent, timeout))
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_scraper(cls, scraper, **kwargs):
+        """
+        Builds a backend sharing a logged-in scraper's cookies, user agent,
+        rate limiter and metrics. A scraper without a rate limiter gets a
+        backend limited to DEFAULT_RPM.
+        """
+        kwargs.setdefault('rate_limiter', scraper.rate_limiter)
+        kwargs.setdefault('metrics', scraper.metrics)
+        return cls(scraper.base_url, scraper.driver.get_cookies(),
+            scraper.driver.execute_script('return navigator.userAgent;'), **kwargs)
+
+    def _call(self, coro):
+        return asyncio.run_coroutine_threadsafe(coro, self._loop).result()
+
+    async def _open(self, cookies, user_agent, timeout):
+        self._semaphore = asyncio.Semaphore(self.concurrency)
+        #unsafe lets the jar keep cookies for ip hosts, like a local fixture site
+        jar = aiohttp.CookieJar(unsafe=True)
+        url = URL(self.base_url)
+        for cookie in cookies:
+            jar.update_cookies({cookie['name']: cookie['value']}, url)
+        headers = {'User-Agent': user_agent} if user_agent else None
+        return aiohttp.ClientSession(cookie_jar=jar, headers=headers,
+            connector=aiohttp.TCPConnector(limit=self.concurrency),
+            timeout=aiohttp.ClientTimeout(total=timeout))
+
+    async def _fetch(self, path):
+        async with self._semaphore:
+            if self.rate_limiter is not None:
+                await asyncio.get_running_loop().run_in_executor(None, self.rate_limiter.acquire)
+            elif self._async_limiter is not None:
+                await self._async_limiter.acquire()
+            async with self._session.get(self.base_url + path) as resp:
+                return resp.status, resp.url.path, await resp.text(errors='replace')
+
+    def submit(self, path):
+        """
+        Starts fetching a path under base_url.
+
+        Returns:
+            concurrent.futures.Future of (status, final path after
+            redirects, body text)
+        """
+        return asyncio.run_coroutine_threadsafe(self._fetch(path), self._loop)
+
+    def page(self, kind, path, parse):
+        """
+        Starts fetching a page of a kind and parsing it, unless pages of that
+        kind already turned out to need the browser.
+
+        Parameters:
+            kind (str): kind of page, e.g. 'profile'
+            path (str): path under base_url
+            parse (function): takes (status, final path, body) and returns
+                the page's data, None if pages of this kind need the browser,
+                or raises NeedsBrowser if just this one does
+
+        Returns:
+            Future of the parsed data, or of None if the browser has to load
+            the page. Network errors and exceptions in parse also come out as
+            None; the latter are printed and counted as parse errors.
+        """
+        out = Future()
+        if kind in self.browser_only:
+            out.set_result(None)
+            return out
+        start = time.perf_counter()
+
+        def done(fetched):
+            result, data, outcome = None, None, 'ok'
+            try:
+                result = fetched.result()
+                data = parse(*result)
+            except (aiohttp.ClientError, asyncio.TimeoutError):
+                #the browser can still get the page; never fail the scrape over a fetch
+                outcome = 'fetch_error'
+            except NeedsBrowser:
+                outcome = 'needs_browser'
+            except Exception as e:
+                if result is None:
+                    out.set_exception(e)
+                    return
+                #a bug in the parser rather than a problem with the page, so say so
+                traceback.print_exc()
+                outcome = 'parse_error'
+            if outcome == 'ok' and data is None:
+                outcome = 'fallback'
+            self._record(kind, result, time.perf_counter() - start, outcome)
+            out.set_result(data)
+        self.submit(path).add_done_callback(done)
+        return out
+
+    def _record(self, kind, result, seconds, outcome):
+        with self._lock:
+            stat = self.stats.setdefault(kind, {'fetched': 0, 'fallback': 0, 'fetch_errors': 0,
+                'parse_errors': 0, 'bytes': 0, 'seconds': 0.0})
+            stat['fetched' if outcome == 'ok' else 'fallback'] += 1
+            if outcome in ('fetch_error', 'parse_error'):
+                stat[outcome + 's'] += 1
+            stat['seconds'] += seconds
+            if result is not None:
+                stat['bytes'] += len(result[2])
+            #a page served fine but without its data won't have it next time either
+            if outcome == 'fallback' and result[0] == 200 and not result[1].endswith('/login'):
+                self.browser_only.add(kind)
+        if self.metrics is not None:
+            self.metrics.inc('fetches', kind=kind, result=outcome)
+            self.metrics.observe('fetch_seconds', seconds, kind=kind)
+
+    def close(self):
+        """Closes the client and stops the event loop thread."""
+        if self._loop.is_closed():
+            return
+        self._call(self._session.close())
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+        self._loop.close()
+
+
+def _page_tree(status, path, body, marker):
+    """Parses a 200 response that wasn't redirected to login and contains marker."""
+    if status != 200 or path.endswith('/login') or marker not in body:
+        return None
+    return lxml_html.fromstring(body)
+
+
+def _by_class(node, cls):
+    """Returns the elements under node with cls among their classes."""
+    return node.xpath(f'.//*[contains(concat(" ", normalize-space(@class), " "), " {cls} ")]')
+
+
+def _inner_html(node):
+    return (node.text or '') + ''.join(lxml_html.tostring(c, encoding='unicode') for c in node)
+
+
+def parse_profile_page(status, path, body):
+    """
+    Reads a fetched profile the way scrape_user reads one in the browser.
+
+    Returns:
+        (html, signals) where signals has essay_hash and image_urls as from
+        extract.read_profile_signals, or None if the response isn't a
+        server-rendered profile
+    """
+    tree = _page_tree(status, path, body, 'profile-thumb')
+    if tree is None:
+        return None
+    essays = [e.text_content().strip() for e in _by_class(tree, 'profile-essay')]
+    images = []
+    for cls in ['profile-thumb', 'profile-essays']:
+        boxes = _by_class(tree, cls)
+        if boxes:
+            images.extend(img.get('src') or img.get('data-src') for img in boxes[0].iter('img'))
+    return body, {
+        'essay_hash': hashlib.sha256('\x1f'.join(essays).encode()).hexdigest(),
+        'image_urls': images
+    }
+
+
+def _filter_counts(tree):
+    """
+    Reads the question filter counters the way waits.filter_counts does, as
+    label -> count for each label followed by a number, in page order.
+    """
+    boxes = _by_class(tree, 'profile-questions-filters')
+    if not boxes:
+        return {}
+    arr = [t.strip() for t in boxes[0].itertext() if t.strip()]
+    return {label: int(value) for label, value in zip(arr, arr[1:]) if value.isdigit()}
+
+
+def parse_question_page(status, path, body):
+    """
+    Reads the AGREE and DISAGREE questions from a fetched question page,
+    from the filter counters and .profile-question stubs the browser path
+    reads. The browser shows one filter at a time, so the html only has the
+    data if it lists every filter's stubs, in the counters' order: the page
+    is used only if the number of stubs matches the counters.
+
+    Returns:
+        dict of filter label -> list of question innerHTML strings, as from
+        Scraper.scrape_user_questions, or None if the page doesn't list them
+        all in its html
+
+    Raises:
+        NeedsBrowser: if the FIND OUT counter shows questions to answer first
+    """
+    tree = _page_tree(status, path, body, 'profile-questions-filters')
+    if tree is None:
+        return None
+    counts = _filter_counts(tree)
+    if 'AGREE' not in counts or 'DISAGREE' not in counts:
+        return None
+    if counts.get('FIND OUT', 0) > 0:
+        raise NeedsBrowser('FIND OUT questions need answering')
+    stubs = _by_class(tree, 'profile-question')
+    if len(stubs) != sum(counts.values()):
+        return None
+    questions, start = dict(), 0
+    for filterstr, n in counts.items():
+        questions[filterstr] = [_inner_html(q) for q in stubs[start:start+n]]
+        start += n
+    return {filterstr: questions[filterstr] for filterstr in ['AGREE', 'DISAGREE']}
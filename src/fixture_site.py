@@ -0,0 +1,455 @@
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse
+import argparse, hashlib, json, re, threading, time
+
+#client-side behaviour shared by every page: infinite-scroll lists that
+#append a batch after a simulated render delay once scrolled near the bottom,
+#and the question overlay.
+COMMON_JS = r"""
+var F = window.FIXTURE;
+function later(f) { setTimeout(f, F.render_latency_ms); }
+
+function InfiniteList(container, total, batch, render, onEnd) {
+    var shown = 0, loading = false;
+    var more = function() {
+        if (loading || shown >= total) return;
+        loading = true;
+        later(function() {
+            var end = Math.min(total, shown + batch), html = '';
+            for (var i = shown; i < end; i++) html += render(i);
+            container.insertAdjacentHTML('beforeend', html);
+            shown = end;
+            loading = false;
+            if (shown >= total && onEnd) onEnd();
+        });
+    };
+    var onScroll = function() {
+        if (container.isConnected &&
+                window.innerHeight + window.scrollY >= document.body.scrollHeight - 200) more();
+    };
+    window.addEventListener('scroll', onScroll);
+    //first batch renders straight away
+    var end = Math.min(total, batch), html = '';
+    for (var i = 0; i < end; i++) html += render(i);
+    container.innerHTML = html;
+    shown = end;
+    if (shown >= total && onEnd) onEnd();
+}
+
+function questionText(i) { return 'Fixture question number ' + i + '?'; }
+function choices(i) {
+    var n = 2 + (i % 3), out = [];
+    for (var c = 0; c < n; c++) out.push('Choice ' + c + ' of ' + i);
+    return out;
+}
+
+function overlayHtml(i) {
+    var cs = choices(i), ours = '', theirs = '', imp = '';
+    for (var c = 0; c < cs.length; c++) {
+        ours += '<button class="pickonebutton-button">' + cs[c] + '</button>';
+        theirs += '<button class="pickmanybuttons-button">' + cs[c] + '</button>';
+    }
+    for (var k = 0; k < 3; k++) imp += '<button class="importance-pickonebutton-button">' + k + '</button>';
+    return '<div class="questionspage" data-q="' + i + '"><h1>' + questionText(i) + '</h1>' +
+        '<div class="pickonebutton-buttons">' + ours + '</div>' +
+        '<div class="pickmanybuttons">' + theirs + '</div>' +
+        '<div class="importance-pickonebutton">' + imp + '</div>' +
+        '<button class="questionspage-buttons-button questionspage-buttons-button--answer">Answer</button>' +
+        '</div>';
+}
+
+function selectIn(button, cls) {
+    var siblings = button.parentNode.children;
+    for (var s = 0; s < siblings.length; s++) siblings[s].className = cls;
+    button.className = cls + ' ' + cls + '--selected';
+}
+
+var overlayDone = null;
+function openOverlay(i, done) {
+    overlayDone = done;
+    document.getElementById('overlay').innerHTML = overlayHtml(i);
+}
+
+document.addEventListener('click', function(e) {
+    var t = e.target;
+    if (t.classList.contains('pickonebutton-button')) selectIn(t, 'pickonebutton-button');
+    else if (t.classList.contains('importance-pickonebutton-button'))
+        selectIn(t, 'importance-pickonebutton-button');
+    else if (t.classList.contains('pickmanybuttons-button')) t.classList.toggle('pickmanybuttons-button--checked');
+    else if (t.classList.contains('questionspage-buttons-button--answer')) {
+        var i = parseInt(document.querySelector('.questionspage').getAttribute('data-q'));
+        later(function() { overlayDone(i); });
+    }
+});
+"""
+
+PAGE = """<!DOCTYPE html>
+<html><head><title>{title}</title>
+<style>
+@font-face {{ font-family: 'Fixture Sans'; src: url('/fonts/fixture-sans.woff2'); }}
+body {{ font-family: 'Fixture Sans', sans-serif; }}
+.profile-question {{ height: 120px; border-bottom: 1px solid #ccc; }}
+.usercard-thumb {{ height: 150px; display: block; }}
+.profile-questions-filter-icon {{ display: inline-block; width: 16px; height: 16px; background: #888; }}
+.profile-thumb img {{ width: 100px; height: 100px; }}
+</style></head>
+<body>
+<script>window.FIXTURE = {config};</script>
+<script>{common}</script>
+{body}
+<div id="overlay"></div>
+<script>{script}</script>
+</body></html>
+"""
+
+LOGIN_BODY = """
+<div class="cookie-banner"><button class="accept-cookies-button"
+    onclick="this.parentNode.remove()">Accept</button></div>
+<input class="login-username" type="text">
+<input class="login-password" type="password">
+<button class="login-actions-button" onclick="document.cookie='session=fixture; path=/';
+    later(function() { location.href = '/profile'; });">Sign in</button>
+"""
+
+SELF_PROFILE_BODY = """
+<div class="profile-thumb"><img src="/images/me_0.jpg"></div>
+<a class="profile-selfview-questions-more" href="#">See all questions</a>
+<div id="selfquestions"></div>
+"""
+
+SELF_PROFILE_JS = """
+var remaining = F.unanswered;
+function nextOrDone(i) {
+    remaining -= 1;
+    if (remaining > 0) openOverlay(F.self_questions + F.unanswered - remaining, nextOrDone);
+    else {
+        document.getElementById('overlay').innerHTML = '<div id="no-questions-blank-state">Done</div>';
+    }
+}
+document.querySelector('.profile-selfview-questions-more').addEventListener('click', function(e) {
+    e.preventDefault();
+    later(function() {
+        var box = document.getElementById('selfquestions');
+        box.innerHTML = '<button class="profile-questions-next-actions-button--answer">Answer more</button>' +
+            '<div id="questions"></div>';
+        box.firstChild.addEventListener('click', function() {
+            if (remaining > 0) later(function() { openOverlay(F.self_questions, nextOrDone); });
+            else document.getElementById('overlay').innerHTML = '<div id="no-questions-blank-state">Done</div>';
+        });
+        InfiniteList(document.getElementById('questions'), F.self_questions, F.batch, function(i) {
+            var cs = choices(i), answers = '';
+            for (var c = 0; c < cs.length; c++) {
+                var cls = 'profile-question-self-answers-answer';
+                if (c == i % cs.length) cls += ' profile-question-self-answers-answer--isYourAnswer';
+                else if (c % 2) cls += ' profile-question-self-answers-answer--isUnacceptable';
+                answers += '<div class="' + cls + '">' + cs[c] + '</div>';
+            }
+            return '<div class="profile-question"><button><h3>' + questionText(i) + '</h3></button>' +
+                '<div class="profile-question-self-answers">' + answers + '</div></div>';
+        });
+    });
+});
+"""
+
+QUESTIONS_BODY = """
+<div class="profile-questions-filters">
+  <div class="profile-questions-filter"><span class="profile-questions-filter-icon profile-questions-filter-icon--agree"></span><div>AGREE</div><div id="count-agree"></div></div>
+  <div class="profile-questions-filter"><span class="profile-questions-filter-icon profile-questions-filter-icon--disagree"></span><div>DISAGREE</div><div id="count-disagree"></div></div>
+  <div class="profile-questions-filter"><span class="profile-questions-filter-icon profile-questions-filter-icon--findOut"></span><div>FIND OUT</div><div id="count-findOut"></div></div>
+</div>
+<div id="questionlist"></div>
+"""
+
+QUESTIONS_JS = """
+var counts = {agree: F.agree, disagree: F.disagree, findOut: F.find_out};
+function showCounts() {
+    for (var k in counts) document.getElementById('count-' + k).textContent = counts[k];
+}
+function stub(filter, i) {
+    var cs = choices(i), them = cs[i % cs.length];
+    var us = filter == 'agree' ? them : cs[(i + 1) % cs.length];
+    var answers = filter == 'findOut' ? '' : '<div class="profile-question-answers">' +
+        '<div class="profile-question-them-answer">' + them + '</div>' +
+        '<div class="profile-question-self-answer">' + us + '</div></div>';
+    return '<div class="profile-question" data-q="' + i + '"><button class="profile-question-content"><h3>' +
+        questionText(i) + '</h3></button>' + answers + '</div>';
+}
+function showFilter(filter) {
+    //a new container, so the old list's elements go stale like the real site's
+    var old = document.getElementById('questions');
+    if (old) old.remove();
+    var box = document.createElement('div');
+    box.id = 'questions';
+    document.getElementById('questionlist').appendChild(box);
+    var offset = {agree: 0, disagree: 100000, findOut: 200000}[filter];
+    InfiniteList(box, counts[filter], F.batch, function(i) { return stub(filter, offset + i); });
+    if (filter == 'findOut') {
+        box.addEventListener('click', function(e) {
+            var q = e.target.closest('.profile-question');
+            if (!q) return;
+            later(function() {
+                openOverlay(parseInt(q.getAttribute('data-q')), function() {
+                    document.getElementById('overlay').innerHTML = '';
+                    counts.findOut -= 1;
+                    counts.agree += 1;
+                    later(showCounts);
+                });
+            });
+        });
+    }
+}
+later(function() {
+    //showFilter replaces any list the server sent with its own
+    showCounts();
+    showFilter('agree');
+    ['agree', 'disagree', 'findOut'].forEach(function(filter) {
+        document.querySelector('.profile-questions-filter-icon--' + filter)
+            .addEventListener('click', function() { later(function() { showFilter(filter); }); });
+    });
+});
+"""
+
+PROFILE_BODY = """
+<div class="profile-basics"><div class="profile-basics-username">{username}</div></div>
+<div class="profile-thumb">{thumbs}</div>
+<div class="matchprofile-details">
+  <div class="matchprofile-details-section matchprofile-details-section--basics">
+    <div class="matchprofile-details-text">Fixture details for {username}</div>
+  </div>
+</div>
+<div class="profile-essays">
+  {essays}
+  <div id="more-essays" style="display:none">{more_essays}</div>
+  <button class="profile-essays-expander"
+    onclick="document.getElementById('more-essays').style.display='block'; this.remove();">More</button>
+</div>
+"""
+
+ESSAY = """<div class="profile-essay"><h2 class="profile-essay-header">Essay {i}</h2>
+<div class="profile-essay-contents">{text}</div></div>"""
+
+MATCH_BODY = """<div id="cards"></div>"""
+
+MATCH_JS = """
+InfiniteList(document.getElementById('cards'), F.total_cards, F.cards_per_page, function(i) {
+    return '<a class="usercard-thumb" data-username="fixture_user_' + i + '" href="/profile/fixture_user_' +
+        i + '">fixture_user_' + i + '</a>';
+}, function() {
+    document.body.insertAdjacentHTML('beforeend', '<div class="blank-state-wrapper">No more matches</div>');
+});
+"""
+
+
+def image_bytes(name, size):
+    """Deterministic fake image contents, so the same name always has the same hash."""
+    seed = hashlib.sha256(name.encode()).digest()
+    return (seed * (size // len(seed) + 1))[:size]
+
+
+class FixtureSite:
+    """
+    Local stand-in for the site, serving synthetic pages that use the same
+    class names and behaviours Scraper relies on: the login form, the self
+    view with its question list and answer overlay, users' question pages
+    with filter counters, profiles with images and essays, and the match
+    page. Lists load in batches on scroll after a simulated render delay.
+
+    Attributes:
+        url (str): base url to pass to Scraper as base_url once started
+        stats (dict): requests and bytes served, by kind of page
+    """
+
+    def __init__(self, self_questions=100, unanswered=20, agree=60, disagree=40,
+            find_out=0, batch=20, cards_per_page=20, total_cards=200, images=4,
+            image_size=20000, essays=6, render_latency=0.05, page_latency=0.0,
+            asset_latency=0.0, font_size=40000, server_questions=False,
+            host='127.0.0.1', port=0):
+        """
+        Constructor for the FixtureSite class
+
+        Parameters:
+            self_questions (int): questions the scraper has answered on its self view
+            unanswered (int): questions answer_all_questions can answer before the end
+            agree (int): AGREE questions on every user's question page
+            disagree (int): DISAGREE questions on every user's question page
+            find_out (int): FIND OUT questions on every user's question page
+            batch (int): questions rendered per scroll
+            cards_per_page (int): match cards rendered per scroll
+            total_cards (int): match cards before the blank state shows
+            images (int): images per profile
+            image_size (int): bytes per image
+            essays (int): essays per profile, half of them behind the expander
+            render_latency (float): seconds the page takes to render each batch
+                or react to a click
+            page_latency (float): seconds the server waits before answering
+            asset_latency (float): extra seconds the server waits before
+                answering for an image or font, like a slow CDN
+            font_size (int): bytes of the web font every page uses
+            server_questions (bool): also fill in the filter counters and list
+                every question in the question page's html, as a server-rendered
+                page would, for the fetch backend. The page's script replaces
+                the list when it runs.
+            host (str): interface to listen on
+            port (int): port to listen on, 0 for any free one
+        """
+        self.config = {
+            'self_questions': self_questions, 'unanswered': unanswered,
+            'agree': agree, 'disagree': disagree, 'find_out': find_out, 'batch': batch,
+            'cards_per_page': cards_per_page, 'total_cards': total_cards,
+            'render_latency_ms': int(render_latency*1000)
+        }
+        self.images = images
+        self.image_size = image_size
+        self.essays = essays
+        self.server_questions = server_questions
+        self.page_latency = page_latency
+        self.asset_latency = asset_latency
+        self.font_size = font_size
+        self.host = host
+        self.port = port
+        self.stats = dict()
+        self._lock = threading.Lock()
+        self._server = None
+        self.url = None
+
+    def _page(self, title, body, script=''):
+        return PAGE.format(title=title, config=json.dumps(self.config), common=COMMON_JS,
+            body=body, script=script)
+
+    def _question_body(self):
+        """
+        QUESTIONS_BODY with the filter counters filled in and every filter's
+        stubs listed in the counters' order, as a server-rendered page would.
+        QUESTIONS_JS replaces the list with its own when it runs.
+        """
+        def stub(filterstr, i):
+            cs = [f'Choice {c} of {i}' for c in range(2 + i % 3)]
+            them = cs[i % len(cs)]
+            us = them if filterstr == 'AGREE' else cs[(i+1) % len(cs)]
+            answers = '' if filterstr == 'FIND OUT' else\
+                ('<div class="profile-question-answers">'
+                f'<div class="profile-question-them-answer">{them}</div>'
+                f'<div class="profile-question-self-answer">{us}</div></div>')
+            return (f'<div class="profile-question" data-q="{i}"><button class="profile-question-content">'
+                f'<h3>Fixture question number {i}?</h3></button>{answers}</div>')
+        lists = [('AGREE', 'agree', 0, self.config['agree']),
+            ('DISAGREE', 'disagree', 100000, self.config['disagree']),
+            ('FIND OUT', 'findOut', 200000, self.config['find_out'])]
+        body = QUESTIONS_BODY
+        for _, key, _, n in lists:
+            body = body.replace(f'<div id="count-{key}"></div>', f'<div id="count-{key}">{n}</div>')
+        stubs = ''.join(stub(filterstr, offset + i) for filterstr, _, offset, n in lists
+            for i in range(n))
+        return body.replace('<div id="questionlist"></div>',
+            f'<div id="questionlist"><div id="questions">{stubs}</div></div>')
+
+    def _profile(self, username):
+        thumbs = ''.join(f'<img src="/images/{username}_{i}.jpg">' for i in range(self.images))
+        essays = [ESSAY.format(i=i, text=f'Essay {i} of {username}. ' * 20)
+            for i in range(self.essays)]
+        half = (len(essays)+1) // 2
+        return self._page(username, PROFILE_BODY.format(username=username, thumbs=thumbs,
+            essays=''.join(essays[:half]), more_essays=''.join(essays[half:])))
+
+    def route(self, path):
+        """
+        Returns (kind, content type, body bytes) for a request path, or None
+        for a 404.
+        """
+        html = lambda s: ('text/html; charset=utf-8', s.encode())
+        if path == '/login':
+            return ('login',) + html(self._page('Login', LOGIN_BODY))
+        if path == '/logout':
+            return ('logout',) + html(self._page('Logged out', ''))
+        if path == '/robots.txt':
+            return ('robots', 'text/plain', b'User-agent: *\n')
+        if path == '/profile':
+            return ('self',) + html(self._page('Profile', SELF_PROFILE_BODY, SELF_PROFILE_JS))
+        if path == '/match':
+            return ('match',) + html(self._page('Match', MATCH_BODY, MATCH_JS))
+        m = re.fullmatch(r'/profile/([^/]+)/questions', path)
+        if m:
+            body = self._question_body() if self.server_questions else QUESTIONS_BODY
+            return ('questions',) + html(self._page('Questions', body, QUESTIONS_JS))
+        m = re.fullmatch(r'/profile/([^/]+)', path)
+        if m:
+            return ('profile',) + html(self._profile(m.group(1)))
+        m = re.fullmatch(r'/images/([\w.-]+)', path)
+        if m:
+            return ('image', 'image/jpeg', image_bytes(m.group(1), self.image_size))
+        m = re.fullmatch(r'/fonts/([\w.-]+)', path)
+        if m:
+            return ('font', 'font/woff2', image_bytes(m.group(1), self.font_size))
+        return None
+
+    def _count(self, kind, nbytes):
+        with self._lock:
+            stat = self.stats.setdefault(kind, {'requests': 0, 'bytes': 0})
+            stat['requests'] += 1
+            stat['bytes'] += nbytes
+
+    def _handler(self):
+        site = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if site.page_latency:
+                    time.sleep(site.page_latency)
+                found = site.route(urlparse(self.path).path)
+                if site.asset_latency and found is not None and found[0] in ('image', 'font'):
+                    time.sleep(site.asset_latency)
+                if found is None:
+                    kind, ctype, body, status = '404', 'text/plain', b'not found', 404
+                else:
+                    (kind, ctype, body), status = found, 200
+                site._count(kind, len(body))
+                self.send_response(status)
+                self.send_header('Content-Type', ctype)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
+
+    def start(self):
+        """Starts serving in a background thread. Returns the base url."""
+        self._server = ThreadingHTTPServer((self.host, self.port), self._handler())
+        self._server.daemon_threads = True
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        self.url = f'http://{self.host}:{self._server.server_address[1]}'
+        return self.url
+
+    def stop(self):
+        """Stops the server."""
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+    def reset_stats(self):
+        with self._lock:
+            self.stats = dict()
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+if __name__=='__main__':
+    parser = argparse.ArgumentParser(description='Serve the fixture site')
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--render-latency', type=float, default=0.05)
+    args = parser.parse_args()
+    site = FixtureSite(render_latency=args.render_latency, port=args.port)
+    print(f'serving on {site.start()}')
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        site.stop()
@@ -0,0 +1,291 @@
+from pymongo import MongoClient, InsertOne, ReplaceOne
+from pymongo.errors import BulkWriteError
+from bson.binary import Binary
+from lru import LRUCache
+from datetime import datetime
+import argparse, gridfs, hashlib, time
+import zstandard as zstd
+
+FORMAT = 'zstd'
+FORMAT_VERSION = 1
+DUPLICATE_KEY = 11000
+
+
+def fragment_hash(text):
+    """Returns the key a question html fragment is stored under."""
+    return hashlib.sha256(text.encode()).hexdigest()
+
+
+class HtmlStore:
+    """
+    Compressed storage for the raw html in scraped user documents.
+
+    A packed document keeps everything scrape_user produced, but its profile
+    html becomes a zstd blob, kept inline or in the html_blobs GridFS bucket
+    once it is larger than gridfs_threshold, and each question list becomes a
+    list of fragment hashes. Fragments live once each in db.html_fragments, so
+    a question's html shared by many users is only stored once. Fragments are
+    written as soon as they're packed, so a document pointing at them can be
+    queued on a BulkWriter straight after. Packed documents are marked with
+    a 'storage' field; read them back with unpack_user, which leaves legacy
+    documents as they are.
+
+    Compression can use a dictionary trained on our own pages (see
+    train_dictionary), which helps a lot on small fragments. Dictionaries are
+    kept in db.html_dicts and every blob records the id of the one it used.
+
+    Attributes:
+        db (pymongo.database.Database): okc database
+        dict_id (int): dictionary new blobs are compressed with, 0 for none
+        stats (dict): raw and stored bytes, fragments written and deduplicated
+    """
+
+    def __init__(self, db, level=10, dict_id=None, gridfs_threshold=1<<18, cache_size=10000):
+        """
+        Constructor for the HtmlStore class
+
+        Parameters:
+            db (pymongo.database.Database): okc database
+            level (int): zstd compression level
+            dict_id (int): dictionary to compress with. None uses the newest
+                trained one if there is any, 0 uses none.
+            gridfs_threshold (int): compressed profile html larger than this
+                many bytes goes to GridFS
+            cache_size (int): fragment hashes and decompressed fragments to remember
+        """
+        self.db = db
+        self.level = level
+        self.gridfs_threshold = gridfs_threshold
+        self.blobs = gridfs.GridFS(db, 'html_blobs')
+        self._dicts = dict()
+        self._decompressors = dict()
+        self._stored = LRUCache(cache_size)
+        self._fragments = LRUCache(cache_size)
+        self.stats = {'raw_bytes': 0, 'stored_bytes': 0, 'fragments_written': 0,
+            'fragments_deduplicated': 0}
+
+        if dict_id is None:
+            newest = db.html_dicts.find_one(sort=[('trained', -1)], projection={'_id': 1})
+            dict_id = newest['_id'] if newest else 0
+        self.dict_id = dict_id
+        self._compressor = zstd.ZstdCompressor(level=level,
+            dict_data=self._dictionary(dict_id))
+
+    def _dictionary(self, dict_id):
+        if not dict_id:
+            return None
+        if dict_id not in self._dicts:
+            record = self.db.html_dicts.find_one({'_id': dict_id})
+            if record is None:
+                raise KeyError(f'no compression dictionary {dict_id} in db.html_dicts')
+            self._dicts[dict_id] = zstd.ZstdCompressionDict(bytes(record['data']))
+        return self._dicts[dict_id]
+
+    def compress(self, text):
+        data = text.encode()
+        packed = self._compressor.compress(data)
+        self.stats['raw_bytes'] += len(data)
+        self.stats['stored_bytes'] += len(packed)
+        return packed
+
+    def decompress(self, data, dict_id=0):
+        if dict_id not in self._decompressors:
+            self._decompressors[dict_id] = zstd.ZstdDecompressor(
+                dict_data=self._dictionary(dict_id))
+        return self._decompressors[dict_id].decompress(bytes(data)).decode()
+
+    def pack_html(self, text):
+        """Returns the stored form of a profile's html: inline or a GridFS file id."""
+        packed = self.compress(text)
+        if len(packed) > self.gridfs_threshold:
+            return {'gridfs': self.blobs.put(packed), 'd': self.dict_id}
+        return {'z': Binary(packed), 'd': self.dict_id}
+
+    def delete_html(self, blob):
+        """
+        Deletes the GridFS file a pack_html blob is stored in, if it is in
+        one. Call it once no document points at the blob any more.
+        """
+        if isinstance(blob, dict) and 'gridfs' in blob:
+            self.blobs.delete(blob['gridfs'])
+
+    def read_html(self, blob):
+        """Returns the html a pack_html blob holds."""
+        if blob is None or isinstance(blob, str):
+            return blob
+        data = self.blobs.get(blob['gridfs']).read() if 'gridfs' in blob else blob['z']
+        return self.decompress(data, blob['d'])
+
+    def pack_fragments(self, fragments):
+        """
+        Stores any fragments not stored already, in one round trip, and
+        returns their hashes in the same order.
+        """
+        hashes, ops = [], dict()
+        for text in fragments:
+            key = fragment_hash(text)
+            hashes.append(key)
+            if key in ops or self._stored.hit(key):
+                self.stats['fragments_deduplicated'] += 1
+                continue
+            self._fragments.put(key, text)
+            ops[key] = InsertOne({'_id': key, 'z': Binary(self.compress(text)),
+                'd': self.dict_id})
+        if ops:
+            try:
+                self.db.html_fragments.bulk_write(list(ops.values()), ordered=False)
+            except BulkWriteError as e:
+                #stored by an earlier run or another scraper
+                if any(err['code'] != DUPLICATE_KEY for err in e.details['writeErrors']):
+                    raise
+            #only once written, so a failed write is retried next time
+            for key in ops:
+                self._stored.put(key, True)
+        self.stats['fragments_written'] += len(ops)
+        return hashes
+
+    def read_fragments(self, hashes):
+        """Returns the fragments stored under hashes, in the same order."""
+        texts = {key: self._fragments.hit(key) for key in set(hashes)}
+        missing = [key for key, text in texts.items() if text is None]
+        if missing:
+            for record in self.db.html_fragments.find({'_id': {'$in': missing}}):
+                text = self.decompress(record['z'], record['d'])
+                self._fragments.put(record['_id'], text)
+                texts[record['_id']] = text
+        absent = [key for key in missing if texts[key] is None]
+        if absent:
+            raise KeyError(f'{len(absent)} question fragments missing from db.html_fragments')
+        return [texts[key] for key in hashes]
+
+    def pack_user(self, doc):
+        """Returns the stored form of a scrape_user document. doc is left as is."""
+        if 'storage' in doc:
+            return doc
+        packed = dict(doc)
+        if doc.get('html') is not None:
+            packed['html'] = self.pack_html(doc['html'])
+        questions = doc.get('questions') or {}
+        hashes = iter(self.pack_fragments([f for fragments in questions.values()
+            for f in fragments]))
+        packed['questions'] = {filterstr: [next(hashes) for _ in fragments]
+            for filterstr, fragments in questions.items()}
+        packed['storage'] = {'format': FORMAT, 'version': FORMAT_VERSION}
+        return packed
+
+    def unpack_user(self, doc):
+        """
+        Returns a stored user document with its html and questions as
+        scrape_user returned them. Documents that were never packed, and
+        projections without those fields, come back unchanged.
+        """
+        if 'storage' not in doc:
+            return doc
+        unpacked = dict(doc)
+        del unpacked['storage']
+        if 'html' in doc:
+            unpacked['html'] = self.read_html(doc['html'])
+        if 'questions' in doc:
+            unpacked['questions'] = {filterstr: self.read_fragments(hashes)
+                for filterstr, hashes in doc['questions'].items()}
+        return unpacked
+
+    def load_user(self, username):
+        """Returns the unpacked db.users document for username, or None."""
+        doc = self.db.users.find_one({'_id': username})
+        return None if doc is None else self.unpack_user(doc)
+
+
+def train_dictionary(db, samples, size=1<<17):
+    """
+    Trains a zstd dictionary on sample html strings and saves it to
+    db.html_dicts, where HtmlStores created afterwards pick it up.
+
+    Parameters:
+        db (pymongo.database.Database): okc database
+        samples (list of str): profile html and question fragments to train on
+        size (int): dictionary size in bytes
+
+    Returns:
+        the new dictionary's id
+    """
+    trained = zstd.train_dictionary(size, [s.encode() for s in samples])
+    dict_id = trained.dict_id()
+    db.html_dicts.replace_one({'_id': dict_id}, {
+        '_id': dict_id,
+        'data': Binary(trained.as_bytes()),
+        'samples': len(samples),
+        'trained': datetime.now()
+    }, upsert=True)
+    return dict_id
+
+
+def sample_html(db, n=1000):
+    """Returns html from up to n stored users, packed or not, to train a dictionary on."""
+    store = HtmlStore(db, dict_id=0)
+    samples = []
+    for doc in db.users.aggregate([{'$sample': {'size': n}},
+            {'$project': {'html': 1, 'questions': 1, 'storage': 1}}]):
+        doc = store.unpack_user(doc)
+        if doc.get('html'):
+            samples.append(doc['html'])
+        for fragments in (doc.get('questions') or {}).values():
+            samples.extend(fragments[:20])
+    return samples
+
+
+def migrate(db, store=None, batch_size=100):
+    """
+    Packs every db.users document still holding raw html, a batch at a time.
+
+    Parameters:
+        db (pymongo.database.Database): okc database
+        store (HtmlStore): store to pack with. A new one, using the newest
+            dictionary, if None.
+        batch_size (int): documents read and replaced per round trip
+
+    Returns:
+        number of documents packed
+    """
+    store = store or HtmlStore(db)
+    cursor = db.users.find({'storage': {'$exists': False}}, batch_size=batch_size,
+        no_cursor_timeout=True)
+    count = 0
+    try:
+        batch = []
+        for doc in cursor:
+            batch.append(store.pack_user(doc))
+            if len(batch) == batch_size:
+                _replace(db, batch)
+                count += len(batch)
+                batch = []
+        if batch:
+            _replace(db, batch)
+            count += len(batch)
+    finally:
+        cursor.close()
+    return count
+
+
+def _replace(db, docs):
+    db.users.bulk_write([ReplaceOne({'_id': d['_id']}, d) for d in docs], ordered=False)
+
+
+if __name__=='__main__':
+    parser = argparse.ArgumentParser(description='Compress raw html in db.users')
+    parser.add_argument('--train', action='store_true',
+        help='train a dictionary on a sample of stored users first')
+    parser.add_argument('--samples', type=int, default=1000)
+    parser.add_argument('--level', type=int, default=10)
+    parser.add_argument('--batch-size', type=int, default=100)
+    args = parser.parse_args()
+
+    db = MongoClient('localhost', 27017).okc
+    if args.train:
+        print('trained dictionary', train_dictionary(db, sample_html(db, args.samples)))
+    store = HtmlStore(db, level=args.level)
+    start = time.perf_counter()
+    n = migrate(db, store, args.batch_size)
+    raw, stored = store.stats['raw_bytes'], store.stats['stored_bytes']
+    print(f'packed {n} documents in {time.perf_counter() - start:.1f}s, '
+        f'{raw/1e6:.1f}MB of html stored as {stored/1e6:.1f}MB')
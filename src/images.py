@@ -0,0 +1,227 @@
+from concurrent.futures import ThreadPoolExecutor, wait as wait_futures
+from requests.adapters import HTTPAdapter
+from urllib.parse import urlparse
+from datetime import datetime
+import glob, hashlib, json, os, tempfile, threading, time, requests
+
+
+class HostRateLimiter:
+    """
+    Caps the request rate to each host. Thread safe.
+
+    Attributes:
+        interval (float): minimum seconds between the starts of two requests to one host
+    """
+
+    def __init__(self, per_second):
+        self.interval = 1.0 / per_second if per_second else 0.0
+        self._next = dict()
+        self._lock = threading.Lock()
+
+    def acquire(self, host):
+        """Blocks until a request to host may start."""
+        with self._lock:
+            now = time.monotonic()
+            start = max(now, self._next.get(host, now))
+            self._next[host] = start + self.interval
+        if start > now:
+            time.sleep(start - now)
+
+
+def _read_lines(path):
+    """Yields the entries of a manifest file, skipping a last line still being written."""
+    with open(path) as f:
+        for line in f:
+            if line.endswith('\n'):
+                yield json.loads(line)
+
+
+def iter_manifests(save_dir):
+    """
+    Yields every entry the pipelines writing to save_dir recorded, one file
+    and one line at a time, as dicts of username, hash, url and time (a utc
+    iso string). Entries of manifests from before times were recorded, a
+    json dict of username -> [{hash, url}] each, have a time of None.
+    """
+    for path in sorted(glob.glob(os.path.join(save_dir, 'manifest*.jsonl'))):
+        yield from _read_lines(path)
+    for path in sorted(glob.glob(os.path.join(save_dir, 'manifest*.json'))):
+        with open(path) as f:
+            manifest = json.load(f)
+        for username, images in manifest.items():
+            for image in images:
+                yield {'username': username, 'hash': image['hash'], 'url': image['url'],
+                    'time': None}
+
+
+class ImagePipeline:
+    """
+    Downloads profile images in the background and stores them content
+    addressed, so an image shared between profiles or re-scrapes is stored
+    once.
+
+    Images are saved as <save_dir>/objects/<first 2 hash chars>/<sha256><ext>.
+    Each one is recorded in a manifest in save_dir the moment it's saved, as
+    a json line of username, hash, url and the utc time, so the manifest is
+    always current, even mid crawl. Pipelines sharing a save_dir, like a
+    pool's workers, each need their own manifest_name; iter_manifests reads
+    them all.
+
+    Attributes:
+        save_dir (str): directory images and the manifest are written to
+        manifest_path (str): file this pipeline's manifest is appended to
+        session (requests.Session): pooled session shared by all downloads
+        manifest (dict): username -> list of {hash, url} in the manifest
+        stats (dict): counts of downloaded, duplicate and failed images
+        metrics (Metrics): optional, gets download latencies, retries and results
+    """
+
+    def __init__(self, save_dir, workers=4, per_host_rate=5, retries=3,
+            chunk_size=1<<16, timeout=10, backoff=0.5, metrics=None,
+            manifest_name='manifest.jsonl'):
+        """
+        Constructor for the ImagePipeline class
+
+        Parameters:
+            save_dir (str): directory images and the manifest are written to
+            workers (int): maximum number of downloads in flight
+            per_host_rate (float): maximum requests per second to any one host
+            retries (int): attempts per image before giving up
+            chunk_size (int): bytes read from the response at a time
+            timeout (float): seconds to wait on a connection or read
+            backoff (float): seconds before the first retry, doubling each attempt
+            metrics (Metrics): optional, gets download latencies, retries and results
+            manifest_name (str): file name of the manifest in save_dir, one
+                per pipeline writing to it, matching manifest*.jsonl
+        """
+        self.save_dir = save_dir
+        self.metrics = metrics
+        self.retries = retries
+        self.chunk_size = chunk_size
+        self.timeout = timeout
+        self.backoff = backoff
+        self.limiter = HostRateLimiter(per_host_rate)
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=workers, pool_maxsize=workers)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self._pool = ThreadPoolExecutor(workers)
+        self._futures = set()
+        self._lock = threading.Lock()
+        self.stats = {'downloaded': 0, 'duplicate': 0, 'failed': 0}
+
+        os.makedirs(os.path.join(save_dir, 'objects'), exist_ok=True)
+        self.manifest_path = os.path.join(save_dir, manifest_name)
+        self.manifest = dict()
+        if os.path.exists(self.manifest_path):
+            for entry in _read_lines(self.manifest_path):
+                self.manifest.setdefault(entry['username'], []).append(
+                    {'hash': entry['hash'], 'url': entry['url']})
+        self._manifest_file = open(self.manifest_path, 'a')
+
+    def path_for(self, digest, ext=''):
+        """Returns the path an image with the given sha256 hex digest is stored at."""
+        return os.path.join(self.save_dir, 'objects', digest[:2], digest + ext)
+
+    def submit(self, username, urls):
+        """
+        Queues urls to be downloaded for username and returns immediately.
+
+        Returns:
+            list of futures, each resolving to the image's hash or None on failure
+        """
+        futures = [self._pool.submit(self._fetch, username, url) for url in urls]
+        with self._lock:
+            self._futures.update(futures)
+        for future in futures:
+            future.add_done_callback(self._discard)
+        return futures
+
+    def _discard(self, future):
+        with self._lock:
+            self._futures.discard(future)
+
+    def _fetch(self, username, url):
+        delay = self.backoff
+        for attempt in range(self.retries):
+            try:
+                start = time.perf_counter()
+                digest = self._download(url)
+                if self.metrics is not None:
+                    self.metrics.observe('image_download_seconds', time.perf_counter() - start)
+                self._record(username, digest, url)
+                return digest
+            except (requests.RequestException, OSError):
+                if attempt < self.retries-1:
+                    if self.metrics is not None:
+                        self.metrics.inc('retries', where='image_download')
+                    time.sleep(delay)
+                    delay *= 2
+        with self._lock:
+            self.stats['failed'] += 1
+        if self.metrics is not None:
+            self.metrics.inc('images', result='failed')
+        return None
+
+    def _download(self, url):
+        """Streams url into a temp file while hashing, then moves it into place."""
+        self.limiter.acquire(urlparse(url).netloc)
+        ext = os.path.splitext(urlparse(url).path)[1]
+        sha = hashlib.sha256()
+        fd, tmp = tempfile.mkstemp(dir=self.save_dir, suffix='.part')
+        try:
+            with os.fdopen(fd, 'wb') as f, self.session.get(url, stream=True,
+                    timeout=self.timeout) as r:
+                r.raise_for_status()
+                for chunk in r.iter_content(self.chunk_size):
+                    sha.update(chunk)
+                    f.write(chunk)
+            digest = sha.hexdigest()
+            path = self.path_for(digest, ext)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            if os.path.exists(path):
+                os.remove(tmp)
+                key = 'duplicate'
+            else:
+                os.replace(tmp, path)
+                key = 'downloaded'
+            with self._lock:
+                self.stats[key] += 1
+            if self.metrics is not None:
+                self.metrics.inc('images', result=key)
+            return digest
+        except BaseException:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            raise
+
+    def _record(self, username, digest, url):
+        """Adds a saved image to the manifest, on disk straight away."""
+        with self._lock:
+            images = self.manifest.setdefault(username, [])
+            if any(i['url'] == url for i in images):
+                return
+            images.append({'hash': digest, 'url': url})
+            #one write per line, so a reader never sees half of one
+            self._manifest_file.write(json.dumps({'username': username, 'hash': digest,
+                'url': url, 'time': datetime.utcnow().isoformat()}) + '\n')
+            self._manifest_file.flush()
+
+    def join(self):
+        """Blocks until every queued download has finished."""
+        with self._lock:
+            pending = list(self._futures)
+        wait_futures(pending)
+
+    def close(self):
+        """Finishes queued downloads, closes the manifest and releases connections."""
+        self.join()
+        self._pool.shutdown()
+        self.session.close()
+        self._manifest_file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -0,0 +1,83 @@
+from collections import namedtuple
+
+LoadResult = namedtuple('LoadResult', ['count', 'batches', 'seconds', 'reason'])
+
+#script timeout a new WebDriver session starts with, per the spec
+DEFAULT_SCRIPT_TIMEOUT = 30
+
+#runs as an async script: watches the page with a MutationObserver and
+#scrolls for the next batch as soon as the previous one has rendered, until
+#there are arguments[1] matching elements (if not null) or nothing new has
+#appeared for arguments[2] ms.
+LOAD_JS = """
+var cls = arguments[0], expected = arguments[1], idle = arguments[2];
+var done = arguments[arguments.length - 1];
+var list = document.getElementsByClassName(cls);
+var start = performance.now();
+var state = {count: list.length, batches: 0, last: start, finished: false};
+var observer, timer;
+
+var next = function() {
+    if (list.length) list[list.length - 1].scrollIntoView();
+    window.scrollTo(0, document.body.scrollHeight);
+};
+var finish = function(reason) {
+    if (state.finished) return;
+    state.finished = true;
+    observer.disconnect();
+    clearInterval(timer);
+    done({count: list.length, batches: state.batches,
+          seconds: (performance.now() - start) / 1000, reason: reason});
+};
+var check = function() {
+    if (list.length > state.count) {
+        state.count = list.length;
+        state.batches += 1;
+        state.last = performance.now();
+        next();
+    }
+    if (expected !== null && list.length >= expected) return finish('expected');
+    if (performance.now() - state.last > idle) return finish('idle');
+};
+
+observer = new MutationObserver(check);
+observer.observe(document.body, {childList: true, subtree: true});
+//mutations drive loading; the interval only notices when they've stopped
+timer = setInterval(check, 50);
+check();
+if (!state.finished) next();
+"""
+
+
+def load_all(driver, class_name, expected=None, idle=1.0, max_seconds=300):
+    """
+    Loads an infinite-scroll list until it has expected elements with
+    class_name, or until no new ones have appeared for idle seconds. The
+    whole load runs in the page in a single async script call.
+
+    Parameters:
+        driver (WebDriver): driver showing the list
+        class_name (str): class of the list's items, e.g. 'profile-question'
+        expected (int): number of items to stop at, None to load until growth stops
+        idle (float): seconds without new items after which loading stops
+        max_seconds (float): script timeout for the whole load, after which
+            the driver's previous script timeout is put back
+
+    Returns:
+        LoadResult of (items loaded, batches it took, seconds, and why it
+        stopped: 'expected' or 'idle')
+    """
+    #selenium 3 can't read the timeout back, so assume nothing else changed it
+    timeouts = getattr(driver, 'timeouts', None)
+    old_timeout = timeouts.script if timeouts is not None else DEFAULT_SCRIPT_TIMEOUT
+    driver.set_script_timeout(max_seconds)
+    try:
+        result = driver.execute_async_script(LOAD_JS, class_name, expected, int(idle*1000))
+    finally:
+        driver.set_script_timeout(old_timeout)
+    return LoadResult(result['count'], result['batches'], result['seconds'], result['reason'])
+
+
+def load_questions(driver, expected=None, idle=1.0, max_seconds=300):
+    """load_all for the .profile-question list."""
+    return load_all(driver, 'profile-question', expected, idle, max_seconds)
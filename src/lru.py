@@ -0,0 +1,25 @@
+from collections import OrderedDict
+
+
+class LRUCache(OrderedDict):
+    """
+    Dict that keeps at most size entries, dropping the least recently used
+    one when full. Not thread safe.
+    """
+
+    def __init__(self, size):
+        super().__init__()
+        self.size = size
+
+    def put(self, key, value):
+        self[key] = value
+        self.move_to_end(key)
+        if len(self) > self.size:
+            self.popitem(last=False)
+
+    def hit(self, key):
+        """Returns the value for key, or None, marking it as recently used."""
+        value = self.get(key)
+        if value is not None:
+            self.move_to_end(key)
+        return value
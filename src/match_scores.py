@@ -0,0 +1,386 @@
+"""
+OkCupid-style match and enemy percentages, computed for many users at once
+from sparse answer matrices instead of one user at a time in Python.
+
+For two people A and B and the questions both answered, A's satisfaction
+is the importance-weighted share of those questions where B's answer is one
+A accepts. Match is the geometric mean of both satisfactions less a 1/n
+margin of error for n common questions; enemy is the geometric mean of both
+dissatisfactions.
+
+We only see other users' own answers, not what they accept or how much they
+care, so a scraped user is taken to accept only their own answer with
+THEIR_IMPORTANCE weight. The scraper's own answers are complete.
+"""
+from pymongo import MongoClient, ASCENDING, UpdateOne
+from version_store import VersionStore
+from scipy import sparse
+import numpy as np
+import argparse, time
+
+#weights for the importance buttons, index 0 being "a little important"
+IMPORTANCE_WEIGHTS = np.array([1, 10, 50, 250], dtype=np.float32)
+THEIR_IMPORTANCE = 1
+MAX_CHOICES = 8
+
+
+class QuestionIndex:
+    """
+    Maps question texts to matrix columns, with each question's choices so
+    answers given as text can be turned into indices.
+
+    Attributes:
+        columns (dict): q_text -> column
+        choices (list): choice lists, by column
+    """
+
+    def __init__(self, question_data=()):
+        self.columns = dict()
+        self.choices = []
+        self.add(question_data)
+
+    def add(self, question_data):
+        """Adds the questions in a question data list that aren't indexed yet."""
+        for q in question_data:
+            if q['q_text'] not in self.columns:
+                self.columns[q['q_text']] = len(self.choices)
+                self.choices.append(list(q['choices']))
+
+    def __len__(self):
+        return len(self.choices)
+
+    def answer_index(self, q_text, answer_text):
+        """Returns (column, answer index) for an answer given as text, or None."""
+        col = self.columns.get(q_text)
+        if col is None:
+            return None
+        try:
+            return col, self.choices[col].index(answer_text)
+        except ValueError:
+            return None
+
+
+class AnswerVector:
+    """
+    One person's answers as dense arrays over the index's columns: answer
+    index (-1 where unanswered), acceptable bitmask and importance weight.
+    """
+
+    def __init__(self, answer, mask, weight):
+        self.answer = answer
+        self.mask = mask
+        self.weight = weight
+
+    @classmethod
+    def from_question_data(cls, question_data, index):
+        """Builds the vector from a scraper's question data list, e.g. a version."""
+        n = len(index)
+        answer = np.full(n, -1, dtype=np.int8)
+        mask = np.zeros(n, dtype=np.uint8)
+        weight = np.zeros(n, dtype=np.float32)
+        for q in question_data:
+            col = index.columns.get(q['q_text'])
+            if col is None or q['our_answer'] is None:
+                continue
+            answer[col] = q['our_answer']
+            mask[col] = sum(1 << i for i, ok in enumerate(q['acceptable']) if ok)
+            weight[col] = IMPORTANCE_WEIGHTS[q['importance']]
+        return cls(answer, mask, weight)
+
+
+class AnswerMatrix:
+    """
+    Users' answers in CSR layout: one row per user, one column per indexed
+    question. The three data arrays share indptr and indices.
+
+    Attributes:
+        usernames (list): row labels
+        indptr, indices (ndarray): CSR structure
+        answer (ndarray int8): answer index of each entry
+        mask (ndarray uint8): acceptable bitmask of each entry
+        weight (ndarray float32): importance weight of each entry
+        n_questions (int): number of columns
+    """
+
+    def __init__(self, usernames, indptr, indices, answer, mask, weight, n_questions):
+        self.usernames = list(usernames)
+        self.indptr = indptr
+        self.indices = indices
+        self.answer = answer
+        self.mask = mask
+        self.weight = weight
+        self.n_questions = n_questions
+
+    def __len__(self):
+        return len(self.usernames)
+
+    @classmethod
+    def from_users(cls, docs, index):
+        """
+        Builds the matrix from db.users documents with parsed questions (see
+        parse_profiles). Answers to questions missing from index are dropped.
+
+        Parameters:
+            docs (iterable): user documents with _id and parsed.questions
+            index (QuestionIndex): columns, usually from the scrapers' versions
+        """
+        usernames, indptr, cols, answers = [], [0], [], []
+        for doc in docs:
+            seen = set()
+            for q in (doc.get('parsed') or dict()).get('questions') or []:
+                found = index.answer_index(q['q_text'], q.get('their_answer'))
+                if found is None or found[0] in seen:
+                    continue
+                seen.add(found[0])
+                cols.append(found[0])
+                answers.append(found[1])
+            usernames.append(doc['_id'])
+            indptr.append(len(cols))
+        answer = np.array(answers, dtype=np.int8)
+        return cls(usernames, np.array(indptr, dtype=np.int64),
+            np.array(cols, dtype=np.int32), answer,
+            (np.uint8(1) << answer.astype(np.uint8)).astype(np.uint8),
+            np.full(len(answer), IMPORTANCE_WEIGHTS[THEIR_IMPORTANCE], dtype=np.float32),
+            len(index))
+
+    def one_hot(self):
+        """Users x (questions * MAX_CHOICES) matrix with a 1 at each given answer."""
+        return sparse.csr_matrix((np.ones(len(self.answer), dtype=np.float32),
+            self.indices.astype(np.int64) * MAX_CHOICES + self.answer, self.indptr),
+            shape=(len(self), self.n_questions * MAX_CHOICES))
+
+    def accepted(self):
+        """
+        Users x (questions * MAX_CHOICES) matrix holding the question's weight
+        at every answer the user accepts.
+        """
+        bits = (self.mask[:, None] >> np.arange(MAX_CHOICES, dtype=np.uint8)) & 1
+        entry, choice = np.nonzero(bits)
+        rows = np.repeat(np.arange(len(self)), np.diff(self.indptr))[entry]
+        return sparse.csr_matrix((self.weight[entry],
+            (rows, self.indices[entry].astype(np.int64) * MAX_CHOICES + choice)),
+            shape=(len(self), self.n_questions * MAX_CHOICES))
+
+    def weights(self):
+        """Users x questions matrix of importance weights."""
+        return sparse.csr_matrix((self.weight, self.indices, self.indptr),
+            shape=(len(self), self.n_questions))
+
+    def answered(self):
+        """Users x questions matrix with a 1 wherever the user answered."""
+        return sparse.csr_matrix((np.ones(len(self.answer), dtype=np.float32),
+            self.indices, self.indptr), shape=(len(self), self.n_questions))
+
+
+def _finish(num_a, den_a, num_b, den_b, common):
+    """Turns satisfaction sums into (match, enemy) arrays, nan without common questions."""
+    with np.errstate(divide='ignore', invalid='ignore'):
+        sat_a, sat_b = num_a / den_a, num_b / den_b
+        match = np.sqrt(sat_a * sat_b) - 1.0 / common
+        enemy = np.sqrt((1 - sat_a) * (1 - sat_b))
+    match = np.clip(match, 0, 1)
+    match[common == 0] = np.nan
+    enemy[common == 0] = np.nan
+    return match, enemy
+
+
+def score_against(matrix, target, chunk_entries=1<<22):
+    """
+    Scores every user in matrix against one person, e.g. a scraper version.
+    Works through the entries a chunk of rows at a time, so memory stays
+    around chunk_entries times a few arrays.
+
+    Parameters:
+        matrix (AnswerMatrix): users to score
+        target (AnswerVector): the person to score them against
+        chunk_entries (int): answers processed per step
+
+    Returns:
+        (match, enemy, common) arrays with one entry per user; match and
+        enemy are fractions, nan for users with no questions in common
+    """
+    n = len(matrix)
+    sums = np.zeros((5, n), dtype=np.float64)
+    start = 0
+    while start < n:
+        #as many rows as fit in the budget, but at least one
+        end = max(start+1, int(np.searchsorted(matrix.indptr,
+            matrix.indptr[start] + chunk_entries, 'right')) - 1)
+        end = min(end, n)
+        lo, hi = matrix.indptr[start], matrix.indptr[end]
+        q = matrix.indices[lo:hi]
+        ans = matrix.answer[lo:hi]
+        their = target.answer[q]
+        common = their >= 0
+        w_t = target.weight[q] * common
+        w_u = matrix.weight[lo:hi] * common
+        #does the target accept the user's answer, and the user the target's
+        ok_t = (target.mask[q] >> ans.astype(np.uint8)) & 1
+        ok_u = (matrix.mask[lo:hi] >> np.maximum(their, 0).astype(np.uint8)) & 1
+        rows = np.repeat(np.arange(end-start), np.diff(matrix.indptr[start:end+1]))
+        for i, values in enumerate([w_t*ok_t, w_t, w_u*ok_u, w_u, common]):
+            sums[i, start:end] = np.bincount(rows, weights=values, minlength=end-start)
+        start = end
+    match, enemy = _finish(*sums)
+    return match, enemy, sums[4].astype(np.int64)
+
+
+def iter_pair_scores(matrix, block_cells=1<<24):
+    """
+    Scores every pair of users in matrix, a block of rows at a time, using
+    sparse matrix products. Blocks are block_cells cells or fewer, so the
+    whole users x users result never has to be in memory at once.
+
+    Yields:
+        (row start, match, enemy, common) where the arrays are
+        rows x all users, for rows start to start+len(match)
+    """
+    n = len(matrix)
+    onehot, accepted = matrix.one_hot(), matrix.accepted()
+    weights, answered = matrix.weights(), matrix.answered()
+    onehot_t, accepted_t = onehot.T.tocsr(), accepted.T.tocsr()
+    weights_t, answered_t = weights.T.tocsr(), answered.T.tocsr()
+    rows = max(1, block_cells // max(n, 1))
+    for start in range(0, n, rows):
+        end = min(n, start+rows)
+        dense = lambda m: np.asarray(m.todense(), dtype=np.float64)
+        #row user's satisfaction with each column user, and the reverse
+        num_a = dense(accepted[start:end] @ onehot_t)
+        den_a = dense(weights[start:end] @ answered_t)
+        num_b = dense(onehot[start:end] @ accepted_t)
+        den_b = dense(answered[start:end] @ weights_t)
+        common = dense(answered[start:end] @ answered_t)
+        match, enemy = _finish(num_a, den_a, num_b, den_b, common)
+        yield start, match, enemy, common.astype(np.int64)
+
+
+def top_matches(matrix, k=10, block_cells=1<<24):
+    """
+    Returns each user's k best matches among the other users.
+
+    Returns:
+        dict of username -> list of (username, match), best first
+    """
+    out = dict()
+    for start, match, _, _ in iter_pair_scores(matrix, block_cells):
+        match = np.nan_to_num(match, nan=-1.0)
+        match[np.arange(len(match)), np.arange(start, start+len(match))] = -1.0
+        kk = min(k, match.shape[1])
+        best = np.argpartition(-match, kk-1, axis=1)[:, :kk]
+        for i, cols in enumerate(best):
+            cols = cols[np.argsort(-match[i, cols])]
+            out[matrix.usernames[start+i]] = [(matrix.usernames[c], float(match[i, c]))
+                for c in cols if match[i, c] >= 0]
+    return out
+
+
+class MatchScorer:
+    """
+    Scores stored users against a scraper's question data and keeps the
+    results in db.match_scores as
+        {_id: '<scraper>/<version>/<username>', scraper, version, username,
+         match, enemy, common, source}
+    where source is the user's metadata.time when scored. Incremental runs
+    only read and rescore users whose metadata.time differs from the stored
+    source, or who have no score for the version yet.
+
+    Attributes:
+        db (pymongo.database.Database): okc database
+        scraper (str): alias whose answers users are scored against
+        version (str): the scraper version scored against
+        index (QuestionIndex): columns of the scraper's questions
+        target (AnswerVector): the scraper's answers
+    """
+
+    def __init__(self, db, scraper, version=None):
+        """
+        Constructor for the MatchScorer class
+
+        Parameters:
+            db (pymongo.database.Database): okc database
+            scraper (str): scraper alias
+            version (str): version to score against, the current one if None
+        """
+        self.db = db
+        self.scraper = scraper
+        versions = VersionStore(db, scraper)
+        self.version = version or versions.current_version
+        questions = versions.rebuild(self.version)
+        self.index = QuestionIndex(questions)
+        self.target = AnswerVector.from_question_data(questions, self.index)
+        self.db.match_scores.create_index([('scraper', ASCENDING), ('version', ASCENDING)])
+
+    def _changed_users(self):
+        scored = {d['username']: d.get('source') for d in self.db.match_scores.find(
+            {'scraper': self.scraper, 'version': self.version}, {'username': 1, 'source': 1})}
+        return [d['_id'] for d in self.db.users.find({'parsed': {'$exists': True}},
+            {'metadata.time': 1}) if d['_id'] not in scored or
+            scored[d['_id']] != (d.get('metadata') or dict()).get('time')]
+
+    def run(self, incremental=True, batch_size=10000):
+        """
+        Scores users and writes the results, batch_size users at a time.
+
+        Parameters:
+            incremental (bool): only score users that changed since they were
+                last scored against this version
+            batch_size (int): users read, scored and written per round
+
+        Returns:
+            number of users scored
+        """
+        fields = {'parsed.questions': 1, 'metadata.time': 1}
+        count = 0
+        if incremental:
+            #a batch of ids per query keeps each query well under Mongo's size limit
+            changed = self._changed_users()
+            for i in range(0, len(changed), batch_size):
+                count += self._score(list(self.db.users.find(
+                    {'_id': {'$in': changed[i:i+batch_size]}}, fields)))
+            return count
+        cursor = self.db.users.find({'parsed': {'$exists': True}}, fields,
+            batch_size=batch_size, no_cursor_timeout=True)
+        try:
+            batch = []
+            for doc in cursor:
+                batch.append(doc)
+                if len(batch) == batch_size:
+                    count += self._score(batch)
+                    batch = []
+            if batch:
+                count += self._score(batch)
+        finally:
+            cursor.close()
+        return count
+
+    def _score(self, docs):
+        matrix = AnswerMatrix.from_users(docs, self.index)
+        match, enemy, common = score_against(matrix, self.target)
+        nan_none = lambda x: None if np.isnan(x) else float(x)
+        self.db.match_scores.bulk_write([UpdateOne(
+            {'_id': f'{self.scraper}/{self.version}/{doc["_id"]}'},
+            {'$set': {
+                'scraper': self.scraper,
+                'version': self.version,
+                'username': doc['_id'],
+                'match': nan_none(match[i]),
+                'enemy': nan_none(enemy[i]),
+                'common': int(common[i]),
+                'source': (doc.get('metadata') or dict()).get('time')
+            }}, upsert=True) for i, doc in enumerate(docs)], ordered=False)
+        return len(docs)
+
+
+if __name__=='__main__':
+    parser = argparse.ArgumentParser(description='Score stored users against a scraper')
+    parser.add_argument('scraper')
+    parser.add_argument('--version', default=None, help='scraper version (default: current)')
+    parser.add_argument('--full', action='store_true', help='rescore every user')
+    parser.add_argument('--batch-size', type=int, default=10000)
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    scorer = MatchScorer(MongoClient('localhost', 27017).okc, args.scraper, args.version)
+    n = scorer.run(not args.full, args.batch_size)
+    print(f'scored {n} users against {args.scraper}/{scorer.version} '
+        f'in {time.perf_counter() - start:.1f}s')
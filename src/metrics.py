@@ -0,0 +1,207 @@
+from collections import deque
+from contextlib import contextmanager, nullcontext
+import bisect, json, os, threading, time
+
+#upper bounds in seconds, from a quick WebDriver call to a slow page
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+
+class Histogram:
+    """
+    Latency histogram with fixed cumulative buckets over its whole life, plus
+    a rolling window of the most recent samples for percentiles.
+    """
+
+    def __init__(self, buckets=DEFAULT_BUCKETS, window=1000):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets)+1)
+        self.count = 0
+        self.sum = 0.0
+        self.recent = deque(maxlen=window)
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+        self.recent.append(value)
+
+    def percentile(self, p):
+        """p-th percentile (0-100) of the rolling window, None if it's empty."""
+        if not self.recent:
+            return None
+        ordered = sorted(self.recent)
+        return ordered[min(len(ordered)-1, int(p / 100 * len(ordered)))]
+
+    def summary(self):
+        return {
+            'count': self.count,
+            'sum': self.sum,
+            'mean': self.sum / self.count if self.count else None,
+            'p50': self.percentile(50),
+            'p95': self.percentile(95),
+            'p99': self.percentile(99),
+            'max_recent': max(self.recent) if self.recent else None
+        }
+
+
+def _key(name, labels):
+    return (name, tuple(sorted(labels.items())))
+
+
+def _prom_labels(labels, extra=()):
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{k}="{v}"' for k, v in pairs) + '}'
+
+
+class Metrics:
+    """
+    Counters and latency histograms for a scraping run, exportable as a JSON
+    summary and as a Prometheus text file.
+
+    Names follow Prometheus conventions, and labels are keyword arguments,
+    e.g. metrics.inc('retries', where='findout') or
+    metrics.timer('phase_seconds', phase='images').
+    """
+
+    enabled = True
+
+    def __init__(self, buckets=DEFAULT_BUCKETS, window=1000):
+        self.buckets = buckets
+        self.window = window
+        self.counters = dict()
+        self.histograms = dict()
+        self.started = time.time()
+        self._lock = threading.Lock()
+        self._exporter = None
+
+    def inc(self, name, n=1, **labels):
+        """Adds n to a counter."""
+        key = _key(name, labels)
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + n
+
+    def observe(self, name, value, **labels):
+        """Adds a sample, in seconds, to a histogram."""
+        key = _key(name, labels)
+        with self._lock:
+            hist = self.histograms.get(key)
+            if hist is None:
+                hist = self.histograms[key] = Histogram(self.buckets, self.window)
+            hist.observe(value)
+
+    @contextmanager
+    def timer(self, name, **labels):
+        """Times the with block into a histogram."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, **labels)
+
+    def instrument_driver(self, driver):
+        """
+        Counts and times every WebDriver command the driver sends. Every
+        command, including the ones WebElements send, goes through
+        driver.execute, so wrapping that one method catches them all.
+        """
+        execute = driver.execute
+
+        def timed_execute(command, params=None):
+            start = time.perf_counter()
+            try:
+                return execute(command, params)
+            finally:
+                self.observe('webdriver_seconds', time.perf_counter() - start,
+                    command=command)
+        driver.execute = timed_execute
+
+    def summary(self):
+        """Returns everything recorded so far as a JSON-friendly dict."""
+        fmt = lambda key: key[0] + _prom_labels(key[1])
+        with self._lock:
+            return {
+                'started': self.started,
+                'elapsed': time.time() - self.started,
+                'counters': {fmt(k): v for k, v in sorted(self.counters.items())},
+                'histograms': {fmt(k): h.summary() for k, h in sorted(self.histograms.items())}
+            }
+
+    def write_json(self, path):
+        """Writes summary() to path."""
+        with open(path, 'w') as f:
+            json.dump(self.summary(), f, indent=2)
+
+    def prometheus_text(self):
+        """Returns the metrics in the Prometheus text exposition format."""
+        lines = []
+        with self._lock:
+            for (name, labels), value in sorted(self.counters.items()):
+                lines.append(f'okc_{name}_total{_prom_labels(labels)} {value}')
+            for (name, labels), hist in sorted(self.histograms.items()):
+                cumulative = 0
+                for bound, n in zip(list(hist.buckets) + ['+Inf'], hist.counts):
+                    cumulative += n
+                    lines.append(f'okc_{name}_bucket{_prom_labels(labels, [("le", bound)])} '
+                        f'{cumulative}')
+                lines.append(f'okc_{name}_sum{_prom_labels(labels)} {hist.sum}')
+                lines.append(f'okc_{name}_count{_prom_labels(labels)} {hist.count}')
+        return '\n'.join(lines) + '\n'
+
+    def write_prometheus(self, path):
+        """Writes prometheus_text() to path atomically, for a textfile collector."""
+        tmp = path + '.tmp'
+        with open(tmp, 'w') as f:
+            f.write(self.prometheus_text())
+        os.replace(tmp, path)
+
+    def start_exporter(self, path, interval=15):
+        """Rewrites the Prometheus file at path every interval seconds until stop_exporter."""
+        stop = threading.Event()
+
+        def run():
+            while not stop.wait(interval):
+                self.write_prometheus(path)
+        thread = threading.Thread(target=run, daemon=True)
+        thread.start()
+        self._exporter = (stop, thread, path)
+
+    def stop_exporter(self):
+        """Stops the exporter thread and writes the file one last time."""
+        if self._exporter is not None:
+            stop, thread, path = self._exporter
+            stop.set()
+            thread.join()
+            self.write_prometheus(path)
+            self._exporter = None
+
+
+class NullMetrics:
+    """
+    Stand-in used when instrumentation is off. Every method does nothing, so
+    instrumented code costs a method call and no locking or timing.
+    """
+
+    enabled = False
+
+    def inc(self, name, n=1, **labels):
+        pass
+
+    def observe(self, name, value, **labels):
+        pass
+
+    def timer(self, name, **labels):
+        return nullcontext()
+
+    def instrument_driver(self, driver):
+        pass
+
+    def summary(self):
+        return dict()
+
+    def start_exporter(self, path, interval=15):
+        pass
+
+    def stop_exporter(self):
+        pass
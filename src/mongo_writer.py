@@ -0,0 +1,280 @@
+from pymongo import ReplaceOne, InsertOne
+from pymongo.errors import BulkWriteError, ConnectionFailure, ExecutionTimeout
+from contextlib import contextmanager
+from datetime import datetime
+import threading, time
+
+DUPLICATE_KEY = 11000
+
+#write error codes of a server stepping down or shutting down, which a retry can get past
+RETRYABLE_CODES = {6, 7, 89, 91, 189, 262, 9001, 10107, 11600, 11602, 13435, 13436}
+
+#errors a whole batch can be retried after, like a dropped connection
+RETRYABLE_ERRORS = (ConnectionFailure, ExecutionTimeout)
+
+#collections are flushed in this order, so documents land before what
+#points at them or marks them done; others follow in the order first queued
+FLUSH_ORDER = ['scraper_versions', 'scrapers', 'users', 'user_history', 'answer_index',
+    'usernames', 'crawl_checkpoints']
+
+
+class BulkWriter:
+    """
+    Write-behind buffer for the scraper's Mongo writes. Operations are queued
+    per collection and sent as unordered bulk_writes once max_batch operations
+    are pending, once max_delay seconds have passed since the oldest pending
+    one, or on flush/close. Duplicate keys are counted as skipped and don't
+    stop the rest of the batch.
+
+    Collections are written in FLUSH_ORDER and a flush stops at the first one
+    that fails, so nothing that depends on an unwritten operation lands
+    before it. Operations that failed for a reason a retry can get past stay
+    queued for the next flush. Ones that can never be written, like a
+    document too large or failing validation, are moved to dead_letters
+    together with the rest of their unit (see unit) so they don't block the
+    writer. Either way the error is raised, by the flush or, for a flush on
+    the timer thread, by the next add, flush or close.
+
+    Attributes:
+        db (pymongo.database.Database): database written to
+        max_batch (int): pending operations that trigger a flush
+        max_delay (float): seconds an operation may wait before being flushed
+        counts (dict): running totals of inserted, updated, skipped and
+            dead lettered writes
+        dead_letters (list): (collection, operation, error) for each
+            operation given up on
+        metrics (Metrics): optional, gets write counts and bulk_write latencies
+    """
+
+    def __init__(self, db, max_batch=500, max_delay=5.0, metrics=None):
+        """
+        Constructor for the BulkWriter class. Starts a background thread that
+        flushes by time.
+
+        Parameters:
+            db (pymongo.database.Database): database written to
+            max_batch (int): pending operations that trigger a flush
+            max_delay (float): seconds an operation may wait before being flushed
+            metrics (Metrics): optional, gets write counts and bulk_write latencies
+        """
+        self.db = db
+        self.metrics = metrics
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self.counts = {'inserted': 0, 'updated': 0, 'skipped': 0, 'dead': 0}
+        self.dead_letters = []
+        self._pending = dict()
+        self._npending = 0
+        self._oldest = None
+        self._error = None
+        self._local = threading.local()
+        self._lock = threading.RLock()
+        self._closed = threading.Event()
+        self._timer = threading.Thread(target=self._flush_on_timer, daemon=True)
+        self._timer.start()
+
+    def add(self, collection, op):
+        """
+        Queues a pymongo write operation (InsertOne, UpdateOne, ReplaceOne...)
+        for the named collection.
+        """
+        with self._lock:
+            if self._closed.is_set():
+                raise RuntimeError('BulkWriter is closed')
+            self._raise_error()
+            unit = getattr(self._local, 'unit', None)
+            self._pending.setdefault(collection, []).append((op, unit))
+            self._npending += 1
+            if self._oldest is None:
+                self._oldest = time.monotonic()
+            if self._npending >= self.max_batch:
+                self.flush()
+
+    @contextmanager
+    def unit(self):
+        """
+        Ties together the operations queued in the with block, e.g. a
+        document and the update marking it done: if one of them is dead
+        lettered, the ones still pending are dead lettered with it instead of
+        written without it. Nested blocks join the outer unit.
+        """
+        if getattr(self._local, 'unit', None) is not None:
+            yield
+            return
+        self._local.unit = object()
+        try:
+            yield
+        finally:
+            self._local.unit = None
+
+    def add_user(self, doc):
+        """
+        Queues a scraped user document from scrape_user, replacing any older
+        copy, stamped with the utc time it was queued as 'written'.
+        """
+        self.add('users', ReplaceOne({'_id': doc['_id']},
+            dict(doc, written=datetime.utcnow()), upsert=True))
+
+    def add_usernames(self, usernames):
+        """
+        Queues usernames for db.usernames, with the utc time they were added
+        as both added and changed. Ones already there fail with a duplicate
+        key and are counted as skipped.
+        """
+        added = datetime.utcnow()
+        for u in usernames:
+            self.add('usernames', InsertOne({'_id': u, 'added': added, 'changed': added}))
+
+    def add_version(self, doc):
+        """Queues a scraper question data version document for db.scraper_versions."""
+        self.add('scraper_versions', InsertOne(doc))
+
+    def flush(self):
+        """
+        Sends the pending operations now, a collection at a time in
+        FLUSH_ORDER, up to the first collection that fails.
+
+        Returns:
+            the running counts of inserted, updated, skipped and dead writes
+
+        Raises:
+            the error writing the collection that failed, or else the one a
+            timed flush hit since the last add or flush
+        """
+        with self._lock:
+            error = None
+            rank = {collection: i for i, collection in enumerate(FLUSH_ORDER)}
+            for collection in sorted(self._pending, key=lambda c: rank.get(c, len(rank))):
+                entries = self._pending.pop(collection)
+                self._npending -= len(entries)
+                retry, dead, error = self._send(collection, [op for op, _ in entries])
+                if retry:
+                    self._pending[collection] = [entries[i] for i in retry]
+                    self._npending += len(retry)
+                if dead:
+                    self._dead_letter(collection, [entries[i] for i in dead], error)
+                if error is not None:
+                    #what's queued after this collection may depend on it, so it waits
+                    break
+            #retry what's left after another max_delay, not on the next tick
+            self._oldest = time.monotonic() if self._npending else None
+            if error is not None:
+                self._error = None
+                raise error
+            self._raise_error()
+            return dict(self.counts)
+
+    def _send(self, collection, ops):
+        """
+        Writes ops to collection.
+
+        Returns:
+            (indexes of the ops to retry, indexes of the ops that can't ever
+            be written, the error or None)
+        """
+        try:
+            self._write(collection, ops)
+            return [], [], None
+        except BulkWriteError as e:
+            retry, dead = [], []
+            for err in e.details.get('writeErrors', []):
+                if err['code'] != DUPLICATE_KEY:
+                    (retry if err['code'] in RETRYABLE_CODES else dead).append(err['index'])
+            return retry, dead, e
+        except RETRYABLE_ERRORS as e:
+            return list(range(len(ops))), [], e
+        except Exception as e:
+            if len(ops) == 1:
+                return [], [0], e
+            #e.g. DocumentTooLarge doesn't say which op it was; send them one at a time to find it
+            retry, dead = [], []
+            for i, op in enumerate(ops):
+                r, d, _ = self._send(collection, [op])
+                if r:
+                    retry.append(i)
+                elif d:
+                    dead.append(i)
+            return retry, dead, e
+
+    def _dead_letter(self, collection, entries, error):
+        """Gives up on entries, and on what's still pending of their units."""
+        units = {unit for _, unit in entries if unit is not None}
+        dead = [(collection, op) for op, _ in entries]
+        for other in list(self._pending):
+            kept = []
+            for op, unit in self._pending[other]:
+                if unit in units:
+                    dead.append((other, op))
+                else:
+                    kept.append((op, unit))
+            self._npending -= len(self._pending[other]) - len(kept)
+            if kept:
+                self._pending[other] = kept
+            else:
+                del self._pending[other]
+        self.dead_letters.extend((c, op, error) for c, op in dead)
+        self.counts['dead'] += len(dead)
+        if self.metrics is not None:
+            for c, _ in dead:
+                self.metrics.inc('mongo_dead_letters', collection=c)
+
+    def _raise_error(self):
+        error, self._error = self._error, None
+        if error is not None:
+            raise error
+
+    def _write(self, collection, ops):
+        start = time.perf_counter()
+        error = None
+        try:
+            result = self.db[collection].bulk_write(ops, ordered=False)
+            details = result.bulk_api_result
+        except BulkWriteError as e:
+            details = e.details
+            errors = details.get('writeErrors', [])
+            duplicates = sum(err['code'] == DUPLICATE_KEY for err in errors)
+            if duplicates < len(errors):
+                error = e
+            self.counts['skipped'] += duplicates
+        inserted = details.get('nInserted', 0) + details.get('nUpserted', 0)
+        self.counts['inserted'] += inserted
+        self.counts['updated'] += details.get('nModified', 0)
+        #matched but unchanged, e.g. a re-scraped user whose document is identical
+        self.counts['skipped'] += details.get('nMatched', 0) - details.get('nModified', 0)
+        if self.metrics is not None:
+            self.metrics.observe('mongo_write_seconds', time.perf_counter() - start,
+                collection=collection)
+            self.metrics.inc('mongo_writes', len(ops), collection=collection)
+        if error is not None:
+            raise error
+
+    def _flush_on_timer(self):
+        while not self._closed.wait(min(self.max_delay, 1.0)):
+            with self._lock:
+                due = self._oldest is not None and\
+                    time.monotonic() - self._oldest >= self.max_delay
+            if due:
+                try:
+                    self.flush()
+                except Exception as e:
+                    #keep the thread alive; the caller sees this on its next call
+                    with self._lock:
+                        self._error = e
+
+    def close(self):
+        """
+        Flushes what's pending and stops the timer thread. Raises like flush
+        if anything couldn't be written.
+        """
+        with self._lock:
+            if self._closed.is_set():
+                return dict(self.counts)
+            self._closed.set()
+        self._timer.join()
+        return self.flush()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
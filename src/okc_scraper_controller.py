@@ -1,120 +1,419 @@
-from selenium.webdriver import Chrome
 from selenium.common.exceptions import ElementClickInterceptedException,\
-     NoSuchElementException, StaleElementReferenceException
-from selenium.webdriver.common.keys import Keys
-from selenium.webdriver.chrome.options import Options
-from pymongo import MongoClient
+     NoSuchElementException, StaleElementReferenceException, TimeoutException,\
+     WebDriverException
 from datetime import datetime
-from urllib.parse import urlparse
-from bs4 import BeautifulSoup
-import pandas as pd
-import numpy as np
-import time, os, requests
+from waits import Waiter, element_present, element_clickable, any_present,\
+    element_absent, count_reached, staleness_of, filter_counts,\
+    filter_count_changed, text_changed, url_changed
+from extract import extract_self_questions, extract_question_html, count_questions,\
+    read_match_cards, read_profile_signals, answer_overlay, overlay_selected, overlay_question
+from infinite_scroll import load_questions
+from sessions import SessionStore, DEFAULT_SESSION_DIR
+from metrics import NullMetrics
+from browser_profile import ResourcePolicy
+from answer_checkpoint import AnswerCheckpoint, pending_tasks
+from credentials import read_account, DEFAULT_CREDENTIALS_PATH
+from contextlib import contextmanager
+import math, random, time, os
+
+#selenium.webdriver, pymongo, requests, zstandard, aiohttp and numpy are imported
+#where they're first needed, so importing this module stays cheap and a
+#Scraper only pays for the browser or database once it uses them.
+
+#the expensive steps of scrape_user that rescrape_user can skip
+RESCRAPE_STEPS = ['AGREE', 'DISAGREE', 'profile_html', 'images']
+#the steps whose output a document's parsed fields are read from
+PARSED_STEPS = {'AGREE', 'DISAGREE', 'profile_html'}
 
 class Scraper:
     """
     Class for an OkCupid Scraper
 
+    The browser is only started the first time driver or wait is used, and
+    Mongo is only connected to the first time db, writer or versions is, so
+    database-only work never starts Chrome.
+
     Attributes: 
         name (str): alias for the account that will be used to access OKC for scraping
         driver (WebDriver): tool used to get and navigate web pages
-        mongoclient (pymongo.mongo_client.MongoClient): mongo database client to store data
+        db (pymongo.database.Database): database the scraper stores data in
         email (str): email of the scraper account
         pw (str): password of the scraper account
         version (str): date string of the datetime when current version was completed.
+        versions (VersionStore): the scraper's question data versions
+        image_pipelines (dict): save directory -> ImagePipeline downloading into it
+        writer (BulkWriter): batches the scraper's Mongo writes
+        last_load (LoadResult): count, batches and seconds of the last question list load
+        wait (Waiter): waits on page conditions and records how long each wait took
+        base_url (str): site the scraper navigates, without a trailing slash
+        rate_limiter: optional object whose acquire() is called before every page load
+        sessions (SessionStore): saved login sessions, see start_session
+        startup_timings (dict): phase -> seconds spent in it while constructing
+            the scraper and starting its session
+        metrics (Metrics): phase timings, WebDriver command counts and retries.
+            A NullMetrics that records nothing unless metrics are passed in.
+        html_store (HtmlStore): compresses stored users' html, None to store it raw
+        answer_index (AnswerIndex): inverted index of stored users' answers, or None
+        resource_policy (ResourcePolicy): what the browser may load, None for everything
+        checkpoints (dict): task -> AnswerCheckpoint of answers not yet in a version
+        fetcher (FetchBackend): fetches pages over HTTP with the browser's
+            session once logged in, if fetch is on. None until then.
+        rescrape_stats (dict): users re-scraped, and how often each step was
+            run or skipped, see rescrape_user
     """
 
-    def __init__(self, name, headless = True, driverpath=f'{os.getcwd()}/src/chromedriver'):
+    def __init__(self, name, headless = True, driverpath=f'{os.getcwd()}/src/chromedriver',
+            wait_timeout=10, poll_interval=0.1, base_url='https://www.okcupid.com',
+            rate_limiter=None, user_data_dir=None, session_dir=DEFAULT_SESSION_DIR,
+            db=None, credentials_path=DEFAULT_CREDENTIALS_PATH, metrics=None,
+            compress_html=False, compact_questions=False, index_answers=False,
+            resource_policy=None, checkpoint_every=25, checkpoint_seconds=60, fetch=False,
+            fetch_concurrency=8):
         """
         Constructor for the Scraper class
 
         Parameters:
             name (str): alias for the account that will be used to access okc for scraping
             driverpath (str): path to the web driver file
+            wait_timeout (float): seconds to wait for a page condition before giving up
+            poll_interval (float): seconds between checks of a page condition
+            base_url (str): site to scrape, e.g. a local fixture site for testing
+            rate_limiter: optional object whose acquire() is called before every
+                page load, e.g. a pool-wide SharedRateLimiter
+            user_data_dir (str): Chrome profile directory to reuse between runs,
+                which keeps the browser's own cookies and storage
+            session_dir (str): directory saved login sessions are kept in
+            db (pymongo.database.Database): database to use instead of okc on
+                the local mongod, e.g. for benchmarks
+            credentials_path (str): csv of alias, email and pw for the accounts
+            metrics (Metrics): records where the scraper's time goes. Off if None.
+            compress_html (bool): store users' html compressed and deduplicated
+                through an HtmlStore instead of raw
+            compact_questions (bool): store question data versions as ids into
+                the shared QuestionCatalog instead of full text
+            index_answers (bool): keep db.answer_index up to date with the
+                questions of every user stored
+            resource_policy (ResourcePolicy): blocks images, fonts and the like
+                while navigating. True for the default policy, None to load
+                everything.
+            checkpoint_every (int): save answered questions to their checkpoint
+                after this many
+            checkpoint_seconds (float): or once the oldest unsaved one is this old
+            fetch (bool): after logging in, fetch profile and question pages
+                over HTTP where the server's html has what scrape_user needs,
+                and only load the rest in the browser
+            fetch_concurrency (int): fetches in flight at once at most
         """
         self.name = name
-        opt = Options()
-        opt.headless = headless
-        self.driver = Chrome(executable_path=driverpath, options=opt)
-        self.db = MongoClient('localhost', 27017).okc
+        self.base_url = base_url
+        self.rate_limiter = rate_limiter
+        self.user_data_dir = user_data_dir
+        self.sessions = SessionStore(session_dir)
+        self.startup_timings = dict()
+        self.metrics = metrics if metrics is not None else NullMetrics()
+        self.resource_policy = ResourcePolicy() if resource_policy is True else resource_policy
 
-        #get email and password from file
-        user = pd.read_csv('src/okc_account_credentials', index_col=0).loc[name]
-        self.email = user.email
-        self.pw = user.pw
+        self._driver_options = (headless, driverpath, wait_timeout, poll_interval)
+        self._db_options = (db, compress_html, compact_questions, index_answers)
 
+        #get email and password from file
+        with self._timed('credentials'):
+            self.email, self.pw = read_account(name, credentials_path)
+
+        self.image_pipelines = dict()
+        self.checkpoints = dict()
+        self.checkpoint_every = checkpoint_every
+        self.checkpoint_seconds = checkpoint_seconds
+        self.fetch = fetch
+        self.fetch_concurrency = fetch_concurrency
+        self.fetcher = None
+        self.last_load = None
+        self._html_reader = None
+        self.rescrape_stats = {'users': 0, 'new_users': 0, 'questions_skipped': 0,
+            'images_skipped': 0, 'run': dict.fromkeys(RESCRAPE_STEPS, 0),
+            'skipped': dict.fromkeys(RESCRAPE_STEPS, 0)}
+    
+    @contextmanager
+    def _timed(self, phase):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.startup_timings[phase] = time.perf_counter() - start
+            self.metrics.observe('startup_seconds', self.startup_timings[phase], phase=phase)
+
+    #attributes only set once the browser or the database is first used
+    DRIVER_HANDLES = {'driver', 'wait', '_blocking'}
+    DB_HANDLES = {'db', 'writer', 'versions', 'html_store', 'answer_index'}
+
+    def __getattr__(self, attr):
+        #only called for attributes not set yet
+        if attr in Scraper.DRIVER_HANDLES:
+            self._start_driver()
+        elif attr in Scraper.DB_HANDLES:
+            self._open_db()
+        else:
+            raise AttributeError(f"'Scraper' object has no attribute '{attr}'")
+        return self.__dict__[attr]
+
+    def _start_driver(self):
+        """Starts Chrome with the scraper's options."""
+        from selenium.webdriver import Chrome
+        from selenium.webdriver.chrome.options import Options
+        headless, driverpath, wait_timeout, poll_interval = self._driver_options
+        with self._timed('driver'):
+            opt = Options()
+            opt.headless = headless
+            if self.user_data_dir is not None:
+                opt.add_argument(f'--user-data-dir={self.user_data_dir}')
+            if self.resource_policy is not None:
+                self.resource_policy.configure(opt)
+            driver = Chrome(executable_path=driverpath, options=opt)
+            self._blocking = None
+            if self.resource_policy is not None:
+                self._blocking = self.resource_policy.attach(driver)
+            self.metrics.instrument_driver(driver)
+            self.wait = Waiter(driver, wait_timeout, poll_interval, metrics=self.metrics)
+            self.driver = driver
+
+    def _open_db(self):
+        """Connects to Mongo and loads the scraper's current version."""
+        from mongo_writer import BulkWriter
+        from version_store import VersionStore
+        db, compress_html, compact_questions, index_answers = self._db_options
+        with self._timed('db'):
+            if db is None:
+                from pymongo import MongoClient
+                db = MongoClient('localhost', 27017).okc
+            writer = BulkWriter(db, metrics=self.metrics)
+            if compress_html:
+                from html_store import HtmlStore
+                self.html_store = HtmlStore(db)
+            else:
+                self.html_store = None
+            if index_answers:
+                from answer_index import AnswerIndex
+                self.answer_index = AnswerIndex(db, writer)
+            else:
+                self.answer_index = None
 
         #fetch current version
-        record = self.db.scrapers.find_one({'_id': name})
-        if record != None:
-            self.version = record['current_version']
-        else:
-            self.version = None
-    
+        with self._timed('versions'):
+            catalog = None
+            if compact_questions:
+                from question_catalog import QuestionCatalog
+                catalog = QuestionCatalog(db)
+            self.versions = VersionStore(db, self.name, writer, catalog)
+        self.writer = writer
+        self.db = db
+
+    @property
+    def version(self):
+        """Id of the scraper's current question data version."""
+        return self.versions.current_version
+
+
+    def get_page(self, path):
+        """
+        Loads a page of the site, waiting on the rate limiter first if there is one.
+
+        Parameters:
+            path (str): path under base_url, e.g. '/profile'
+        """
+        if self.rate_limiter is not None:
+            with self.metrics.timer('rate_limit_seconds'):
+                self.rate_limiter.acquire()
+        if self._blocking is not None:
+            self._blocking.set(self.resource_policy.patterns_for(path))
+        with self.metrics.timer('page_load_seconds'):
+            self.driver.get(self.base_url + path)
+
+
     def login(self):
         """
         Logs in to the scraper's account
 
         """
-        self.driver.get('https://www.okcupid.com/login')
-        time.sleep(2)
+        self.get_page('/login')
+        login_url = self.driver.current_url
 
-        self.driver.find_element_by_class_name('accept-cookies-button')\
+        self.wait.until(element_clickable('accept-cookies-button'), 'login: cookie banner')\
             .click()
-        time.sleep(1)
-
-        try:
-            self.driver.find_element_by_class_name('login-username')\
-                .send_keys(self.email)
+        self.wait.until(element_absent('accept-cookies-button'), 'login: cookie banner closed')
 
+        #sometimes it's a different login form
+        (kind, _), username_box = self.wait.until(any_present(
+            ('class', 'login-username'), ('name', 'username')), 'login: form')
+        username_box.send_keys(self.email)
+        if kind == 'class':
             self.driver.find_element_by_class_name('login-password')\
                 .send_keys(self.pw)
-
             self.driver.find_element_by_class_name('login-actions-button')\
                 .click()
-
-        #sometimes it's a different login form
-        except NoSuchElementException:
-            self.driver.find_element_by_name('username')\
-                .send_keys(self.email)
+        else:
             self.driver.find_element_by_name('password')\
-            .send_keys(self.pw)
+                .send_keys(self.pw)
             self.driver.find_element_by_class_name('login2017-actions-button')\
                 .click()
-        time.sleep(2)
+        self.wait.until(url_changed(login_url), 'login: redirect')
+        if self.fetch:
+            self.start_fetcher()
+
+
+    def start_fetcher(self):
+        """
+        Starts (or restarts) the HTTP fetch backend with the driver's current
+        cookies, so it shares the browser's logged-in session.
+        """
+        from fetch import FetchBackend
+        if self.fetcher is not None:
+            self.fetcher.close()
+        self.fetcher = FetchBackend.from_scraper(self, concurrency=self.fetch_concurrency)
+        return self.fetcher
+
+
+    def is_logged_in(self, timeout=5):
+        """
+        Checks whether the driver's session is logged in by loading the
+        scraper's own profile and seeing whether it or a login form shows up.
+
+        Parameters:
+            timeout (float): seconds to wait for either to show
+        """
+        self.get_page('/profile')
+        found = self.wait.until_or_none(any_present(
+            ('class', 'profile-selfview-questions-more'), ('class', 'login-username'),
+            ('name', 'username')), 'session: check', timeout=timeout)
+        return found is not None and found[0][1] == 'profile-selfview-questions-more'
+
+
+    def start_session(self):
+        """
+        Gets the scraper to a logged-in page as quickly as it can: reuses the
+        saved session for this alias (or the Chrome profile in user_data_dir)
+        if it's still valid, and only goes through login() otherwise, saving
+        the new session afterwards. Time spent per phase is added to
+        startup_timings.
+
+        Returns:
+            'restored' if a saved session was reused, 'login' if it logged in
+        """
+        with self._timed('restore'):
+            restored = self.sessions.restore(self)
+        if restored or self.user_data_dir is not None:
+            with self._timed('verify'):
+                valid = self.is_logged_in()
+            if valid:
+                if self.fetch:
+                    self.start_fetcher()
+                return 'restored'
+        with self._timed('login'):
+            self.login()
+        with self._timed('save'):
+            self.sessions.save(self)
+        return 'login'
+
+
+    def close(self):
+        """
+        Finishes outstanding image downloads and Mongo writes and quits the
+        driver, staying logged in so the saved session can be reused. Only
+        closes what was opened, and quits the driver even if it has died.
+        """
+        try:
+            for pipeline in self.image_pipelines.values():
+                pipeline.close()
+            if self.fetcher is not None:
+                self.fetcher.close()
+            if 'writer' in self.__dict__:
+                self.writer.close()
+        finally:
+            if 'driver' in self.__dict__:
+                try:
+                    self.driver.quit()
+                except WebDriverException:
+                    pass
 
 
     def logout(self):
         """
-        Logs the current scraper out.
+        Logs the current scraper out, which also invalidates its saved session.
         """
-        self.driver.get('https://www.okcupid.com/logout')
+        self.get_page('/logout')
+        self.sessions.clear(self.name)
         self.driver.close()
+        for pipeline in self.image_pipelines.values():
+            pipeline.close()
+        if self.fetcher is not None:
+            self.fetcher.close()
+            self.fetcher = None
+        if 'writer' in self.__dict__:
+            self.writer.close()
 
 
     def set_first_version(self, question_data):
-    #TODO docstring
-        #qd = self.getScraperQuestionData()
-        dt_now = datetime.now().strftime('%Y%m%d_%H%M%S')
-        self.db.scrapers.insert_one({    \
-             '_id': self.name,           \
-             'current_version': dt_now,  \
-             'versions':{                \
-                dt_now: question_data    \
-        }})
-        self.version = dt_now
+        """
+        Stores question_data as the scraper's first version.
+
+        Parameters:
+            question_data (list): question data dicts, e.g. from get_scraper_question_data
+        """
+        self.versions.set_first_version(question_data)
 
 
     def add_questions_update_version(self, new_question_data):
-    #TODO docstring
-        dt_now = datetime.now().strftime('%Y%m%d_%H%M%S')
+        """
+        Adds a new version made of the current version with new_question_data
+        merged in. Only the new or changed questions are written. Checkpoints
+        whose answers are all in the new version are cleared.
+
+        Parameters:
+            new_question_data (list): question data dicts answered since the last version
+        """
+        self.versions.add_version(new_question_data)
+        texts = {q['q_text'] for q in new_question_data}
+        done = [c for c in self.checkpoints.values()
+            if len(c) and all(q['q_text'] in texts for q in c.questions)]
+        if done:
+            #the version has to be in Mongo before the only other copy goes
+            self.writer.flush()
+            for checkpoint in done:
+                checkpoint.clear()
+
+
+    def answer_checkpoint(self, task):
+        """
+        Returns the AnswerCheckpoint for task, holding whatever answers an
+        earlier run saved to it and never put in a version.
+        """
+        if task not in self.checkpoints:
+            self.checkpoints[task] = AnswerCheckpoint(self.db, self.name, task,
+                self.checkpoint_every, self.checkpoint_seconds)
+        return self.checkpoints[task]
+
+
+    def recover_answers(self):
+        """
+        Puts the answers left in any of the scraper's checkpoints, e.g. by a
+        run that crashed while answering, into a new version.
+
+        Returns:
+            number of answers recovered
+        """
+        qdata = [q for task in pending_tasks(self.db, self.name)
+            for q in self.answer_checkpoint(task).questions]
+        if qdata:
+            self.add_questions_update_version(qdata)
+        return len(qdata)
+
+
+    def current_question_data(self):
+        """
+        Returns the full question data list of the current version. Kept in
+        memory after the first call.
+        """
+        return self.versions.current_questions()
 
-        versions = self.db.scrapers.find_one({'_id':self.name})['versions']
-        prev_version = versions[self.version]
-        versions[dt_now] = Scraper._merge_question_data_versions(prev_version, new_question_data)
-        self.db.scrapers.update({'_id':self.name}, {'$set':
-            {'versions': versions, 'current_version': dt_now}})
-        self.version = dt_now
 
     def _merge_question_data_versions(prev_qd, new_qd):
         '''
@@ -122,200 +421,520 @@ class Scraper:
         two lists, where old versions of the same questions are replaced with new
         versions.
         '''
-        ret_dict = {text:question for text, question in map(
-            lambda q: (q['q_text'], q), new_qd)}
-
-        for question in prev_qd:
-            text = question['q_text']
-            if ret_dict.get(text) == None:
-                ret_dict[text] = question
-
-        return list(ret_dict.values())
+        from version_store import merge_question_data
+        return merge_question_data(prev_qd, new_qd)
 
 
     def get_scraper_question_data(self, wait=1):
-    #TODO docstring
-        self.driver.get('https://www.okcupid.com/profile')
-        time.sleep(wait*3)
-        sameq = lambda q1, q2: q1.find_element_by_xpath('button/h3').text ==\
-            q2.find_element_by_xpath('button/h3').text
-        self.driver.find_element_by_class_name('profile-selfview-questions-more').click()
-        time.sleep(wait*3)
-
-        questions = self.driver.find_elements_by_class_name('profile-question')
-        i = 0
-        current = questions[i]
-        datalist = []
+        """
+        Scrapes the scraper's own answered questions from its profile.
 
-        while not sameq(current, questions[-1]):
-            for j in range(i,len(questions)):
-
-                qdatum = Scraper.get_data_from_answer_stub(questions[j])
-                datalist.append(qdatum)
-
-                '''#open question detail overlay
-                questions[j].click()
-                #needs a moment to load
-                time.sleep(0.7)
-
-                #scrape question overlay. 
-                overlay = self.driver.find_element_by_class_name('questionspage')
-
-                #get question text
-                text = overlay.find_element_by_tag_name('h1').text
-
-                #get the choices and what our answer was
-                our_answer_buttons = overlay.find_element_by_class_name('pickonebutton-buttons')\
-                    .find_elements_by_class_name('pickonebutton-button')
-                choices = [b.text for b in our_answer_buttons]
-                our_answer = list(map(lambda x: x.get_attribute('class')\
-                    .endswith('--selected'),our_answer_buttons)).index(True)
-
-                #get which of their answers we will accept
-                their_answer_buttons = overlay.find_element_by_class_name('pickmanybuttons')\
-                    .find_elements_by_tag_name('input')
-                acceptable = list(map(lambda x: x.get_property('checked'), their_answer_buttons))
-
-                #get how important the question is to our scraper
-                #should all be 1:somewhat important
-                importance_buttons = overlay.find_element_by_class_name('importance-pickonebutton')\
-                    .find_elements_by_tag_name('button')
-                importance = list(map(lambda b: b.get_attribute('class').endswith('--selected'),\
-                    importance_buttons)).index(True)
-
-                #package up the question data
-                datalist.append({             \
-                    'q_text': text,           \
-                    'choices': choices,       \
-                    'our_answer': our_answer, \
-                    'acceptable': acceptable, \
-                    'importance': importance  \
-                })
-
-                #exit overlay
-                self.driver.find_element_by_class_name('reactmodal-header-close').click()'''
-
-            #adjust loop conditions
-            current = questions[j]
-            current.location_once_scrolled_into_view
-            time.sleep(wait)
-            questions = self.driver.find_elements_by_class_name('profile-question')
-            for i in range(len(questions)):
-                if sameq(current, questions[i]):
-                    break
+        Parameters:
+            wait (float): seconds to wait for more questions to load after
+                scrolling before deciding the list is complete
 
+        Returns:
+            list of question data dicts
+        """
+        self.get_page('/profile')
+        self.wait.until(element_clickable('profile-selfview-questions-more'),
+            'selfview: questions link').click()
+        self.wait.until(count_reached('profile-question', 1), 'selfview: first questions')
+
+        #load the whole list, then read it in one go. q_text is checked in
+        #case the page rendered a question twice.
+        self.last_load = load_questions(self.driver, idle=wait)
+        datalist = []
+        seen = set()
+        for q in extract_self_questions(self.driver):
+            if q['q_text'] not in seen:
+                seen.add(q['q_text'])
+                datalist.append(q)
         return datalist
 
 
         
-    def collect_usernames(self, softlimit=np.inf):
-    #TODO docstring
-        self.driver.get('https://www.okcupid.com/match')
-        time.sleep(2)
-        usernames = set()
-        while len(usernames) < softlimit:
-            try:
-                self.driver.find_element_by_class_name('blank-state-wrapper')
-                exit_stat = 1
+    def iter_usernames(self, softlimit=math.inf, wait=2, batch_size=100, save=True,
+            resume=True):
+        """
+        Yields usernames from the match page as their cards render. Only cards
+        added since the last read are looked at, and usernames are written to
+        db.usernames in batches as the crawl goes, along with a checkpoint in
+        db.crawl_checkpoints so an interrupted crawl can pick up where it
+        left off.
+
+        Parameters:
+            softlimit (int): stop once at least this many usernames are yielded
+            wait (float): seconds to wait for more cards after scrolling
+            batch_size (int): usernames written to mongo at a time
+            save (bool): write usernames and checkpoints to mongo
+            resume (bool): skip the cards an unfinished earlier crawl already saved
+
+        Returns:
+            (via StopIteration.value) exit status: 1 if the end of the matches
+            was reached, 0 if the page errored and 2 if the soft limit was
+            reached first
+        """
+        checkpoint_id = f'{self.name}/match'
+        checkpoint = self.db.crawl_checkpoints.find_one({'_id': checkpoint_id})\
+            if resume else None
+        skip = checkpoint['cards_read']\
+            if checkpoint and checkpoint.get('exit_stat') is None else 0
+
+        self.get_page('/match')
+        self.wait.until(any_present(('class', 'usercard-thumb'),
+            ('class', 'blank-state-wrapper'), ('class', 'match-results-error')),
+            'match: first cards')
+        def loaded(n):
+            def condition(d):
+                state = read_match_cards(d, names=False)
+                return state['count'] > n or state['blank'] or state['error']
+            return condition
+
+        #scroll past the cards an interrupted crawl already saved
+        start = 0
+        while start < skip:
+            state = read_match_cards(self.driver, names=False, scroll=True)
+            if state['blank'] or state['error']:
+                break
+            if self.wait.until_or_none(loaded(state['count']), 'match: fast forward',
+                    timeout=wait) is None:
                 break
+            start = min(read_match_cards(self.driver, names=False)['count'], skip)
 
-            except NoSuchElementException:
-                try:
-                    self.driver.find_element_by_class_name('match-results-error')
+        seen = set()
+        batch = []
+        exit_stat = 2
+        try:
+            while len(seen) < softlimit:
+                state = read_match_cards(self.driver, start, scroll=True)
+                if state['count'] < start:
+                    #cards were rerendered; reread them all, seen drops repeats
+                    start = 0
+                    continue
+                start = state['count']
+                for u in state['usernames']:
+                    if u and u not in seen:
+                        seen.add(u)
+                        batch.append(u)
+                        yield u
+                if save and len(batch) >= batch_size:
+                    self._save_username_batch(batch, start)
+                    batch = []
+                if state['blank']:
+                    exit_stat = 1
+                    break
+                if state['error']:
                     exit_stat = 0
                     break
-                except NoSuchElementException:
-                    pass
-                try:
-                    matchcards = self.driver.find_elements_by_class_name('usercard-thumb')
-                    last = matchcards[-1]
-                    usernames = usernames.union(set(map(\
-                        lambda card: card.get_attribute('data-username'), matchcards)))
-                    last.location_once_scrolled_into_view
-                except StaleElementReferenceException:
-                    time.sleep(0.5+np.random.exponential())
-        return (usernames, exit_stat)
+                #next page of cards, or one of the end states
+                self.wait.until_or_none(loaded(start), 'match: next cards', timeout=wait)
+        finally:
+            if save:
+                #only a crawl that hit an end state is finished; one stopped by
+                #the soft limit or the caller is resumed next time
+                self._save_username_batch(batch, start, exit_stat if exit_stat != 2 else None)
+        return exit_stat
 
-        
-    def scrape_user(self, img_save_dir, username, wait=1.5):
-        #TODO docstring        
-        #TODO need try-accept block for when user isn't found
 
-        #scrape questions first
-        self.driver.get(f'https://www.okcupid.com/profile/{username}/questions')
-        time.sleep(wait)
+    def _save_username_batch(self, usernames, cards_read, exit_stat=None):
+        """
+        Queues a batch of usernames and the match crawl checkpoint on the
+        writer and flushes them. A checkpoint with an exit_stat marks a
+        finished crawl, which the next crawl won't resume from.
+        """
+        from pymongo import UpdateOne
+        self.writer.add_usernames(usernames)
+        self.writer.add('crawl_checkpoints', UpdateOne({'_id': f'{self.name}/match'},
+            {'$set': {'cards_read': cards_read, 'exit_stat': exit_stat,
+                'time': datetime.now()}}, upsert=True))
+        self.writer.flush()
 
-        #if there are any unanswered questions, answer them so we can scrape
-        #ALL the user's answered questions later.
-        if self.get_num_questions_by_filter('FIND OUT') > 0:
-            qdata = self.answer_unanswered_questions()
-            self.add_questions_update_version(qdata)
 
-        #scrape the questions the user has answered
-        questions = self.scrape_user_questions(username)
+    def collect_usernames(self, softlimit=math.inf, wait=2, save=False, resume=False):
+        """
+        Collects usernames from the match page by scrolling through match cards.
+
+        Parameters:
+            softlimit (int): stop once at least this many usernames are collected
+            wait (float): seconds to wait for more cards after scrolling
+            save (bool): also write them to db.usernames as they're collected
+            resume (bool): skip the cards an unfinished earlier crawl already saved
+
+        Returns:
+            (set of usernames, exit status) where exit status is 1 if the
+            end of the matches was reached, 0 if the page errored and 2 if
+            the soft limit was reached first
+        """
+        usernames = set()
+        gen = self.iter_usernames(softlimit, wait, save=save, resume=resume)
+        while True:
+            try:
+                usernames.add(next(gen))
+            except StopIteration as stop:
+                return (usernames, stop.value)
+
+        
+    def scrape_user(self, img_save_dir, username, wait=None, store=False):
+        """
+        Scrapes a user's answered questions, profile html and images. With
+        a fetcher, pages whose html has what's needed are fetched over HTTP
+        instead of loaded in the browser.
+
+        Parameters:
+            img_save_dir (str): directory the user's images are saved to
+            username (str): user to scrape
+            wait (float): seconds to wait for each page to load. Defaults to
+                the waiter's timeout.
+            store (bool): also queue the document on the scraper's BulkWriter
+                for db.users, packed by html_store if there is one
+
+        Returns:
+            the scraped user document
+        """
+        #TODO need try-accept block for when user isn't found
+
+        #with a fetcher both pages download in the background; whichever
+        #can't be read from its html is loaded in the browser as usual
+        fetched_questions = fetched_profile = None
+        if self.fetcher is not None:
+            from fetch import parse_question_page, parse_profile_page
+            fetched_questions = self.fetcher.page('questions',
+                f'/profile/{username}/questions', parse_question_page)
+            fetched_profile = self.fetcher.page('profile', f'/profile/{username}',
+                parse_profile_page)
+
+        questions = fetched_questions.result() if fetched_questions else None
+        if questions is None:
+            #scrape questions first
+            self.get_page(f'/profile/{username}/questions')
+            self.wait.until(filter_counts(), 'user: question filters', timeout=wait)
+
+            #if there are any unanswered questions, answer them so we can scrape
+            #ALL the user's answered questions later.
+            if self.get_num_questions_by_filter('FIND OUT') > 0:
+                with self.metrics.timer('phase_seconds', phase='answer_questions'):
+                    qdata = self.answer_unanswered_questions()
+                with self.metrics.timer('phase_seconds', phase='version_update'):
+                    self.add_questions_update_version(qdata)
+
+            #scrape the questions the user has answered
+            questions = self.scrape_user_questions(username)
 
         #scrape their main profile contents
-        self.driver.get(f'https://www.okcupid.com/profile/{username}')
-        time.sleep(wait*np.random.exponential())
-        try:
-            self.driver.find_element_by_class_name('profile-essays-expander').click()
-        except NoSuchElementException: #short profiles
-            pass
-        html = self.driver.find_element_by_tag_name('HTML').get_attribute('innerHTML')
+        with self.metrics.timer('phase_seconds', phase='profile_html'):
+            profile = fetched_profile.result() if fetched_profile else None
+            if profile is None:
+                self.get_page(f'/profile/{username}')
+                self.wait.until(element_present('profile-thumb'), 'user: profile', timeout=wait)
+                signals = read_profile_signals(self.driver)
+                html = self.expand_profile_html()
+            else:
+                html, signals = profile
         
         #scrape images
-        img_count = self.save_images(img_save_dir, username)
+        with self.metrics.timer('phase_seconds', phase='images'):
+            img_count = self.save_images(img_save_dir, username, signals['image_urls'])
+        self.metrics.inc('users_scraped')
+        signals['counts'] = {filterstr: len(q) for filterstr, q in questions.items()}
         
-        dtime = datetime.now().strftime('%Y%m%d_%H%M%S'),
+        dtime = datetime.now().strftime('%Y%m%d_%H%M%S')
         
         #package it all up
-        return{                                 \
+        doc = {                                 \
             '_id': username,                    \
             'html': html,                       \
             'img_count': img_count,             \
             'questions': questions,             \
+            'signals': signals,                 \
             'metadata':{                        \
                 'time': dtime,                  \
                 'scraper': self.name,           \
                 'scraper_version': self.version \
             }                                   \
         }
+        if store:
+            if self.html_store is not None:
+                stored = self.db.users.find_one({'_id': username}, {'html.gridfs': 1})
+                self.writer.add_user(self.html_store.pack_user(doc))
+                self._delete_replaced_html(stored)
+            else:
+                self.writer.add_user(doc)
+            if self.answer_index is not None:
+                self.answer_index.update_user_html(username, questions)
+        return doc
+
+
+    def expand_profile_html(self):
+        """
+        Opens the hidden essays on the profile being shown, if there are any,
+        and returns the page's html.
+        """
+        try:
+            self.driver.find_element_by_class_name('profile-essays-expander').click()
+        except NoSuchElementException: #short profiles
+            pass
+        return self.driver.find_element_by_tag_name('HTML').get_attribute('innerHTML')
+
+
+    def _delete_replaced_html(self, stored):
+        """
+        Deletes the GridFS blob a user's previous document kept its html in,
+        if it did, once the queued write replacing that document is flushed.
+
+        Parameters:
+            stored (dict): the previous document, with at least its html, or None
+        """
+        blob = (stored or dict()).get('html')
+        if not isinstance(blob, dict) or 'gridfs' not in blob:
+            return
+        self.writer.flush()
+        self._stored_html().delete_html(blob)
+
+
+    def _stored_html(self):
+        """Returns an HtmlStore to read and delete stored html with, made on first use."""
+        if self._html_reader is None:
+            from html_store import HtmlStore
+            self._html_reader = self.html_store or HtmlStore(self.db, dict_id=0)
+        return self._html_reader
+
+
+    def stored_user(self, username):
+        """
+        Returns the stored db.users document for username, with any
+        compressed html unpacked, or None if they haven't been scraped.
+        Pending writes are flushed first so a user scraped moments ago is found.
+        """
+        self.writer.flush()
+        doc = self.db.users.find_one({'_id': username})
+        if doc is None or 'storage' not in doc:
+            return doc
+        return self._stored_html().unpack_user(doc)
+
+
+    def rescrape_user(self, img_save_dir, username, wait=None, store=True):
+        """
+        Re-scrapes a user scraped before, redoing only the expensive steps
+        whose cheap signals changed since: each question filter is only
+        reloaded if its count differs from the stored list's, the profile
+        html is only grabbed if the essays' hash differs, and only images
+        with new urls are downloaded. Users never scraped get a full
+        scrape_user.
+
+        Counts can't see an answer swapped for another under the same
+        filter, so run a full scrape_user now and then.
+
+        The stored document is updated in place, and what changed is kept as
+        a timestamped delta in db.user_history.
+
+        Parameters:
+            img_save_dir (str): directory the user's images are saved to
+            username (str): user to re-scrape
+            wait (float): seconds to wait for each page to load. Defaults to
+                the waiter's timeout.
+            store (bool): queue the update and history on the scraper's BulkWriter
+
+        Returns:
+            (the user's current document, report dict of changed and skipped
+            steps and the questions and images skipped)
+        """
+        previous = self.stored_user(username)
+        if previous is None:
+            doc = self.scrape_user(img_save_dir, username, wait, store)
+            self.rescrape_stats['new_users'] += 1
+            return doc, {'changed': list(RESCRAPE_STEPS), 'skipped': [],
+                'questions_skipped': 0, 'images_skipped': 0}
+        old_signals = previous.get('signals') or dict()
+        old_questions = previous.get('questions') or dict()
+        old_counts = old_signals.get('counts') or\
+            {filterstr: len(q) for filterstr, q in old_questions.items()}
+        changed = []
+
+        #question counts, answering any unanswered questions first as scrape_user does
+        self.get_page(f'/profile/{username}/questions')
+        self.wait.until(filter_counts(), 'user: question filters', timeout=wait)
+        if self.get_num_questions_by_filter('FIND OUT') > 0:
+            with self.metrics.timer('phase_seconds', phase='answer_questions'):
+                qdata = self.answer_unanswered_questions()
+            with self.metrics.timer('phase_seconds', phase='version_update'):
+                self.add_questions_update_version(qdata)
+        counts = self.wait.until(filter_counts(), 'user: question filters', timeout=wait)
+        questions = dict(old_questions)
+        questions_skipped = 0
+        for filterstr in ['AGREE', 'DISAGREE']:
+            if filterstr in old_questions and counts.get(filterstr) == old_counts.get(filterstr):
+                questions_skipped += len(old_questions[filterstr])
+                continue
+            with self.metrics.timer('phase_seconds', phase=filterstr.lower()):
+                questions[filterstr] = self.scrape_user_questions_by_filter(filterstr)
+            changed.append(filterstr)
+
+        #essays and images from the profile, expanding and downloading only if needed
+        with self.metrics.timer('phase_seconds', phase='profile_html'):
+            self.get_page(f'/profile/{username}')
+            self.wait.until(element_present('profile-thumb'), 'user: profile', timeout=wait)
+            signals = read_profile_signals(self.driver)
+            html = previous.get('html')
+            if html is None or signals['essay_hash'] != old_signals.get('essay_hash'):
+                html = self.expand_profile_html()
+                changed.append('profile_html')
+        old_urls = old_signals.get('image_urls') or []
+        new_urls = [url for url in signals['image_urls'] if url not in set(old_urls)]
+        if new_urls:
+            with self.metrics.timer('phase_seconds', phase='images'):
+                self.save_images(img_save_dir, username, new_urls)
+            changed.append('images')
+        signals['counts'] = {filterstr: len(q) for filterstr, q in questions.items()}
+
+        report = {
+            'changed': changed,
+            'skipped': [step for step in RESCRAPE_STEPS if step not in changed],
+            'questions_skipped': questions_skipped,
+            'images_skipped': len(signals['image_urls']) - len(new_urls)
+        }
+        self._count_rescrape(report)
+
+        dtime = datetime.now()
+        doc = dict(previous, html=html, img_count=len(signals['image_urls']),
+            questions=questions, signals=signals)
+        doc['metadata'] = dict(previous.get('metadata') or dict(), checked=dtime,
+            scraper=self.name, scraper_version=self.version)
+        if changed:
+            doc['metadata']['time'] = dtime.strftime('%Y%m%d_%H%M%S')
+        if PARSED_STEPS & set(changed):
+            #parsed from the old html, so it's redone from the new
+            doc.pop('parsed', None)
+        if store:
+            self._store_rescrape(previous, doc, changed, new_urls, old_urls, dtime)
+        return doc, report
+
+
+    def _count_rescrape(self, report):
+        stats = self.rescrape_stats
+        stats['users'] += 1
+        stats['questions_skipped'] += report['questions_skipped']
+        stats['images_skipped'] += report['images_skipped']
+        for step in report['changed']:
+            stats['run'][step] += 1
+            self.metrics.inc('rescrape_steps', step=step, result='run')
+        for step in report['skipped']:
+            stats['skipped'][step] += 1
+            self.metrics.inc('rescrape_steps', step=step, result='skipped')
+
+
+    def _store_rescrape(self, previous, doc, changed, new_urls, old_urls, dtime):
+        """
+        Queues the $set of what changed on the user's document, with an
+        $unset of its now stale parsed fields if the html did, and if
+        anything changed, the delta for db.user_history.
+        """
+        from pymongo import InsertOne, UpdateOne
+        from html_store import fragment_hash
+        username = doc['_id']
+        packed = self.html_store is not None
+        if self.answer_index is not None and {'AGREE', 'DISAGREE'} & set(changed):
+            self.answer_index.update_user_html(username, doc['questions'])
+        stored = self.db.users.find_one({'_id': username}, {'storage': 1, 'html.gridfs': 1})
+        if packed != ('storage' in stored):
+            #stored in the other format; rewrite it whole in the current one
+            self.writer.add_user(self.html_store.pack_user(doc) if packed else doc)
+            self._delete_replaced_html(stored)
+        else:
+            update = {'signals': doc['signals'], 'metadata': doc['metadata'],
+                'img_count': doc['img_count']}
+            for filterstr in ['AGREE', 'DISAGREE']:
+                if filterstr in changed:
+                    q = doc['questions'][filterstr]
+                    update[f'questions.{filterstr}'] = self.html_store.pack_fragments(q)\
+                        if packed else q
+            if 'profile_html' in changed:
+                update['html'] = self.html_store.pack_html(doc['html']) if packed else doc['html']
+            if changed:
+                #what export goes by, see BulkWriter.add_user
+                update['written'] = datetime.utcnow()
+            ops = {'$set': update}
+            if PARSED_STEPS & set(changed):
+                ops['$unset'] = {'parsed': ''}
+            self.writer.add('users', UpdateOne({'_id': username}, ops))
+            if 'profile_html' in changed:
+                self._delete_replaced_html(stored)
+        if not changed:
+            return
+
+        delta = dict()
+        for filterstr in ['AGREE', 'DISAGREE']:
+            if filterstr in changed:
+                old = set((previous.get('questions') or dict()).get(filterstr) or [])
+                new = set(doc['questions'][filterstr])
+                added, removed = [q for q in doc['questions'][filterstr] if q not in old],\
+                    [q for q in old if q not in new]
+                delta[f'questions.{filterstr}'] = {
+                    'added': self.html_store.pack_fragments(added) if packed else added,
+                    'removed': [fragment_hash(q) for q in removed] if packed else removed
+                }
+        if 'profile_html' in changed:
+            delta['html'] = self.html_store.pack_html(doc['html']) if packed else doc['html']
+        delta['image_urls'] = {'added': new_urls,
+            'removed': [url for url in old_urls if url not in set(doc['signals']['image_urls'])]}
+        self.writer.add('user_history', InsertOne({
+            '_id': f'{username}/{dtime.strftime("%Y%m%d_%H%M%S_%f")}',
+            'username': username,
+            'time': dtime,
+            'scraper': self.name,
+            'scraper_version': self.version,
+            'changed': changed,
+            'delta': delta
+        }))
+
+
+    def rescrape_summary(self):
+        """
+        Returns rescrape_stats plus the fraction of each step skipped over
+        every rescrape_user call so far.
+        """
+        stats = self.rescrape_stats
+        summary = dict(stats)
+        summary['skipped_fraction'] = {step: stats['skipped'][step] /
+            max(1, stats['skipped'][step] + stats['run'][step]) for step in RESCRAPE_STEPS}
+        return summary
 
 
-    def answer_question_overlay(self, importance_answer=1, wait=0.1):
-    #TODO docstring
-        overlay = self.driver.find_element_by_class_name('questionspage')
+    def answer_question_overlay(self, importance_answer=1, wait=None):
+        """
+        Answers the question in the open question overlay at random, accepting
+        only the same answer from matches, and waits for the overlay to move on.
+        Reading the question, clicking the buttons and submitting take one
+        script call as soon as the overlay's buttons are there.
 
-        #get button arrays
-        our_answer_buttons = overlay.find_element_by_class_name('pickonebutton-buttons')\
-            .find_elements_by_class_name('pickonebutton-button')
-        their_answer_buttons = overlay.find_element_by_class_name('pickmanybuttons')\
-            .find_elements_by_tag_name('button')
-        importance_buttons = overlay.find_element_by_class_name('importance-pickonebutton')\
-            .find_elements_by_tag_name('button')
+        Parameters:
+            importance_answer (int): index of the importance button to click
+            wait (float): seconds to wait for each button and the submit to
+                register. Defaults to the waiter's timeout.
 
-        #get data to store
-        text = overlay.find_element_by_tag_name('h1').text
-        choices = [b.text for b in our_answer_buttons]
-        answer = int(np.random.uniform() * len(choices))
-        acceptable_arr = [False]*len(choices)
-        acceptable_arr[answer] = True
+        Returns:
+            question data dict
+        """
+        u = random.random()
+        raw = self.wait.until(lambda d: answer_overlay(d, u, importance_answer),
+            'overlay: answered', timeout=wait)
+        answer = raw['answer']
+        if not raw['submitted']:
+            #the clicks hadn't registered by the time the script checked
+            self.wait.until(lambda d: overlay_selected(d, answer, importance_answer),
+                'overlay: selections', timeout=wait)
+            self.driver.find_element_by_class_name('questionspage-buttons-button--answer')\
+                .click()
 
-        #click the appropriate buttons
-        our_answer_buttons[answer].click()
-        time.sleep(wait)
-        their_answer_buttons[answer].click()
-        time.sleep(wait)
-        importance_buttons[importance_answer].click()
-        time.sleep(wait)
-        
-        #submit form
-        self.driver.find_element_by_class_name('questionspage-buttons-button--answer')\
-            .click()
+        #wait for the next question or for the overlay to close
+        self.wait.until(lambda d: overlay_question(d) != raw['q_text'], 'overlay: submitted',
+            timeout=wait)
 
+        acceptable_arr = [False]*len(raw['choices'])
+        acceptable_arr[answer] = True
         return{                             \
-            'q_text': text,                 \
-            'choices': choices,             \
+            'q_text': raw['q_text'],        \
+            'choices': raw['choices'],      \
             'our_answer': answer,           \
             'acceptable': acceptable_arr,   \
             'importance': importance_answer \
@@ -323,75 +942,125 @@ class Scraper:
 
 
         
-    def answer_unanswered_questions(self, wait=1, importance_answer=1):
-    #TODO docstring
-        qdata = []
-        while self.get_num_questions_by_filter('FIND OUT') > 0:
-            try:
-                self.driver.find_element_by_class_name('profile-questions-filter-icon--findOut')\
-                    .click()
-                time.sleep(wait)
-                
-                self.driver.find_element_by_class_name('profile-question')\
-                    .click()
-                time.sleep(wait)
-                
-                qdata.append(self.answer_question_overlay(importance_answer))
-                time.sleep(wait)
+    def answer_unanswered_questions(self, wait=None, importance_answer=1):
+        """
+        Answers every question on the current user's question page that the
+        scraper hasn't answered yet (the FIND OUT filter). Answers go through
+        the 'find_out' checkpoint, so ones left there by a crashed run are
+        returned too.
 
-            except NoSuchElementException:
-                wait += 0.1
-                time.sleep(wait)
-                continue
+        Parameters:
+            wait (float): seconds to wait for each page condition. Defaults to
+                the waiter's timeout.
+            importance_answer (int): index of the importance button to click
 
-        return qdata
+        Returns:
+            list of question data dicts
+        """
+        checkpoint = self.answer_checkpoint('find_out')
+        remaining = self.get_num_questions_by_filter('FIND OUT')
+        try:
+            while remaining > 0:
+                try:
+                    self.wait.until(element_clickable('profile-questions-filter-icon--findOut'),
+                        'findout: filter', timeout=wait).click()
+
+                    self.wait.until(element_clickable('profile-question'),
+                        'findout: question', timeout=wait).click()
+
+                    checkpoint.add(self.answer_question_overlay(importance_answer, wait))
+                    self.wait.until(element_absent('questionspage'), 'findout: overlay closed',
+                        timeout=wait)
+                    remaining = self.wait.until(filter_count_changed('FIND OUT', remaining),
+                        'findout: counter updated', timeout=wait)[0]
+
+                except (NoSuchElementException, TimeoutException):
+                    #the waits above already gave the page time, so just retry
+                    self.metrics.inc('retries', where='answer_unanswered')
+                    remaining = self.get_num_questions_by_filter('FIND OUT')
+                    continue
+        finally:
+            checkpoint.save()
+        return checkpoint.questions
                 
                 
     def get_num_questions_by_filter(self, filterstr):
-    #TODO docstring
-        arr = self.driver.find_element_by_class_name('profile-questions-filters')\
-            .text.split('\n')
-        return int(arr[arr.index(filterstr)+1])
+        """
+        Returns the count shown next to a question filter, waiting for the
+        filter counters to render if needed.
+
+        Parameters:
+            filterstr (str): filter label, e.g. 'AGREE', 'DISAGREE', 'FIND OUT'
+        """
+        return self.wait.until(filter_counts(), 'filters: counts')[filterstr]
 
 
     def scroll_to_bottom(self, wait):
-    #TODO docstring
+        """
+        Scrolls to the bottom of the page until the page stops growing.
+
+        Parameters:
+            wait (float): seconds to wait for the page to grow after each scroll
+        """
+        from selenium.webdriver.common.keys import Keys
         body = self.driver.find_element_by_tag_name('body')
-        y = [0,1]
-        while y[0] != y[1]:
-            y[0] = y[1]
+        height = lambda d: d.execute_script('return document.body.scrollHeight;')
+        while True:
+            h = height(self.driver)
             body.send_keys(Keys.END)
-            time.sleep(wait)
-            y[1] = self.driver.execute_script('return window.pageYOffset;')
+            if self.wait.until_or_none(lambda d: height(d) != h, 'scroll: page grew',
+                    timeout=wait) is None:
+                break
             
             
     def scrape_user_questions(self, username):
-    #TODO docstring
+        """
+        Scrapes the questions a user has answered the same as (AGREE) and
+        differently from (DISAGREE) the scraper, from their questions page.
+
+        Returns:
+            dict of filter label -> list of question innerHTML strings
+        """
         q=dict()
         for filterstr in ['AGREE', 'DISAGREE']:
-            time.sleep(1)
-            q[filterstr] = self.scrape_user_questions_by_filter(filterstr)
+            with self.metrics.timer('phase_seconds', phase=filterstr.lower()):
+                q[filterstr] = self.scrape_user_questions_by_filter(filterstr)
         return q
 
 
-    def scrape_user_questions_by_filter(self, filterstr, wait=0.3):
-    #TODO docstring
+    def scrape_user_questions_by_filter(self, filterstr, wait=1):
+        """
+        Selects a question filter and loads the list until every question
+        under it is on the page. How long loading took and how many batches
+        it needed are left in last_load.
+
+        Parameters:
+            filterstr (str): filter label, e.g. 'AGREE' or 'DISAGREE'
+            wait (float): seconds without new questions before loading gives up
+
+        Returns:
+            list of question innerHTML strings
+        """
+        from selenium.webdriver.common.keys import Keys
         self.driver.find_element_by_tag_name('body')\
             .send_keys(Keys.HOME)
-        time.sleep(0.7+wait)
-        self.driver.find_element_by_class_name(f'profile-questions-filter-icon--{filterstr.lower()}')\
-            .click()
-        time.sleep(0.7+wait)
+        old_questions = self.driver.find_elements_by_class_name('profile-question')
+        self.wait.until(element_clickable(f'profile-questions-filter-icon--{filterstr.lower()}'),
+            'filter: icon').click()
+        #the list rerenders for the new filter
+        if old_questions:
+            self.wait.until_or_none(staleness_of(old_questions[0]), 'filter: list replaced')
         numQsToScrape = self.get_num_questions_by_filter(filterstr) 
 
-        self.scroll_to_bottom(wait)
-
-        questions = self.driver.find_elements_by_class_name('profile-question')
-        while len(questions) != numQsToScrape:
-            wait += 0.1
-            self.scroll_to_bottom(wait)
-            questions = self.driver.find_elements_by_class_name('profile-question')
-        return [q.get_attribute('innerHTML') for q in questions]
+        self.last_load = load_questions(self.driver, numQsToScrape, idle=wait)
+        self.metrics.observe('question_load_seconds', self.last_load.seconds)
+        self.metrics.inc('question_load_batches', self.last_load.batches)
+        if self.last_load.count < numQsToScrape:
+            #growth stalled; give the list one last chance
+            self.metrics.inc('retries', where='question_load')
+            self.wait.until(lambda d: count_questions(d) >= numQsToScrape,
+                'filter: questions loaded')
+        return extract_question_html(self.driver)
 
 
     def get_src(img):
@@ -402,81 +1071,115 @@ class Scraper:
         return src
 
 
-    def save_images(self, save_dir, username):
-    #TODO docstring
-        if not os.path.exists(save_dir):
-            os.mkdir(save_dir)
-        images = self.driver.find_element_by_class_name('profile-thumb')\
-            .find_elements_by_tag_name('img')
-        images.extend(self.driver.find_element_by_class_name('profile-essays')\
-            .find_elements_by_tag_name('img'))
-
-        for url in map(Scraper.get_src,images):
-            i = requests.get(url).content
-            name = urlparse(url).path.split('/')[-1]
-            with open(f'{save_dir}/{username}_{name}', 'wb') as f:
-                f.write(i)
-        return len(images)
-
-
-    def answer_all_questions(self, importance_answer=1, wait=1):
-    #TODO docstring
-        self.driver.get('https://www.okcupid.com/profile')
-        time.sleep(2*wait+np.random.exponential())
-        self.driver.find_element_by_class_name('profile-selfview-questions-more')\
-            .click()
-        time.sleep(2*wait+np.random.exponential())
+    def save_images(self, save_dir, username, urls=None):
+        """
+        Hands the urls of the profile's images to the image pipeline for
+        save_dir, which downloads them in the background. Call logout (or
+        close the pipelines) to wait for outstanding downloads.
 
-        qdata=[]
-        self.driver.find_element_by_class_name('profile-questions-next-actions-button--answer')\
-            .click()
-        count=0
+        Parameters:
+            save_dir (str): directory images and their manifest are stored in
+            username (str): user whose profile is open
+            urls (list): image urls already read from the profile, e.g. by
+                read_profile_signals. Read from the open profile if None.
 
-        while True:
-            try:
-                time.sleep(wait)
-                qdatum = self.answer_question_overlay(importance_answer)
-                qdata.append(qdatum)
-                count += 1
-            except NoSuchElementException:
+        Returns:
+            number of images found
+        """
+        if urls is None:
+            images = self.driver.find_element_by_class_name('profile-thumb')\
+                .find_elements_by_tag_name('img')
+            images.extend(self.driver.find_element_by_class_name('profile-essays')\
+                .find_elements_by_tag_name('img'))
+            urls = list(map(Scraper.get_src, images))
+
+        if save_dir not in self.image_pipelines:
+            from images import ImagePipeline
+            #a manifest per scraper, so pool workers sharing save_dir keep each other's
+            self.image_pipelines[save_dir] = ImagePipeline(save_dir, metrics=self.metrics,
+                manifest_name=f'manifest-{self.name}.jsonl')
+        self.image_pipelines[save_dir].submit(username, urls)
+        return len(urls)
+
+
+    def answer_all_questions(self, importance_answer=1, wait=None):
+        """
+        Answers new questions from the scraper's own profile until OkCupid
+        runs out of questions or something goes wrong. Answers are saved to
+        the 'answer_all' checkpoint as they go, so a crash loses at most the
+        last few, and ones saved by a crashed run are returned too.
+
+        Parameters:
+            importance_answer (int): index of the importance button to click
+            wait (float): seconds to wait for each page condition. Defaults to
+                the waiter's timeout.
+
+        Returns:
+            (list of question data dicts, exit status string)
+        """
+        self.get_page('/profile')
+        self.wait.until(element_clickable('profile-selfview-questions-more'),
+            'answer: questions link', timeout=wait).click()
+
+        checkpoint = self.answer_checkpoint('answer_all')
+        self.wait.until(element_clickable('profile-questions-next-actions-button--answer'),
+            'answer: answer button', timeout=wait).click()
+
+        try:
+            while True:
                 try:
-                    self.driver.find_element_by_id('no-questions-blank-state')
-                    exit_stat = 'reached end of questions.'
-                    break
-                except NoSuchElementException:
-                    wait += 0.1
-                    time.sleep(wait)
+                    (kind, _), _ = self.wait.until(any_present(('class', 'questionspage'),
+                        ('id', 'no-questions-blank-state')), 'answer: next question', timeout=wait)
+                    if kind == 'id':
+                        exit_stat = 'reached end of questions.'
+                        break
+                    checkpoint.add(self.answer_question_overlay(importance_answer, wait))
+                except (NoSuchElementException, StaleElementReferenceException):
+                    #overlay changed under us; the next wait sorts it out
+                    self.metrics.inc('retries', where='answer_all')
                     continue
-            except Exception as e:
-                exit_stat = f'Error: {str(e)}'
-                break
-        return (qdata, exit_stat)
+                except Exception as e:
+                    exit_stat = f'Error: {str(e)}'
+                    break
+        finally:
+            checkpoint.save()
+        return (checkpoint.questions, exit_stat)
 
 
-    def answer_initial_question(self, wait=1):
-    #TODO docstring
-        qtext = self.driver.find_element_by_class_name('convoanswers-text')\
-            .text
+    def answer_initial_question(self, wait=None):
+        """
+        Answers one of the onboarding questions at random, accepting only the
+        same answer from matches, and waits for the next question to show.
+
+        Parameters:
+            wait (float): seconds to wait for each page condition. Defaults to
+                the waiter's timeout.
+
+        Returns:
+            question data dict
+        """
+        qtext = self.wait.until(element_present('convoanswers-text'), 'initial: question',
+            timeout=wait).text
         choicebuttons = self.driver\
             .find_element_by_class_name('convoanswers-answers')\
             .find_elements_by_tag_name('button')
         choicestext = [b.text for b in choicebuttons]
-        answer = int(np.random.uniform() * len(choicestext))
+        answer = int(random.random() * len(choicestext))
         choicebuttons[answer]\
             .click()
-        time.sleep(wait)
 
-        choicebuttons = self.driver\
+        choicebuttons = self.wait.until(lambda d: d\
             .find_element_by_class_name('convoanswers--theirs')\
-            .find_elements_by_tag_name('button')
+            .find_elements_by_tag_name('button'), 'initial: their answers', timeout=wait)
         choicebuttons[answer]\
             .click()
-        time.sleep(wait)
         acceptable = [False]*len(choicestext)
         acceptable[answer] = True
 
-        self.driver.find_element_by_class_name('convoquestion-continue')\
-            .click()
+        self.wait.until(element_clickable('convoquestion-continue'), 'initial: continue',
+            timeout=wait).click()
+        self.wait.until(text_changed('convoanswers-text', qtext), 'initial: next question',
+            timeout=wait)
         return {                      \
             'q_text': qtext,          \
             'choices': choicestext,   \
@@ -487,14 +1190,26 @@ class Scraper:
         #TODO verify the assumed importance answer is right
 
 
-    def answer_all_initial_questions(self, wait=1):
-    #TODO docstring
-        qdata = []
+    def answer_all_initial_questions(self, wait=None):
+        """
+        Answers all the remaining onboarding questions, through the 'initial'
+        checkpoint like answer_all_questions.
+
+        Parameters:
+            wait (float): seconds to wait for each page condition. Defaults to
+                the waiter's timeout.
+
+        Returns:
+            list of question data dicts
+        """
+        checkpoint = self.answer_checkpoint('initial')
         current_q, num_qs = self.get_progress()
-        for i in range(num_qs - current_q+1):
-            qdata.append(self.answer_initial_question(wait))
-            time.sleep(wait*2)
-        return qdata
+        try:
+            for i in range(num_qs - current_q+1):
+                checkpoint.add(self.answer_initial_question(wait))
+        finally:
+            checkpoint.save()
+        return checkpoint.questions
 
 
     def get_progress(self):
@@ -504,7 +1219,14 @@ class Scraper:
             .text.split(' of ')))
     
     def save_usernames_to_mongo(self, usernames):
-        self.db.usernames.insert_many(map(lambda u: {'_id':u}, usernames))
+        """
+        Saves usernames to db.usernames, skipping ones already there.
+
+        Returns:
+            the writer's running counts of inserted, updated and skipped writes
+        """
+        self.writer.add_usernames(usernames)
+        return self.writer.flush()
 
 
     def get_data_from_answer_stub(stub):
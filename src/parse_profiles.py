@@ -0,0 +1,182 @@
+from concurrent.futures import ProcessPoolExecutor
+from pymongo import MongoClient, UpdateOne
+from html_store import HtmlStore
+from lxml import html as lxml_html, etree
+import argparse, time
+
+#bump whenever the parsed output changes so older documents get reparsed
+PARSER_VERSION = 1
+
+#matches descendants having $cls among their classes. compiled once since
+#it runs several times for every question.
+_CLASS_XPATH = etree.XPath(
+    ".//*[contains(concat(' ', normalize-space(@class), ' '), concat(' ', $cls, ' '))]")
+
+
+def _by_class(el, cls):
+    return _CLASS_XPATH(el, cls=cls)
+
+
+def _text(el):
+    """Returns the element's text with <br>s as newlines and whitespace tidied."""
+    for br in el.iter('br'):
+        br.tail = '\n' + (br.tail or '')
+    lines = (' '.join(line.split()) for line in el.text_content().split('\n'))
+    return '\n'.join(line for line in lines if line)
+
+
+def _first_text(el, cls):
+    found = _by_class(el, cls)
+    return _text(found[0]) if found else None
+
+
+def parse_profile_html(html):
+    """
+    Parses the html of a user's profile page.
+
+    Parameters:
+        html (str): innerHTML of the profile page as stored by scrape_user
+
+    Returns:
+        dict with essays (list of {title, text}) and details (list of str)
+    """
+    root = lxml_html.fromstring(html)
+    essays = [{
+        'title': _first_text(essay, 'profile-essay-header'),
+        'text': _first_text(essay, 'profile-essay-contents')
+    } for essay in _by_class(root, 'profile-essay')]
+    details = [_text(d) for d in _by_class(root, 'matchprofile-details-text')]
+    return {'essays': essays, 'details': details}
+
+
+def _parse_question(root, agree):
+    h3 = root.find('.//h3')
+    return {
+        'q_text': _text(h3) if h3 is not None else None,
+        'their_answer': _first_text(root, 'profile-question-them-answer'),
+        'our_answer': _first_text(root, 'profile-question-self-answer'),
+        'explanation': _first_text(root, 'profile-question-them-explanation'),
+        'agree': agree
+    }
+
+
+def parse_question_html(html, agree):
+    """
+    Parses the innerHTML of one of a user's questions.
+
+    Parameters:
+        html (str): innerHTML of the question stub as stored by scrape_user
+        agree (bool): whether it came from the AGREE list rather than DISAGREE
+
+    Returns:
+        dict with q_text, their_answer, our_answer, explanation and agree
+    """
+    return _parse_question(lxml_html.fragment_fromstring(html, create_parent='div'), agree)
+
+
+def parse_question_list(htmls, agree):
+    """
+    Parses a list of question innerHTML strings in a single lxml call by
+    wrapping each one in its own <section>, which is much cheaper than
+    parsing them one at a time.
+
+    Returns:
+        list of question dicts, see parse_question_html
+    """
+    if not htmls:
+        return []
+    wrapped = ''.join(f'<section>{h}</section>' for h in htmls)
+    root = lxml_html.fragment_fromstring(wrapped, create_parent='div')
+    sections = root.findall('section')
+    if len(sections) != len(htmls):
+        #a malformed fragment swallowed its neighbours; parse them separately
+        return [parse_question_html(h, agree) for h in htmls]
+    return [_parse_question(section, agree) for section in sections]
+
+
+def parse_user_document(doc):
+    """
+    Parses a scraped user document into its structured fields. Runs in the
+    worker processes, so it only takes and returns plain data.
+
+    Parameters:
+        doc (dict): scraped user document with _id, html and questions
+
+    Returns:
+        (_id, parsed dict)
+    """
+    parsed = parse_profile_html(doc['html']) if doc.get('html') else\
+        {'essays': [], 'details': []}
+    questions = doc.get('questions') or {}
+    parsed['questions'] = [q for filterstr in ['AGREE', 'DISAGREE']
+        for q in parse_question_list(questions.get(filterstr, []), filterstr == 'AGREE')]
+    parsed['version'] = PARSER_VERSION
+    return (doc['_id'], parsed)
+
+
+def needs_parsing_query():
+    """Returns the query for user documents with missing or outdated parsed output."""
+    return {'$or': [
+        {'parsed.version': {'$exists': False}},
+        {'parsed.version': {'$lt': PARSER_VERSION}}
+    ]}
+
+
+def _chunks(iterable, size):
+    chunk = []
+    for item in iterable:
+        chunk.append(item)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def parse_all(db, workers=4, batch_size=200):
+    """
+    Parses every scraped user whose parsed output is missing or outdated and
+    writes the results back to db.users under 'parsed'. Documents are streamed
+    from the cursor a batch at a time, so memory stays bounded.
+
+    Parameters:
+        db (pymongo.database.Database): okc database
+        workers (int): number of parser processes
+        batch_size (int): documents parsed and written per round trip
+
+    Returns:
+        number of documents parsed
+    """
+    cursor = db.users.find(needs_parsing_query(),
+        {'html': 1, 'questions': 1, 'storage': 1}, batch_size=batch_size,
+        no_cursor_timeout=True)
+    store = None
+    count = 0
+    try:
+        with ProcessPoolExecutor(workers) as pool:
+            for chunk in _chunks(cursor, batch_size):
+                #packed documents are unpacked here; the workers don't talk to mongo
+                if any('storage' in doc for doc in chunk):
+                    if store is None:
+                        store = HtmlStore(db, dict_id=0)
+                    chunk = [store.unpack_user(doc) for doc in chunk]
+                results = pool.map(parse_user_document, chunk,
+                    chunksize=max(1, len(chunk) // (workers*4)))
+                db.users.bulk_write([UpdateOne({'_id': _id}, {'$set': {'parsed': parsed}})
+                    for _id, parsed in results], ordered=False)
+                count += len(chunk)
+    finally:
+        cursor.close()
+    return count
+
+
+if __name__=='__main__':
+    parser = argparse.ArgumentParser(description='Parse stored profile html in db.users')
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--batch-size', type=int, default=200)
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    n = parse_all(MongoClient('localhost', 27017).okc, args.workers, args.batch_size)
+    elapsed = time.perf_counter() - start
+    print(f'parsed {n} documents in {elapsed:.1f}s ({n/max(elapsed, 1e-9):.1f} docs/s)')
@@ -0,0 +1,328 @@
+from selenium.common.exceptions import WebDriverException
+from pymongo import MongoClient, ASCENDING, ReturnDocument, UpdateOne
+from datetime import datetime, timedelta
+import multiprocessing as mp
+from credentials import read_aliases
+import argparse, time, traceback
+
+PENDING, CLAIMED, DONE, FAILED = 'pending', 'claimed', 'done', 'failed'
+
+#exit code of a worker whose driver died, so the pool knows to restart it
+DRIVER_DIED = 3
+
+
+class WorkQueue:
+    """
+    Lease-based work queue over db.usernames. A worker claims a username for
+    lease seconds; if it doesn't finish in that time (e.g. it crashed) the
+    username can be claimed again. Usernames without a status are pending.
+    Every update stamps the utc time as changed, which export goes by.
+
+    Attributes:
+        db (pymongo.database.Database): okc database
+        lease (float): seconds a claim lasts
+        max_attempts (int): claims a username gets before it's marked failed
+    """
+
+    def __init__(self, db, lease=600, max_attempts=3):
+        self.db = db
+        self.lease = lease
+        self.max_attempts = max_attempts
+        self.db.usernames.create_index([('status', ASCENDING), ('lease_until', ASCENDING)])
+
+    def _claimable(self, now):
+        return {'$or': [
+            {'status': {'$exists': False}},
+            {'status': PENDING},
+            #expired claims out of attempts are left for reclaim_expired to fail
+            {'status': CLAIMED, 'lease_until': {'$lt': now},
+                'attempts': {'$lt': self.max_attempts}}
+        ]}
+
+    def claim(self, worker):
+        """
+        Atomically claims the next pending or expired username.
+
+        Parameters:
+            worker (str): id of the claiming worker
+
+        Returns:
+            the username, or None if there is nothing to claim
+        """
+        now = datetime.utcnow()
+        doc = self.db.usernames.find_one_and_update(self._claimable(now), {
+            '$set': {'status': CLAIMED, 'worker': worker,
+                'lease_until': now + timedelta(seconds=self.lease), 'changed': now},
+            '$inc': {'attempts': 1}
+        }, return_document=ReturnDocument.AFTER)
+        return doc['_id'] if doc else None
+
+    def complete_op(self, username):
+        """Returns the update marking username done, for queuing on a BulkWriter."""
+        now = datetime.utcnow()
+        return UpdateOne({'_id': username}, {'$set': {'status': DONE,
+            'finished': now, 'changed': now}, '$unset': {'lease_until': ''}})
+
+    def complete(self, username):
+        """Marks username done."""
+        self.db.usernames.bulk_write([self.complete_op(username)])
+
+    def fail(self, username, error):
+        """
+        Releases a username whose scrape failed, back to pending, or to
+        failed once it has used up its attempts.
+        """
+        doc = self.db.usernames.find_one({'_id': username}, {'attempts': 1})
+        attempts = doc.get('attempts', 0) if doc else 0
+        self.db.usernames.update_one({'_id': username}, {
+            '$set': {'status': FAILED if attempts >= self.max_attempts else PENDING,
+                'error': error, 'changed': datetime.utcnow()},
+            '$unset': {'lease_until': ''}
+        })
+
+    def reclaim_expired(self):
+        """
+        Puts usernames whose lease ran out back to pending, or to failed once
+        they've used up their attempts. Returns how many went back to pending.
+        """
+        now = datetime.utcnow()
+        expired = {'status': CLAIMED, 'lease_until': {'$lt': now}}
+        self.db.usernames.update_many(dict(expired, attempts={'$gte': self.max_attempts}),
+            {'$set': {'status': FAILED, 'error': 'lease expired', 'changed': now},
+                '$unset': {'lease_until': ''}})
+        return self.db.usernames.update_many(expired,
+            {'$set': {'status': PENDING, 'changed': now},
+                '$unset': {'lease_until': ''}}).modified_count
+
+    def counts(self):
+        """Returns the number of usernames in each status."""
+        counts = {PENDING: 0, CLAIMED: 0, DONE: 0, FAILED: 0}
+        for row in self.db.usernames.aggregate([
+                {'$group': {'_id': {'$ifNull': ['$status', PENDING]}, 'n': {'$sum': 1}}}]):
+            counts[row['_id']] = row['n']
+        return counts
+
+    def has_work(self):
+        """Whether anything is pending or still claimed."""
+        return self.db.usernames.count_documents({'$or': [
+            {'status': {'$exists': False}}, {'status': {'$in': [PENDING, CLAIMED]}}]},
+            limit=1) > 0
+
+
+class SharedRateLimiter:
+    """
+    Requests-per-minute ceiling shared by every process it's passed to.
+    Requests are spaced evenly, at most one per 60/rpm seconds across all
+    processes.
+    """
+
+    def __init__(self, rpm):
+        self.interval = 60.0 / rpm
+        self._next = mp.Value('d', 0.0)
+
+    def acquire(self):
+        """Blocks until this process may make a request."""
+        with self._next.get_lock():
+            now = time.time()
+            start = max(now, self._next.value)
+            self._next.value = start + self.interval
+        if start > now:
+            time.sleep(start - now)
+
+
+def _driver_alive(scraper):
+    try:
+        scraper.driver.title
+        return True
+    except WebDriverException:
+        return False
+
+
+def open_db(mongo_uri=None):
+    """
+    Connects to the database named in mongo_uri, or okc if it names none, on
+    the local mongod if mongo_uri is None.
+    """
+    if mongo_uri is None:
+        return MongoClient('localhost', 27017).okc
+    return MongoClient(mongo_uri).get_default_database('okc')
+
+
+def worker_main(alias, img_save_dir, limiter, stop, scraper_kwargs, queue_kwargs,
+        login=True, idle_wait=5, rescrape=False, mongo_uri=None):
+    """
+    Runs one Scraper in this process, scraping usernames claimed from the
+    work queue until stop is set. Exits with DRIVER_DIED if the driver stops
+    responding, so the pool can start a fresh one. With rescrape, users
+    already stored go through rescrape_user, and how much work that skipped
+    is printed when the worker exits. With mongo_uri, the scraper and the
+    queue use that database instead of okc on the local mongod.
+    """
+    from okc_scraper_controller import Scraper
+    if mongo_uri is not None:
+        #clients can't be handed to another process, so each worker opens its own
+        scraper_kwargs = dict(scraper_kwargs, db=open_db(mongo_uri))
+    scraper = Scraper(alias, rate_limiter=limiter, **scraper_kwargs)
+    queue = WorkQueue(scraper.db, **queue_kwargs)
+    worker = f'{alias}/{mp.current_process().pid}'
+    exit_code = 0
+    try:
+        if login:
+            scraper.login()
+        while not stop.is_set():
+            username = queue.claim(worker)
+            if username is None:
+                scraper.writer.flush()
+                stop.wait(idle_wait)
+                continue
+            try:
+                #usernames flush after users, and a user document that can never
+                #be written takes this with it, so it's only marked done once saved
+                with scraper.writer.unit():
+                    if rescrape:
+                        scraper.rescrape_user(img_save_dir, username, store=True)
+                    else:
+                        scraper.scrape_user(img_save_dir, username, store=True)
+                    scraper.writer.add('usernames', queue.complete_op(username))
+            except Exception as e:
+                scraper.writer.flush()
+                queue.fail(username, f'{type(e).__name__}: {e}')
+                if not _driver_alive(scraper):
+                    exit_code = DRIVER_DIED
+                    break
+    finally:
+        if rescrape:
+            print(f'{worker} rescrape: {scraper.rescrape_summary()}')
+        scraper.close()
+    return exit_code
+
+
+def _worker_entry(*args, **kwargs):
+    try:
+        code = worker_main(*args, **kwargs)
+    except Exception:
+        traceback.print_exc()
+        code = 1
+    raise SystemExit(code)
+
+
+class ScraperPool:
+    """
+    Runs one Scraper process per account alias, all pulling usernames from
+    the db.usernames work queue and sharing one requests-per-minute ceiling.
+    Workers that exit while there is still work, e.g. because their driver
+    died, are restarted.
+
+    Attributes:
+        aliases (list): account aliases, one worker each
+        stats (dict): restarts per alias
+    """
+
+    def __init__(self, aliases, img_save_dir, rpm=60, scraper_kwargs=None,
+            queue_kwargs=None, login=True, max_restarts=5, db=None, rescrape=False,
+            mongo_uri=None):
+        """
+        Constructor for the ScraperPool class
+
+        Parameters:
+            aliases (list): account aliases from okc_account_credentials, one worker each
+            img_save_dir (str): directory profile images are saved to
+            rpm (float): page loads per minute allowed across all workers
+            scraper_kwargs (dict): extra keyword arguments for each Scraper,
+                e.g. base_url or headless
+            queue_kwargs (dict): keyword arguments for each worker's WorkQueue
+            login (bool): whether workers log in before scraping
+            max_restarts (int): times a worker is restarted before being given up on
+            db (pymongo.database.Database): database the pool checks for work
+            rescrape (bool): re-scrape stored users with Scraper.rescrape_user,
+                skipping what hasn't changed
+            mongo_uri (str): mongodb uri of the database the pool and its
+                workers use, e.g. mongodb://localhost:27017/okc_bench,
+                instead of okc on the local mongod
+        """
+        self.aliases = list(aliases)
+        self.img_save_dir = img_save_dir
+        self.limiter = SharedRateLimiter(rpm)
+        self.scraper_kwargs = scraper_kwargs or dict()
+        self.queue_kwargs = queue_kwargs or dict()
+        self.login = login
+        self.max_restarts = max_restarts
+        self.rescrape = rescrape
+        self.mongo_uri = mongo_uri
+        self.queue = WorkQueue(db if db is not None else open_db(mongo_uri), **self.queue_kwargs)
+        self.stop = mp.Event()
+        self.procs = dict()
+        self.stats = {alias: 0 for alias in self.aliases}
+
+    def _start(self, alias):
+        proc = mp.Process(target=_worker_entry, name=f'scraper-{alias}', args=(alias,
+            self.img_save_dir, self.limiter, self.stop, self.scraper_kwargs,
+            self.queue_kwargs, self.login), kwargs={'rescrape': self.rescrape,
+            'mongo_uri': self.mongo_uri})
+        proc.start()
+        self.procs[alias] = proc
+
+    def run(self, poll=5):
+        """
+        Starts the workers and supervises them until the queue is drained or
+        every worker has used up its restarts.
+
+        Returns:
+            the queue's status counts at the end
+        """
+        for alias in self.aliases:
+            self._start(alias)
+        try:
+            while self.queue.has_work():
+                self.queue.reclaim_expired()
+                for alias, proc in list(self.procs.items()):
+                    if proc.is_alive():
+                        continue
+                    proc.join()
+                    if self.stats[alias] < self.max_restarts:
+                        self.stats[alias] += 1
+                        self._start(alias)
+                    else:
+                        del self.procs[alias]
+                if not self.procs:
+                    break
+                time.sleep(poll)
+        finally:
+            self.shutdown()
+        return self.queue.counts()
+
+    def shutdown(self, timeout=60):
+        """Asks every worker to stop after its current user, then waits for them."""
+        self.stop.set()
+        for proc in self.procs.values():
+            proc.join(timeout)
+            if proc.is_alive():
+                proc.terminate()
+
+
+if __name__=='__main__':
+    parser = argparse.ArgumentParser(description='Scrape db.usernames with several browsers')
+    parser.add_argument('img_save_dir')
+    parser.add_argument('--workers', type=int, default=None,
+        help='number of workers, one per alias in okc_account_credentials (default: all)')
+    parser.add_argument('--rpm', type=float, default=60)
+    parser.add_argument('--base-url', default='https://www.okcupid.com')
+    parser.add_argument('--no-login', action='store_true')
+    parser.add_argument('--compress-html', action='store_true',
+        help='store html compressed and deduplicated, see html_store')
+    parser.add_argument('--rescrape', action='store_true',
+        help='only redo the steps whose signals changed for users already stored')
+    parser.add_argument('--light-browser', action='store_true',
+        help="don't load images, media, fonts or ad hosts, see browser_profile")
+    parser.add_argument('--fetch', action='store_true',
+        help='fetch pages over HTTP where the html has the data, see fetch')
+    parser.add_argument('--mongo-uri', default=None,
+        help='mongodb uri of the database to use instead of okc on the local mongod')
+    args = parser.parse_args()
+
+    aliases = read_aliases()[:args.workers]
+    pool = ScraperPool(aliases, args.img_save_dir, args.rpm,
+        scraper_kwargs={'base_url': args.base_url, 'compress_html': args.compress_html,
+            'resource_policy': True if args.light_browser else None, 'fetch': args.fetch},
+        login=not args.no_login, rescrape=args.rescrape, mongo_uri=args.mongo_uri)
+    print(pool.run())
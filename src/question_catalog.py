@@ -0,0 +1,198 @@
+from pymongo import MongoClient, ASCENDING, ReturnDocument, UpdateOne
+from pymongo.errors import BulkWriteError
+from collections import namedtuple
+from lru import LRUCache
+import argparse, hashlib, json
+
+DUPLICATE_KEY = 11000
+
+#one answered question: catalog id, index of our answer (None if unknown),
+#bit i set if choice i is acceptable from a match, and the importance index.
+#stored in Mongo as a 4 element array.
+CompactAnswer = namedtuple('CompactAnswer', ['qid', 'answer', 'acceptable', 'importance'])
+
+
+def question_key(q_text, choices):
+    """Returns the key a question text and choice list is interned under."""
+    return hashlib.sha1(json.dumps([q_text, list(choices)]).encode()).hexdigest()
+
+
+def acceptable_mask(acceptable):
+    """Packs a list of acceptable flags into an int, bit i for choice i."""
+    mask = 0
+    for i, ok in enumerate(acceptable):
+        if ok:
+            mask |= 1 << i
+    return mask
+
+
+def acceptable_flags(mask, n):
+    """Unpacks acceptable_mask for a question with n choices."""
+    return [bool(mask >> i & 1) for i in range(n)]
+
+
+class QuestionCatalog:
+    """
+    Shared catalog giving every question text and choice list a stable
+    integer id, so answers can be stored as CompactAnswers instead of
+    repeating the text and choices everywhere.
+
+    Entries live in db.question_catalog as {_id: qid, key, q_text, choices},
+    unique on key (see question_key). Ids come from a counter in db.counters,
+    so every scraper and process shares them. Lookups in either direction go
+    through LRU caches and only reach Mongo on a miss.
+
+    Attributes:
+        db (pymongo.database.Database): okc database
+    """
+
+    def __init__(self, db, cache_size=50000):
+        """
+        Constructor for the QuestionCatalog class
+
+        Parameters:
+            db (pymongo.database.Database): okc database
+            cache_size (int): entries remembered in each direction
+        """
+        self.db = db
+        self._ids = LRUCache(cache_size)
+        self._entries = LRUCache(cache_size)
+        self.db.question_catalog.create_index([('key', ASCENDING)], unique=True)
+
+    def _remember(self, entry):
+        self._ids.put(entry['key'], entry['_id'])
+        self._entries.put(entry['_id'], (entry['q_text'], entry['choices']))
+        return entry
+
+    def _allocate(self, n):
+        """Reserves n consecutive ids and returns the first."""
+        counter = self.db.counters.find_one_and_update({'_id': 'question_catalog'},
+            {'$inc': {'seq': n}}, upsert=True, return_document=ReturnDocument.AFTER)
+        return counter['seq'] - n + 1
+
+    def intern_many(self, questions):
+        """
+        Returns the ids of (q_text, choices) pairs, in the same order, adding
+        the ones not in the catalog yet. Costs at most one lookup and one
+        insert round trip for the whole list.
+        """
+        keys = [question_key(q_text, choices) for q_text, choices in questions]
+        #kept here, since a list longer than the cache evicts its own first keys
+        ids, missing = dict(), dict()
+        for k, q in zip(keys, questions):
+            qid = self._ids.hit(k)
+            if qid is None:
+                missing[k] = q
+            else:
+                ids[k] = qid
+        if missing:
+            for entry in self.db.question_catalog.find({'key': {'$in': list(missing)}}):
+                ids[entry['key']] = self._remember(entry)['_id']
+                del missing[entry['key']]
+        if missing:
+            first = self._allocate(len(missing))
+            entries = [{'_id': first+i, 'key': k, 'q_text': q_text, 'choices': list(choices)}
+                for i, (k, (q_text, choices)) in enumerate(missing.items())]
+            try:
+                self.db.question_catalog.insert_many(entries, ordered=False)
+                inserted = entries
+            except BulkWriteError as e:
+                #another scraper interned some of these first; use its ids
+                if any(err['code'] != DUPLICATE_KEY for err in e.details['writeErrors']):
+                    raise
+                lost = {entries[err['index']]['key'] for err in e.details['writeErrors']}
+                inserted = [entry for entry in entries if entry['key'] not in lost]
+                for entry in self.db.question_catalog.find({'key': {'$in': list(lost)}}):
+                    ids[entry['key']] = self._remember(entry)['_id']
+            for entry in inserted:
+                ids[entry['key']] = self._remember(entry)['_id']
+        return [ids[k] for k in keys]
+
+    def intern(self, q_text, choices):
+        """Returns the id of a question text and choice list, adding it if new."""
+        return self.intern_many([(q_text, choices)])[0]
+
+    def lookup_many(self, qids):
+        """Returns (q_text, choices) for each id, in the same order."""
+        entries, missing = dict(), []
+        for qid in set(qids):
+            entry = self._entries.hit(qid)
+            if entry is None:
+                missing.append(qid)
+            else:
+                entries[qid] = entry
+        if missing:
+            for entry in self.db.question_catalog.find({'_id': {'$in': missing}}):
+                self._remember(entry)
+                entries[entry['_id']] = (entry['q_text'], entry['choices'])
+        try:
+            return [entries[qid] for qid in qids]
+        except KeyError as e:
+            raise KeyError(f'question {e.args[0]} is not in db.question_catalog') from None
+
+    def lookup(self, qid):
+        """Returns (q_text, choices) for a question id."""
+        return self.lookup_many([qid])[0]
+
+    def encode(self, question_data):
+        """Converts a list of question data dicts to CompactAnswers."""
+        qids = self.intern_many([(q['q_text'], q['choices']) for q in question_data])
+        return [CompactAnswer(qid, q['our_answer'], acceptable_mask(q['acceptable']),
+            q['importance']) for qid, q in zip(qids, question_data)]
+
+    def decode(self, answers):
+        """Converts CompactAnswers (or their stored arrays) back to question data dicts."""
+        answers = [CompactAnswer(*a) for a in answers]
+        entries = self.lookup_many([a.qid for a in answers])
+        return [{
+            'q_text': q_text,
+            'choices': list(choices),
+            'our_answer': a.answer,
+            'acceptable': acceptable_flags(a.acceptable, len(choices)),
+            'importance': a.importance
+        } for a, (q_text, choices) in zip(answers, entries)]
+
+
+def convert_versions(db, catalog=None, scraper=None, batch_size=100):
+    """
+    Rewrites the deltas of scraper version documents still holding question
+    data dicts as CompactAnswers.
+
+    Parameters:
+        db (pymongo.database.Database): okc database
+        catalog (QuestionCatalog): catalog to intern into, a new one if None
+        scraper (str): only convert this scraper's versions
+        batch_size (int): version documents rewritten per round trip
+
+    Returns:
+        number of version documents converted
+    """
+    catalog = catalog or QuestionCatalog(db)
+    query = {'format': {'$ne': 'compact'}}
+    if scraper is not None:
+        query['scraper'] = scraper
+    ops = []
+    count = 0
+    for doc in db.scraper_versions.find(query, {'delta': 1}):
+        ops.append(UpdateOne({'_id': doc['_id']}, {'$set': {
+            'delta': catalog.encode(doc['delta']),
+            'format': 'compact'
+        }}))
+        if len(ops) == batch_size:
+            db.scraper_versions.bulk_write(ops, ordered=False)
+            count += len(ops)
+            ops = []
+    if ops:
+        db.scraper_versions.bulk_write(ops, ordered=False)
+        count += len(ops)
+    return count
+
+
+if __name__=='__main__':
+    parser = argparse.ArgumentParser(description='Convert scraper versions to catalog ids')
+    parser.add_argument('--scraper', default=None, help='only convert this scraper')
+    args = parser.parse_args()
+
+    db = MongoClient('localhost', 27017).okc
+    print(f'converted {convert_versions(db, scraper=args.scraper)} version documents, '
+        f'catalog has {db.question_catalog.count_documents({})} questions')
@@ -1,26 +1,149 @@
-from okc_scraper_controller import Scraper
-import pandas as pd
+"""
+Command line entry point for the scraper.
+
+    python src/scrape.py collect [--limit N] [--resume]
+    python src/scrape.py scrape <img_save_dir> [--workers N] [--rescrape] ...
+    python src/scrape.py answer
+    python src/scrape.py export <out_dir> [--tables ...] [--full] [--images <dir> ...]
+
+Each subcommand imports only the modules it uses, so e.g. export never loads
+selenium and collect never loads pyarrow.
+"""
+import argparse
+
+
+def _start(args):
+    from okc_scraper_controller import Scraper
+    from metrics import Metrics
+    metrics = Metrics()
+    #rewritten as the run goes, for long crawls
+    metrics.start_exporter('metrics.prom')
+    scraper = Scraper(args.alias, metrics=metrics, resource_policy=args.light_browser or None)
+    how = scraper.start_session()
+    print(f'session started ({how})')
+    print('startup: ' + ', '.join(f'{phase} {seconds:.2f}s'
+        for phase, seconds in scraper.startup_timings.items()))
+    return scraper, metrics
+
+
+def _finish(scraper, metrics):
+    #stay logged in so the next run can reuse the session
+    scraper.close()
+    print('closed')
+    metrics.stop_exporter()
+    metrics.write_json('metrics.json')
+    print('metrics written to metrics.json and metrics.prom')
+
+
+def collect(args):
+    """Saves usernames from the match page to db.usernames."""
+    scraper, metrics = _start(args)
+    try:
+        usernames, exit_stat = scraper.collect_usernames(args.limit, save=True,
+            resume=args.resume)
+        print(f'collected {len(usernames)} usernames (exit status {exit_stat})')
+    finally:
+        _finish(scraper, metrics)
+
+
+def scrape(args):
+    """Scrapes the usernames in db.usernames with a pool of browsers."""
+    from pool import ScraperPool
+    from credentials import read_aliases
+    pool = ScraperPool(read_aliases()[:args.workers], args.img_save_dir, args.rpm,
+        scraper_kwargs={'compress_html': args.compress_html,
+            'resource_policy': args.light_browser or None, 'fetch': args.fetch},
+        rescrape=args.rescrape)
+    print(pool.run())
+
+
+def answer(args):
+    """Answers new questions on the scraper's profile and versions them."""
+    scraper, metrics = _start(args)
+    try:
+        recovered = scraper.recover_answers()
+        if recovered:
+            print(f'recovered {recovered} answers from an earlier run')
+
+        qd = scraper.get_scraper_question_data()
+        print('retrieved inital question data')
+        scraper.add_questions_update_version(qd)
+        print('version added')
+
+        qd, exit_stat = scraper.answer_all_questions()
+        print(exit_stat)
+        scraper.add_questions_update_version(qd)
+        print('version updated')
+    finally:
+        _finish(scraper, metrics)
+
+
+def export(args):
+    """Exports the database to Parquet."""
+    from export import Exporter, TABLES
+    from pymongo import MongoClient
+    exporter = Exporter(MongoClient('localhost', 27017).okc, args.out_dir, args.batch_size,
+        args.html, args.images, args.settle)
+    for table, (rows, seconds) in exporter.run(args.tables or TABLES, not args.full).items():
+        print(f'{table:10s} {rows:9d} rows {seconds:7.1f}s {rows/max(seconds, 1e-9):9.0f} rows/s')
+
+
+COMMANDS = {'collect': collect, 'scrape': scrape, 'answer': answer, 'export': export}
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description='Scrape OkCupid')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    browser = argparse.ArgumentParser(add_help=False)
+    browser.add_argument('--light-browser', action='store_true',
+        help="don't load images, media, fonts or ad hosts, see browser_profile")
+    account = argparse.ArgumentParser(add_help=False, parents=[browser])
+    account.add_argument('--alias', default=None,
+        help='account from okc_account_credentials (default: the first)')
+
+    p = commands.add_parser('collect', parents=[account], help=collect.__doc__)
+    p.add_argument('--limit', type=float, default=float('inf'),
+        help='stop after about this many usernames')
+    p.add_argument('--resume', action='store_true',
+        help='skip the cards an unfinished earlier crawl already saved')
+
+    p = commands.add_parser('scrape', parents=[browser], help=scrape.__doc__)
+    p.add_argument('img_save_dir')
+    p.add_argument('--workers', type=int, default=None,
+        help='number of workers, one per alias in okc_account_credentials (default: all)')
+    p.add_argument('--rpm', type=float, default=60)
+    p.add_argument('--compress-html', action='store_true',
+        help='store html compressed and deduplicated, see html_store')
+    p.add_argument('--rescrape', action='store_true',
+        help='only redo the steps whose signals changed for users already stored')
+    p.add_argument('--fetch', action='store_true',
+        help='fetch pages over HTTP where the html has the data, see fetch')
+
+    commands.add_parser('answer', parents=[account], help=answer.__doc__)
+
+    p = commands.add_parser('export', help=export.__doc__)
+    p.add_argument('out_dir')
+    p.add_argument('--tables', nargs='+', default=None,
+        help='tables to export (default: all)')
+    p.add_argument('--full', action='store_true',
+        help='export everything, not just what changed since the last run')
+    p.add_argument('--batch-size', type=int, default=5000)
+    p.add_argument('--html', action='store_true', help='include raw profile html')
+    p.add_argument('--images', nargs='*', default=[],
+        help='image save directories whose manifests to export')
+    p.add_argument('--settle', type=float, default=600,
+        help='seconds queued writes get to land before they are exported, 0 once scrapers are done')
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    if getattr(args, 'alias', 'unused') is None:
+        from credentials import read_aliases
+        args.alias = read_aliases()[0]
+    COMMANDS[args.command](args)
+
 
 if __name__=='__main__':
-    scrapername = pd.read_csv('src/okc_account_credentials', index_col=0).iloc[0].name
-
-    scraper = Scraper(scrapername)
-    scraper.login()
-    print('login successful')
-    
-    qd = scraper.get_scraper_question_data()
-    print('retrieved inital question data')
-    
-    #scraper.set_first_version(qd)
-    #print('set first version')
-    scraper.add_questions_update_version(qd)
-    print('version added')
-
-    qd, exit_stat = scraper.answer_all_questions()
-    print(exit_stat)
-    
-    scraper.add_questions_update_version(qd)
-    print('version updated')
-
-    scraper.logout()
-    print('logged out')
+    main()
@@ -0,0 +1,83 @@
+from selenium.common.exceptions import WebDriverException
+from datetime import datetime
+import json, os
+
+DEFAULT_SESSION_DIR = 'src/sessions'
+
+
+class SessionStore:
+    """
+    Saves a logged-in scraper's cookies and local storage per alias, so a new
+    driver can be put back into the same session without going through the
+    login form.
+
+    Sessions are stored as <session_dir>/<alias>.json. They hold credentials
+    in effect, so keep the directory out of version control.
+
+    Attributes:
+        session_dir (str): directory session files are kept in
+    """
+
+    def __init__(self, session_dir=DEFAULT_SESSION_DIR):
+        self.session_dir = session_dir
+
+    def path(self, alias):
+        return os.path.join(self.session_dir, f'{alias}.json')
+
+    def save(self, scraper):
+        """Saves the scraper's current cookies and local storage."""
+        os.makedirs(self.session_dir, exist_ok=True)
+        session = {
+            'base_url': scraper.base_url,
+            'saved': datetime.now().isoformat(),
+            'cookies': scraper.driver.get_cookies(),
+            'local_storage': scraper.driver.execute_script(
+                'return Object.assign({}, window.localStorage);')
+        }
+        tmp = self.path(scraper.name) + '.tmp'
+        with open(tmp, 'w') as f:
+            json.dump(session, f)
+        os.replace(tmp, self.path(scraper.name))
+
+    def load(self, alias):
+        """Returns the saved session for alias, or None if there isn't one."""
+        try:
+            with open(self.path(alias)) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def restore(self, scraper, landing_path='/robots.txt'):
+        """
+        Puts the saved session into the scraper's driver. Cookies can only be
+        set for the site the driver is on, so a cheap page of the site is
+        loaded first.
+
+        Parameters:
+            scraper (Scraper): scraper to restore the session into
+            landing_path (str): light page to load before setting cookies
+
+        Returns:
+            True if a saved session was restored, False if there was none
+        """
+        session = self.load(scraper.name)
+        if session is None or session.get('base_url') != scraper.base_url:
+            return False
+        scraper.get_page(landing_path)
+        for cookie in session['cookies']:
+            if 'expiry' in cookie:
+                cookie['expiry'] = int(cookie['expiry'])
+            try:
+                scraper.driver.add_cookie(cookie)
+            except WebDriverException:
+                #e.g. a cookie for another subdomain; the rest still count
+                pass
+        scraper.driver.execute_script(
+            'for (var k in arguments[0]) window.localStorage.setItem(k, arguments[0][k]);',
+            session['local_storage'] or {})
+        return True
+
+    def clear(self, alias):
+        """Deletes the saved session for alias."""
+        if os.path.exists(self.path(alias)):
+            os.remove(self.path(alias))
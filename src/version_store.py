@@ -0,0 +1,273 @@
+from pymongo import ASCENDING, UpdateOne
+from question_catalog import QuestionCatalog, CompactAnswer
+from datetime import datetime
+
+
+def merge_question_data(prev_qd, new_qd):
+    """
+    Returns a complete question-data-list that is the union of the
+    two lists, where old versions of the same questions are replaced with new
+    versions.
+    """
+    ret_dict = {q['q_text']: q for q in new_qd}
+    for question in prev_qd:
+        ret_dict.setdefault(question['q_text'], question)
+    return list(ret_dict.values())
+
+
+class VersionStore:
+    """
+    Stores a scraper's question data versions as one small document per
+    version holding only the questions that changed since its parent, in
+    db.scraper_versions. db.scrapers keeps just the current version id, so
+    adding a version costs O(changed questions) no matter how long the
+    history is.
+
+    Version documents look like
+        {_id: '<scraper>/<version>', scraper, version, parent, delta, time}
+    With a QuestionCatalog, deltas are written as CompactAnswers and the
+    document gets format: 'compact'. Chains mixing both formats read fine.
+
+    Attributes:
+        db (pymongo.database.Database): okc database
+        name (str): alias of the scraper whose versions are stored
+        current_version (str): id of the latest version, None if there are none yet
+        writer (BulkWriter): if set, version writes are queued on it instead
+            of written immediately
+        catalog (QuestionCatalog): if set, versions are stored and merged by
+            question id
+    """
+
+    def __init__(self, db, name, writer=None, catalog=None):
+        """
+        Constructor for the VersionStore class. Migrates the scraper's old
+        single-document versions map if it still has one.
+
+        Parameters:
+            db (pymongo.database.Database): okc database
+            name (str): alias of the scraper whose versions are stored
+            writer (BulkWriter): optional write-behind buffer for new versions
+            catalog (QuestionCatalog): store new versions as CompactAnswers
+        """
+        self.db = db
+        self.name = name
+        self.writer = writer
+        self.catalog = catalog
+        self._reader = catalog
+        self._current = None
+        self._compact = None
+        self._qid_by_text = None
+        self.db.scraper_versions.create_index([('scraper', ASCENDING)])
+
+        record = self.db.scrapers.find_one({'_id': name})
+        if record is not None and 'versions' in record:
+            self.migrate_legacy(record)
+            record = self.db.scrapers.find_one({'_id': name})
+        self.current_version = record['current_version'] if record else None
+
+    def _doc_id(self, version):
+        return f'{self.name}/{version}'
+
+    def _new_version_id(self):
+        #microseconds so two versions made in the same second don't collide
+        return datetime.now().strftime('%Y%m%d_%H%M%S_%f')
+
+    def _insert(self, version, parent, delta):
+        doc = {
+            '_id': self._doc_id(version),
+            'scraper': self.name,
+            'version': version,
+            'parent': parent,
+            'delta': delta,
+            'time': datetime.now()
+        }
+        if self.catalog is not None:
+            doc['format'] = 'compact'
+        pointer = ({'_id': self.name}, {'$set': {'current_version': version}})
+        if self.writer is not None:
+            #flushed in this order, so the version lands before the pointer to it,
+            #and one unit, so the pointer is dropped if the version never lands
+            with self.writer.unit():
+                self.writer.add_version(doc)
+                self.writer.add('scrapers', UpdateOne(*pointer, upsert=True))
+        else:
+            self.db.scraper_versions.insert_one(doc)
+            self.db.scrapers.update_one(*pointer, upsert=True)
+        self.current_version = version
+
+    def set_first_version(self, question_data):
+        """
+        Stores question_data as the scraper's first version.
+
+        Returns:
+            the new version id
+        """
+        version = self._new_version_id()
+        if self.catalog is not None:
+            answers = self.catalog.encode(question_data)
+            self._insert(version, None, answers)
+            self._compact = {a.qid: a for a in answers}
+            self._qid_by_text = {q['q_text']: a.qid for q, a in zip(question_data, answers)}
+            self._current = None
+            return version
+        self._insert(version, None, list(question_data))
+        self._current = {q['q_text']: q for q in question_data}
+        return version
+
+    def add_version(self, new_question_data):
+        """
+        Adds a version that is the current one with new_question_data merged
+        in. Only questions that are new or changed are written.
+
+        Returns:
+            the new version id
+        """
+        if self.current_version is None:
+            return self.set_first_version(new_question_data)
+        if self.catalog is not None:
+            current = self.current_answers()
+            answers = self.catalog.encode(new_question_data)
+            delta = [a for a in answers if current.get(a.qid) != a]
+            version = self._new_version_id()
+            self._insert(version, self.current_version, delta)
+            for q, a in zip(new_question_data, answers):
+                old = self._qid_by_text.get(q['q_text'])
+                if old is not None and old != a.qid:
+                    #its choices changed, which gave it a new id
+                    del current[old]
+                self._qid_by_text[q['q_text']] = a.qid
+            current.update((a.qid, a) for a in delta)
+            self._current = None
+            return version
+        current = self.current_questions_by_text()
+        delta = [q for q in new_question_data if current.get(q['q_text']) != q]
+        version = self._new_version_id()
+        self._insert(version, self.current_version, delta)
+        current.update((q['q_text'], q) for q in delta)
+        return version
+
+    def current_questions_by_text(self):
+        """
+        Returns the current version's questions as a dict of q_text -> question
+        data. Cached after the first call, so only rebuilt once per store.
+        """
+        if self._current is None:
+            if self.catalog is not None:
+                questions = self.catalog.decode(self.current_answers().values())
+            else:
+                questions = self.rebuild(self.current_version) if self.current_version else []
+            self._current = {q['q_text']: q for q in questions}
+        return self._current
+
+    def current_answers(self):
+        """
+        Returns the current version as a dict of question id -> CompactAnswer.
+        Cached after the first call.
+        """
+        if self._compact is None:
+            merged = self._merge_by_text(self._chain(self.current_version))\
+                if self.current_version else {}
+            self._compact = {a.qid: a for a in merged.values()}
+            self._qid_by_text = {q_text: a.qid for q_text, a in merged.items()}
+        return self._compact
+
+    def current_questions(self):
+        """Returns the current version's full question data list."""
+        return list(self.current_questions_by_text().values())
+
+    def rebuild(self, version):
+        """
+        Rebuilds the full question data list of any version by merging the
+        deltas along its parent chain, newest first, as
+        merge_question_data would.
+
+        Parameters:
+            version (str): version id
+
+        Returns:
+            list of question data dicts
+        """
+        chain = self._chain(version)
+        if self.catalog is not None or any(d.get('format') == 'compact' for d in chain):
+            return self._catalog().decode(self._merge_answers(chain))
+        merged = dict()
+        for doc in chain:
+            for q in doc['delta']:
+                merged.setdefault(q['q_text'], q)
+        return list(merged.values())
+
+    def rebuild_answers(self, version):
+        """
+        Same as rebuild, but returns CompactAnswers. Deltas stored as
+        question data dicts are interned on the way.
+        """
+        return self._merge_answers(self._chain(version))
+
+    def _catalog(self):
+        if self._reader is None:
+            self._reader = QuestionCatalog(self.db)
+        return self._reader
+
+    def _chain(self, version):
+        """Returns the version documents from version back to the first one."""
+        if self.writer is not None:
+            self.writer.flush()
+        docs = {d['version']: d for d in self.db.scraper_versions.find(
+            {'scraper': self.name}, {'parent': 1, 'delta': 1, 'version': 1, 'format': 1})}
+        if version not in docs:
+            raise KeyError(f'{self.name} has no version {version}')
+        chain = []
+        while version is not None:
+            chain.append(docs[version])
+            version = docs[version]['parent']
+        return chain
+
+    def _merge_answers(self, chain):
+        return list(self._merge_by_text(chain).values())
+
+    def _merge_by_text(self, chain):
+        """
+        Merges a chain's deltas newest first into a dict of q_text ->
+        CompactAnswer. Goes by text like merge_question_data, since a
+        question whose choices changed has a new id for the same text.
+        """
+        deltas = [[CompactAnswer(*a) for a in doc['delta']] if doc.get('format') == 'compact'
+            else self._catalog().encode(doc['delta']) for doc in chain]
+        qids = list({a.qid for delta in deltas for a in delta})
+        texts = {qid: q_text for qid, (q_text, _) in zip(qids, self._catalog().lookup_many(qids))}
+        merged = dict()
+        for delta in deltas:
+            for a in delta:
+                merged.setdefault(texts[a.qid], a)
+        return merged
+
+    def history(self):
+        """Returns the scraper's version ids, oldest first."""
+        if self.writer is not None:
+            self.writer.flush()
+        return [d['version'] for d in self.db.scraper_versions.find(
+            {'scraper': self.name}, {'version': 1}).sort('version', ASCENDING)]
+
+    def migrate_legacy(self, record):
+        """
+        Converts a db.scrapers record holding the whole versions map into one
+        delta document per version, then drops the map from the record.
+
+        Parameters:
+            record (dict): the scraper's db.scrapers document
+        """
+        parent, prev = None, {}
+        for version in sorted(record['versions']):
+            qd = record['versions'][version]
+            delta = [q for q in qd if prev.get(q['q_text']) != q]
+            self.db.scraper_versions.replace_one({'_id': self._doc_id(version)}, {
+                '_id': self._doc_id(version),
+                'scraper': self.name,
+                'version': version,
+                'parent': parent,
+                'delta': delta,
+                'time': None
+            }, upsert=True)
+            prev = {q['q_text']: q for q in merge_question_data(list(prev.values()), qd)}
+            parent = version
+        self.db.scrapers.update_one({'_id': self.name}, {'$unset': {'versions': ''}})
@@ -0,0 +1,223 @@
+from selenium.common.exceptions import NoSuchElementException,\
+     StaleElementReferenceException, TimeoutException
+from collections import deque, namedtuple
+import time
+
+WaitRecord = namedtuple('WaitRecord', ['label', 'seconds', 'ok'])
+
+
+class Waiter:
+    """
+    Polls a WebDriver until a condition holds instead of sleeping for a fixed
+    amount of time, and records how long every wait actually took.
+
+    A condition is any callable taking the driver and returning a truthy value
+    once it is satisfied. That value is handed back to the caller, so a
+    condition that finds an element returns the element. Missing and stale
+    elements count as "not yet".
+
+    Attributes:
+        driver (WebDriver): driver the conditions are evaluated against
+        timeout (float): default number of seconds to wait before giving up
+        poll (float): default number of seconds between checks
+        history (deque): most recent WaitRecords, oldest first
+        totals (dict): label -> [count, total seconds, max seconds, timeouts]
+        metrics (Metrics): optional, also gets every wait's duration and timeouts
+    """
+
+    def __init__(self, driver, timeout=10, poll=0.1, history_size=1000, metrics=None):
+        """
+        Constructor for the Waiter class
+
+        Parameters:
+            driver (WebDriver): driver the conditions are evaluated against
+            timeout (float): default number of seconds before giving up
+            poll (float): default number of seconds between checks
+            history_size (int): number of individual waits to remember
+            metrics (Metrics): optional, also gets every wait's duration and timeouts
+        """
+        self.driver = driver
+        self.timeout = timeout
+        self.poll = poll
+        self.history = deque(maxlen=history_size)
+        self.totals = dict()
+        self.metrics = metrics
+
+    def until(self, condition, label='wait', timeout=None, poll=None):
+        """
+        Blocks until condition(driver) is truthy and returns its value.
+
+        Parameters:
+            condition (callable): takes the driver, returns a truthy value when satisfied
+            label (str): name the wait is recorded under
+            timeout (float): overrides the default timeout
+            poll (float): overrides the default polling interval
+
+        Returns:
+            the truthy value returned by the condition
+
+        Raises:
+            TimeoutException: if the condition did not hold before the timeout
+        """
+        timeout = self.timeout if timeout is None else timeout
+        poll = self.poll if poll is None else poll
+        start = time.monotonic()
+        deadline = start + timeout
+        while True:
+            try:
+                value = condition(self.driver)
+                if value:
+                    self._record(label, time.monotonic() - start, True)
+                    return value
+            except (NoSuchElementException, StaleElementReferenceException):
+                pass
+            if time.monotonic() >= deadline:
+                self._record(label, time.monotonic() - start, False)
+                raise TimeoutException(f'{label}: condition not met after {timeout}s')
+            time.sleep(poll)
+
+    def until_or_none(self, condition, label='wait', timeout=None, poll=None):
+        """
+        Same as until, but returns None on timeout instead of raising.
+        Used where running out of time is an expected outcome, such as
+        checking whether more content will load.
+        """
+        try:
+            return self.until(condition, label, timeout, poll)
+        except TimeoutException:
+            return None
+
+    def _record(self, label, seconds, ok):
+        self.history.append(WaitRecord(label, seconds, ok))
+        tot = self.totals.setdefault(label, [0, 0.0, 0.0, 0])
+        tot[0] += 1
+        tot[1] += seconds
+        tot[2] = max(tot[2], seconds)
+        if not ok:
+            tot[3] += 1
+        if self.metrics is not None:
+            self.metrics.observe('wait_seconds', seconds, label=label)
+            if not ok:
+                self.metrics.inc('wait_timeouts', label=label)
+
+    def summary(self):
+        """
+        Returns a dict of label -> {count, total, mean, max, timeouts} over
+        every wait made so far.
+        """
+        return {label: {
+            'count': count,
+            'total': total,
+            'mean': total / count,
+            'max': longest,
+            'timeouts': timeouts
+        } for label, (count, total, longest, timeouts) in self.totals.items()}
+
+    def total_seconds(self):
+        """Returns the total time spent waiting, in seconds."""
+        return sum(tot[1] for tot in self.totals.values())
+
+
+#condition factories. each returns a callable taking the driver.
+
+def element_present(class_name):
+    """Satisfied by the first element with the class; returns it."""
+    return lambda driver: driver.find_element_by_class_name(class_name)
+
+
+def element_clickable(class_name):
+    """Satisfied once an element with the class is displayed and enabled; returns it."""
+    def condition(driver):
+        el = driver.find_element_by_class_name(class_name)
+        return el if el.is_displayed() and el.is_enabled() else None
+    return condition
+
+
+def any_present(*locators):
+    """
+    Satisfied once any of the (kind, value) locators matches, where kind is
+    'class', 'name' or 'id'. Returns (locator, element).
+    """
+    finders = {
+        'class': lambda d, v: d.find_elements_by_class_name(v),
+        'name': lambda d, v: d.find_elements_by_name(v),
+        'id': lambda d, v: d.find_elements_by_id(v)
+    }
+    def condition(driver):
+        for kind, value in locators:
+            found = finders[kind](driver, value)
+            if found:
+                return ((kind, value), found[0])
+        return None
+    return condition
+
+
+def element_absent(class_name):
+    """Satisfied once no element has the class, e.g. an overlay has closed."""
+    return lambda driver: len(driver.find_elements_by_class_name(class_name)) == 0
+
+
+def count_reached(class_name, n):
+    """Satisfied once at least n elements have the class; returns them."""
+    def condition(driver):
+        found = driver.find_elements_by_class_name(class_name)
+        return found if len(found) >= n else None
+    return condition
+
+
+def staleness_of(element):
+    """Satisfied once the element has been removed from the page."""
+    def condition(driver):
+        try:
+            element.is_enabled()
+            return False
+        except StaleElementReferenceException:
+            return True
+    return condition
+
+
+def filter_counts():
+    """
+    Satisfied once the question filter counters have rendered. Returns a dict
+    of filter label -> count.
+    """
+    def condition(driver):
+        arr = driver.find_element_by_class_name('profile-questions-filters')\
+            .text.split('\n')
+        counts = {}
+        for label, value in zip(arr, arr[1:]):
+            if value.strip().isdigit():
+                counts[label] = int(value)
+        return counts or None
+    return condition
+
+
+def filter_count_changed(filterstr, previous):
+    """
+    Satisfied once the counter for filterstr shows something other than
+    previous; returns the new count.
+    """
+    counts = filter_counts()
+    def condition(driver):
+        count = (counts(driver) or {}).get(filterstr)
+        if count is None or count == previous:
+            return None
+        #0 is a valid new count but falsy, so hand back a tuple
+        return (count,)
+    return condition
+
+
+def text_changed(class_name, previous):
+    """
+    Satisfied once the first element with the class has text other than
+    previous, or is gone altogether.
+    """
+    def condition(driver):
+        found = driver.find_elements_by_class_name(class_name)
+        return not found or found[0].text != previous
+    return condition
+
+
+def url_changed(previous):
+    """Satisfied once the driver has navigated away from previous."""
+    return lambda driver: driver.current_url != previous